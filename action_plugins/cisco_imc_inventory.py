@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+from ansible.errors import AnsibleActionFail
+from ansible.plugins.action import ActionBase
+
+# host variables a server's address and credentials are taken from, first
+# one set wins
+HOST_VARS = {
+    'ip': ('imc_ip', 'ansible_host'),
+    'username': ('imc_username', 'username'),
+    'password': ('imc_password', 'password'),
+    'port': ('imc_port',),
+    'secure': ('imc_secure',),
+    'proxy': ('imc_proxy',),
+}
+
+
+class ActionModule(ActionBase):
+    '''
+    Expands the group option of cisco_imc_inventory into the hosts list of
+    the module, one entry per host of the group built from its variables,
+    so a single task collects the whole group concurrently. The passwords
+    go into the no_log host_passwords instead, by host name.
+    '''
+
+    TRANSFERS_FILES = False
+
+    def _host_entry(self, name, host_vars):
+        entry = dict(name=name)
+        for param, variables in HOST_VARS.items():
+            for variable in variables:
+                if host_vars.get(variable) is not None:
+                    entry[param] = self._templar.template(host_vars[variable])
+                    break
+        entry.setdefault('ip', name)
+        return entry
+
+    def run(self, tmp=None, task_vars=None):
+        task_vars = task_vars or dict()
+        result = super(ActionModule, self).run(tmp, task_vars)
+        module_args = self._task.args.copy()
+
+        group = module_args.pop('group', None)
+        if group is not None:
+            if module_args.get('hosts') or module_args.get('ip'):
+                raise AnsibleActionFail("group is mutually exclusive with "
+                                        "hosts and ip")
+            names = task_vars.get('groups', {}).get(group)
+            if names is None:
+                raise AnsibleActionFail("no inventory group %s" % group)
+            host_vars = task_vars.get('hostvars', {})
+            hosts = [self._host_entry(name, host_vars[name]) for name in names]
+            passwords = dict((host['name'], host.pop('password'))
+                             for host in hosts if 'password' in host)
+            if passwords:
+                module_args['host_passwords'] = dict(
+                    module_args.get('host_passwords') or {}, **passwords)
+            module_args['hosts'] = hosts
+
+        result.update(self._execute_module(module_name='cisco_imc_inventory',
+                                           module_args=module_args,
+                                           task_vars=task_vars, tmp=tmp))
+        return result
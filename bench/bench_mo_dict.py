@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+'''
+Measures how fast managed objects are turned into dicts, the per object
+prop_map walk imc_query used to do against the cached accessors of
+cisco_imc_query.mo_to_dict, on MOs parsed from the simulator snapshot.
+
+    python bench/bench_mo_dict.py --count 100000 --repeat 3
+
+Needs imcsdk.
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import imc_simulator
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO, "utils"))
+
+from cisco_imc_query import mo_to_dict  # noqa: E402
+
+# classes a server has many of
+CLASSES = ("storageLocalDisk", "memoryUnit", "adaptorHostEthIf",
+           "processorUnit", "equipmentPsu")
+
+PROJECTION = ("dn", "id", "model", "serial", "pdStatus")
+
+
+def make_mos(count, snapshots=None):
+    '''
+    Returns count MOs of CLASSES, parsed by imcsdk from configResolveClass
+    responses built out of the snapshot objects.
+    '''
+    import xml.etree.ElementTree as ET
+    from imcsdk.imcxmlcodec import from_xml_str
+
+    tree = imc_simulator.load_snapshots(snapshots)
+    templates = [tree.mos[dn] for class_id in CLASSES
+                 for dn in tree.by_class(class_id)]
+    mos = []
+    while len(mos) < count:
+        response = ET.Element("configResolveClass",
+                              {"cookie": "", "response": "yes",
+                               "classId": "storageLocalDisk"})
+        out = ET.SubElement(response, "outConfigs")
+        for index in range(min(10000, count - len(mos))):
+            tag, attrs = templates[index % len(templates)]
+            attrs = dict(attrs, dn="%s-%d" % (attrs["dn"], len(mos) + index))
+            ET.SubElement(out, tag, attrs)
+        response = ET.tostring(response).decode("utf-8")
+        mos.extend(from_xml_str(response).out_configs.child)
+    return mos
+
+
+def prop_map_walk(imc_mo, properties=None):
+    obj_dict = {}
+    for xml_property, mo_property in imc_mo.prop_map['classic'].items():
+        if properties is None or mo_property in properties or \
+                xml_property in properties:
+            obj_dict[mo_property] = getattr(imc_mo, mo_property)
+    return obj_dict
+
+
+def measure(convert, mos, properties, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        for mo in mos:
+            convert(mo, properties)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MO to dict throughput")
+    parser.add_argument("--count", type=int, default=100000,
+                        help="number of managed objects")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs per case, the fastest one counts")
+    parser.add_argument("--snapshot", action="append", dest="snapshots",
+                        help="snapshot the objects are copied from")
+    parser.add_argument("--json", action="store_true",
+                        help="print the results as JSON")
+    args = parser.parse_args()
+
+    mos = make_mos(args.count, args.snapshots)
+    projection = frozenset(PROJECTION)
+    results = []
+    for case, properties in (("all properties", None),
+                             ("projection", projection)):
+        for name, convert in (("prop_map walk", prop_map_walk),
+                              ("mo_to_dict", mo_to_dict)):
+            elapsed = measure(convert, mos, properties, args.repeat)
+            results.append(dict(case=case, implementation=name,
+                                mos=len(mos), seconds=round(elapsed, 4),
+                                mos_per_second=int(len(mos) / elapsed)))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        print("%-16s %-14s %8d MOs %8.3fs %10d MOs/s"
+              % (result["case"], result["implementation"], result["mos"],
+                 result["seconds"], result["mos_per_second"]))
+
+
+if __name__ == '__main__':
+    main()
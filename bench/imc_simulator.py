@@ -0,0 +1,877 @@
+#!/usr/bin/env python
+'''
+Offline stand-in for the Cisco IMC XML API.
+
+Serves enough of the XML API for the modules in this repository
+(aaaLogin/aaaLogout/aaaRefresh/aaaKeepAlive, configResolveDn/Class/Children
+and configConfMo/configConfMos) from an in-memory MO tree seeded from
+snapshot files. Every port is a separate simulated server, so
+
+    python bench/imc_simulator.py --port 8001 --count 50 --latency 0.05
+
+emulates a fleet of 50 servers on 127.0.0.1:8001-8050 that modules reach
+with port=8001 ... secure=false. GET /stats on any port returns the request
+counters of that server, GET /stats/all the ones of every server, and
+?reset=1 clears them.
+
+Admin actions are only stored, the simulator does not reproduce their
+side effects, except for virtual drives and power: triggering a
+storageVirtualDriveCreatorUsingUnusedPhysicalDrive creates the drive from
+unconfigured good disks, deleting one frees its disks again and the
+set-boot-drive action moves the boot drive. --drives fills the controller
+with that many disks, --init-seconds runs a background initialization of
+that length, a storageOperation, on every new RAID 5, 6, 50 and 60 drive.
+The adminPower actions change the operPower of the server after
+--power-seconds, and eventSubscribe streams these changes the way the IMC
+event channel does, unless --no-events.
+'''
+
+import argparse
+import copy
+import itertools
+import json
+import os
+import random
+import re
+import ssl
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from queue import Empty, Queue
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from Queue import Empty, Queue
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+
+DEFAULT_SNAPSHOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "snapshots", "rack_server.xml")
+
+# errorCodes of the CIMC XML API
+ERR_AUTH_FAILED = "551"
+ERR_AUTH_REQUIRED = "552"
+ERR_SESSION_LIMIT = "572"
+ERR_INJECTED = "1"
+ERR_UNKNOWN_METHOD = "103"
+ERR_BAD_FILTER = "102"
+ERR_CONFIG = "3"
+
+UNUSED_DISK = "Unconfigured Good"
+
+# RAID levels initialized in the background after creation
+BACKGROUND_INIT_LEVELS = ("5", "6", "50", "60")
+
+SESSION_METHODS = ("aaaLogin", "aaaLogout", "aaaRefresh", "aaaKeepAlive")
+
+# classes with adminPower and the operPower each action ends in, a cycle
+# passes through off
+POWER_CLASSES = ("computeRackUnit", "computeServerNode")
+POWER_ACTIONS = {"up": ["on"], "down": ["off"], "soft-shut-down": ["off"],
+                 "cycle-immediate": ["off", "on"]}
+
+
+class MoTree(object):
+    '''
+    Managed objects keyed by dn, in load order, with their parent links.
+    '''
+
+    def __init__(self):
+        self.mos = OrderedDict()
+        self.parents = {}
+        self.children = {}
+
+    def load(self, elem, parent_dn=None):
+        dn = elem.attrib.get("dn")
+        if dn is None and parent_dn is not None and "rn" in elem.attrib:
+            dn = parent_dn + "/" + elem.attrib["rn"]
+        if dn is None:
+            # wrapper element (snapshot, outConfig, a whole response)
+            for child in elem:
+                self.load(child, parent_dn)
+            return
+        attrs = dict(elem.attrib)
+        attrs.pop("rn", None)
+        attrs.pop("status", None)
+        self.set(elem.tag, dn, attrs)
+        for child in elem:
+            self.load(child, dn)
+
+    def load_file(self, path):
+        self.load(ET.parse(path).getroot())
+
+    def _parent_of(self, dn):
+        parts = dn.split("/")
+        while len(parts) > 1:
+            parts.pop()
+            candidate = "/".join(parts)
+            if candidate in self.mos:
+                return candidate
+        return None
+
+    def set(self, tag, dn, attrs):
+        if dn in self.mos:
+            self.mos[dn][1].update(attrs)
+            return
+        attrs["dn"] = dn
+        self.mos[dn] = (tag, attrs)
+        parent = self._parent_of(dn)
+        self.parents[dn] = parent
+        self.children.setdefault(parent, []).append(dn)
+        # objects configured before their parent move below it
+        for orphan in list(self.children.get(parent, [])):
+            if orphan != dn and orphan.startswith(dn + "/") and \
+                    self._parent_of(orphan) == dn:
+                self.children[self.parents[orphan]].remove(orphan)
+                self.parents[orphan] = dn
+                self.children.setdefault(dn, []).append(orphan)
+
+    def remove(self, dn):
+        if dn not in self.mos:
+            return False
+        for child in list(self.children.get(dn, [])):
+            self.remove(child)
+        del self.mos[dn]
+        self.children.pop(dn, None)
+        self.children[self.parents.pop(dn)].remove(dn)
+        return True
+
+    def element(self, dn, hierarchical=False):
+        tag, attrs = self.mos[dn]
+        elem = ET.Element(tag, attrs)
+        if hierarchical:
+            for child in self.children.get(dn, []):
+                elem.append(self.element(child, True))
+        return elem
+
+    def by_class(self, class_id):
+        class_id = class_id.lower()
+        return [dn for dn, (tag, attrs) in self.mos.items()
+                if tag.lower() == class_id]
+
+
+class SimulatedImc(object):
+    '''
+    One simulated server: its MO tree, sessions, knobs and counters.
+    '''
+
+    def __init__(self, port, tree, username="admin", password="password",
+                 latency=0.0, jitter=0.0, login_latency=0.0,
+                 max_sessions=0, max_concurrent=0, refresh_period=600,
+                 error_rate=0.0, fail_methods=None, filters=True,
+                 init_seconds=0.0, power_seconds=0.0, events=True,
+                 seed=None):
+        self.port = port
+        self.tree = tree
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.jitter = jitter
+        self.login_latency = login_latency
+        self.max_sessions = max_sessions
+        self.refresh_period = refresh_period
+        self.error_rate = error_rate
+        self.fail_methods = set(fail_methods or [])
+        self.filters = filters
+        self.init_seconds = init_seconds
+        # storageOperation dn: (start, seconds)
+        self.operations = {}
+        self.power_seconds = power_seconds
+        self.events = events
+        # (due, dn, operPower) of the power actions in progress
+        self.transitions = []
+        # event channel queue per cookie
+        self.subscribers = {}
+        self.event_ids = itertools.count(1)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.gate = threading.Semaphore(max_concurrent) \
+            if max_concurrent else None
+        self.sessions = {}
+        self.session_ids = itertools.count(1)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = dict(requests={}, logins=0, logouts=0,
+                          rejected_logins=0, errors_injected=0,
+                          bytes_received=0, bytes_sent=0, peak_sessions=0,
+                          busy_time=0.0)
+
+    def report(self, reset=False):
+        with self.lock:
+            self._expire_sessions()
+            report = copy.deepcopy(self.stats)
+            report["port"] = self.port
+            report["active_sessions"] = len(self.sessions)
+            report["total_requests"] = sum(report["requests"].values())
+            if reset:
+                self.reset_stats()
+        return report
+
+    def _expire_sessions(self):
+        now = time.time()
+        for cookie, session in list(self.sessions.items()):
+            if session["expires"] <= now:
+                del self.sessions[cookie]
+
+    def _count(self, method):
+        requests = self.stats["requests"]
+        requests[method] = requests.get(method, 0) + 1
+
+    @staticmethod
+    def error(method, code, descr, cookie=""):
+        return ET.Element("error", {"cookie": cookie, "response": "yes",
+                                    "method": method, "errorCode": code,
+                                    "invocationResult": "unidentified-fail",
+                                    "errorDescr": descr})
+
+    def _delay(self, method):
+        delay = self.latency
+        if self.jitter:
+            delay += self.random.uniform(0, self.jitter)
+        if method == "aaaLogin":
+            delay += self.login_latency
+        if delay > 0:
+            time.sleep(delay)
+
+    def handle(self, body):
+        start = time.time()
+        try:
+            request = ET.fromstring(body)
+        except ET.ParseError as e:
+            return ET.tostring(self.error("unknown", "101",
+                                          "XML PARSING ERROR: %s" % e))
+        method = request.tag
+        if self.gate is not None:
+            # an overloaded controller serves few requests at a time
+            self.gate.acquire()
+        try:
+            self._delay(method)
+            with self.lock:
+                self._advance_operations()
+                self._advance_power()
+                self._count(method)
+                self.stats["bytes_received"] += len(body)
+                response = self._dispatch(method, request)
+                data = ET.tostring(response)
+                self.stats["bytes_sent"] += len(data)
+                self.stats["busy_time"] += time.time() - start
+        finally:
+            if self.gate is not None:
+                self.gate.release()
+        return data
+
+    def _dispatch(self, method, request):
+        if method in self.fail_methods or (
+                self.error_rate and method not in SESSION_METHODS and
+                self.random.random() < self.error_rate):
+            self.stats["errors_injected"] += 1
+            return self.error(method, ERR_INJECTED, "injected error",
+                              request.attrib.get("cookie", ""))
+
+        if method == "aaaLogin":
+            return self.aaa_login(request)
+
+        self._expire_sessions()
+        cookie = request.attrib.get("cookie") or \
+            request.attrib.get("inCookie")
+        session = self.sessions.get(cookie)
+        if session is None:
+            return self.error(method, ERR_AUTH_REQUIRED,
+                              "Authorization required", cookie or "")
+        session["expires"] = time.time() + self.refresh_period
+
+        handler = getattr(self, "_" + method, None)
+        if handler is None:
+            return self.error(method, ERR_UNKNOWN_METHOD,
+                              "unknown method %s" % method, cookie)
+        response = ET.Element(method, {"cookie": cookie, "response": "yes"})
+        # handlers fill in response or return an error instead
+        error = handler(request, response, cookie)
+        return response if error is None else error
+
+    def aaa_login(self, request):
+        if request.attrib.get("inName") != self.username or \
+                request.attrib.get("inPassword") != self.password:
+            return self.error("aaaLogin", ERR_AUTH_FAILED,
+                              "Authentication failed")
+        self._expire_sessions()
+        if self.max_sessions and len(self.sessions) >= self.max_sessions:
+            self.stats["rejected_logins"] += 1
+            return self.error("aaaLogin", ERR_SESSION_LIMIT,
+                              "User reached maximum session limit")
+        cookie = self._new_session()
+        self.stats["logins"] += 1
+        self.stats["peak_sessions"] = max(self.stats["peak_sessions"],
+                                          len(self.sessions))
+        version = self.tree.mos.get(
+            "sys/rack-unit-1/mgmt/fw-system", (None, {}))[1].get("version")
+        return ET.Element("aaaLogin", {
+            "cookie": "", "response": "yes", "outCookie": cookie,
+            "outRefreshPeriod": str(self.refresh_period), "outPriv": "admin",
+            "outSessionId": self.sessions[cookie]["session_id"],
+            "outVersion": version or "", "outDomains": "",
+            "outChannel": "noencssl", "outEvtChannel": "noencssl"})
+
+    def _new_session(self):
+        cookie = "%d/%s" % (int(time.time()), uuid.uuid4())
+        self.sessions[cookie] = dict(
+            session_id=str(next(self.session_ids)),
+            expires=time.time() + self.refresh_period)
+        return cookie
+
+    def _aaaLogout(self, request, response, cookie):
+        self.sessions.pop(cookie, None)
+        self.stats["logouts"] += 1
+        response.set("outStatus", "success")
+
+    def _aaaKeepAlive(self, request, response, cookie):
+        pass
+
+    def _aaaRefresh(self, request, response, cookie):
+        session = self.sessions.pop(cookie)
+        new_cookie = "%d/%s" % (int(time.time()), uuid.uuid4())
+        self.sessions[new_cookie] = session
+        response.set("cookie", "")
+        response.set("outCookie", new_cookie)
+        response.set("outRefreshPeriod", str(self.refresh_period))
+        response.set("outPriv", "admin")
+        response.set("outDomains", "")
+        response.set("outChannel", "noencssl")
+        response.set("outEvtChannel", "noencssl")
+
+    @staticmethod
+    def _hierarchical(request):
+        return request.attrib.get("inHierarchical", "false").lower() in \
+            ("true", "yes")
+
+    def _configResolveDn(self, request, response, cookie):
+        dn = request.attrib.get("dn")
+        response.set("dn", dn)
+        out = ET.SubElement(response, "outConfig")
+        if dn in self.tree.mos:
+            out.append(self.tree.element(dn, self._hierarchical(request)))
+
+    @classmethod
+    def _matches(cls, attrs, condition):
+        tag = condition.tag
+        if tag == "and":
+            return all(cls._matches(attrs, c) for c in condition)
+        if tag == "or":
+            return any(cls._matches(attrs, c) for c in condition)
+        if tag == "not":
+            return not all(cls._matches(attrs, c) for c in condition)
+        value = attrs.get(condition.attrib.get("property"))
+        expected = condition.attrib.get("value", "")
+        if tag == "ne":
+            return value != expected
+        if value is None:
+            return False
+        if tag == "eq":
+            return value == expected
+        if tag == "wcard":
+            return re.search(expected, value) is not None
+        try:
+            value, expected = float(value), float(expected)
+        except ValueError:
+            pass
+        return {"gt": value > expected, "ge": value >= expected,
+                "lt": value < expected, "le": value <= expected}[tag]
+
+    def _configResolveClass(self, request, response, cookie):
+        class_id = request.attrib.get("classId", "")
+        response.set("classId", class_id)
+        in_filter = request.find("inFilter")
+        if in_filter is not None and not self.filters:
+            # older firmware does not know inFilter
+            return self.error("configResolveClass", ERR_BAD_FILTER,
+                              "XML PARSING ERROR: unknown element inFilter",
+                              cookie)
+        out = ET.SubElement(response, "outConfigs")
+        for dn in self.tree.by_class(class_id):
+            if in_filter is not None and not all(
+                    self._matches(self.tree.mos[dn][1], c) for c in in_filter):
+                continue
+            out.append(self.tree.element(dn, self._hierarchical(request)))
+
+    def _configResolveChildren(self, request, response, cookie):
+        in_dn = request.attrib.get("inDn")
+        class_id = request.attrib.get("classId")
+        response.set("inDn", in_dn or "")
+        out = ET.SubElement(response, "outConfigs")
+        for dn in self.tree.children.get(in_dn, []):
+            tag = self.tree.mos[dn][0]
+            if class_id and tag.lower() != class_id.lower():
+                continue
+            out.append(self.tree.element(dn, self._hierarchical(request)))
+
+    def _set_disks(self, controller_dn, slots, state):
+        for slot in slots:
+            attrs = self.tree.mos[controller_dn + "/pd-" + slot][1]
+            attrs.update(pdStatus=state, driveState=state)
+
+    def _vd_disks(self, vd_dn):
+        return [self.tree.mos[dn][1]["physicalDrive"]
+                for dn in self.tree.children.get(vd_dn, [])
+                if self.tree.mos[dn][0] == "storageLocalDiskUsage"]
+
+    def _create_virtual_drive(self, creator_dn, attrs):
+        '''
+        Creates the storageVirtualDrive a triggered creator asks for, raises
+        ValueError like the IMC rejects the request when a disk is missing
+        or in use.
+        '''
+        controller_dn = self.tree.parents[creator_dn]
+        spans = re.findall(r"\[([0-9,]+)\]", attrs.get("driveGroup", ""))
+        if not spans:
+            raise ValueError("invalid drive group %s" % attrs.get("driveGroup"))
+        slots = [slot for span in spans for slot in span.split(",")]
+        for slot in slots:
+            disk = self.tree.mos.get(controller_dn + "/pd-" + slot)
+            if disk is None or disk[1].get("pdStatus") != UNUSED_DISK:
+                raise ValueError("physical drive %s is not available" % slot)
+        ids = [int(self.tree.mos[dn][1]["id"])
+               for dn in self.tree.children.get(controller_dn, [])
+               if self.tree.mos[dn][0] == "storageVirtualDrive"]
+        vd_id = str(max(ids) + 1 if ids else 0)
+        vd_dn = controller_dn + "/vd-" + vd_id
+        self.tree.set("storageVirtualDrive", vd_dn, dict(
+            id=vd_id, name=attrs.get("virtualDriveName", ""),
+            raidLevel="RAID " + attrs.get("raidLevel", "0"),
+            size=attrs.get("size", ""), stripSize=attrs.get("stripSize", ""),
+            accessPolicy=attrs.get("accessPolicy", ""),
+            readPolicy=attrs.get("readPolicy", ""),
+            cachePolicy=attrs.get("cachePolicy", ""),
+            diskCachePolicy=attrs.get("diskCachePolicy", ""),
+            writeCachePolicy=attrs.get("writePolicy", ""),
+            spanDepth=str(len(spans)),
+            drivesPerSpan=str(len(slots) // len(spans)),
+            physicalDrivesList=",".join(slots), driveState="Optimal",
+            vdStatus="Optimal", health="Good", bootDrive="false"))
+        for span, span_slots in enumerate(spans):
+            for slot in span_slots.split(","):
+                self.tree.set("storageLocalDiskUsage",
+                              vd_dn + "/pd-" + slot,
+                              dict(physicalDrive=slot, span=str(span),
+                                   pdStatus="Online", state="Online",
+                                   virtualDrive=vd_id))
+        self._set_disks(controller_dn, slots, "Online")
+        if self.init_seconds and \
+                attrs.get("raidLevel") in BACKGROUND_INIT_LEVELS:
+            self._start_operation(vd_dn, "Background Initialization")
+
+    def _start_operation(self, vd_dn, name):
+        op_dn = vd_dn + "/storage-operation"
+        self.tree.set("storageOperation", op_dn, dict(
+            currentLrop=name, lropInProgress="true", progressPercent="0",
+            elapsedSeconds="0",
+            estimatedSecondsRemaining=str(int(self.init_seconds))))
+        self.operations[op_dn] = (time.time(), self.init_seconds)
+
+    def _advance_operations(self):
+        now = time.time()
+        for op_dn, (start, seconds) in list(self.operations.items()):
+            if op_dn not in self.tree.mos:
+                del self.operations[op_dn]
+                continue
+            elapsed = now - start
+            attrs = self.tree.mos[op_dn][1]
+            if elapsed >= seconds:
+                attrs.update(currentLrop="None", lropInProgress="false",
+                             progressPercent="100",
+                             estimatedSecondsRemaining="0")
+                del self.operations[op_dn]
+            else:
+                attrs.update(progressPercent=str(int(100 * elapsed / seconds)),
+                             estimatedSecondsRemaining=str(
+                                 int(seconds - elapsed)))
+            attrs["elapsedSeconds"] = str(int(min(elapsed, seconds)))
+
+    def _power_action(self, dn, attrs):
+        states = POWER_ACTIONS.get(attrs.get("adminPower"))
+        if states is None:
+            return
+        # the IMC takes the action and goes back to the power policy
+        attrs["adminPower"] = "policy"
+        if len(states) == 1 and attrs.get("operPower") == states[0]:
+            return
+        now = time.time()
+        self.transitions = [t for t in self.transitions if t[1] != dn]
+        for index, state in enumerate(states):
+            due = now + self.power_seconds * (index + 1) / len(states)
+            self.transitions.append((due, dn, state))
+
+    def _advance_power(self):
+        now = time.time()
+        for transition in sorted(self.transitions):
+            due, dn, state = transition
+            if due > now:
+                break
+            self.transitions.remove(transition)
+            if dn not in self.tree.mos:
+                continue
+            tag, attrs = self.tree.mos[dn]
+            attrs["operPower"] = state
+            self._publish(ET.Element(tag, {"dn": dn, "operPower": state,
+                                           "status": "modified"}))
+
+    def _publish(self, elem):
+        if not self.subscribers:
+            return
+        event = ET.Element("configMoChangeEvent",
+                           {"cookie": "", "inEid": str(next(self.event_ids))})
+        ET.SubElement(event, "inConfig").append(elem)
+        data = ET.tostring(event)
+        for events in self.subscribers.values():
+            events.put(data)
+
+    def subscribe(self, body):
+        '''
+        Returns the event queue of an eventSubscribe request or the error
+        response.
+        '''
+        request = ET.fromstring(body)
+        cookie = request.attrib.get("cookie", "")
+        with self.lock:
+            self._count("eventSubscribe")
+            self._expire_sessions()
+            if not self.events:
+                return None, ET.tostring(self.error(
+                    "eventSubscribe", ERR_UNKNOWN_METHOD,
+                    "unknown method eventSubscribe", cookie))
+            if cookie not in self.sessions:
+                return None, ET.tostring(self.error(
+                    "eventSubscribe", ERR_AUTH_REQUIRED,
+                    "Authorization required", cookie))
+            events = self.subscribers[cookie] = Queue()
+            return events, None
+
+    def next_event(self, cookie, timeout):
+        '''
+        Returns the next event of the subscription of cookie, None when
+        there was none for timeout seconds, raises KeyError once the
+        session is gone.
+        '''
+        with self.lock:
+            self._advance_power()
+            if cookie not in self.sessions:
+                self.subscribers.pop(cookie, None)
+                raise KeyError(cookie)
+            events = self.subscribers[cookie]
+        try:
+            return events.get(timeout=timeout)
+        except Empty:
+            return None
+
+    def unsubscribe(self, cookie):
+        with self.lock:
+            self.subscribers.pop(cookie, None)
+
+    def _virtual_drive_action(self, dn, attrs):
+        if attrs.get("adminAction") != "set-boot-drive":
+            return
+        controller_dn = self.tree.parents[dn]
+        for sibling in self.tree.children.get(controller_dn, []):
+            if self.tree.mos[sibling][0] == "storageVirtualDrive":
+                self.tree.mos[sibling][1]["bootDrive"] = \
+                    "true" if sibling == dn else "false"
+
+    def _configure(self, elem, parent_dn=None):
+        '''
+        Applies one inConfig element, returns the resulting element or None
+        when it was deleted.
+        '''
+        dn = elem.attrib.get("dn")
+        if dn is None and parent_dn is not None:
+            dn = parent_dn + "/" + elem.attrib["rn"]
+        status = elem.attrib.get("status", "")
+        if "deleted" in status or "removed" in status:
+            if self.tree.mos.get(dn, ("",))[0] == "storageVirtualDrive":
+                self._set_disks(self.tree.parents[dn], self._vd_disks(dn),
+                                UNUSED_DISK)
+            self.tree.remove(dn)
+            return None
+        attrs = dict((k, v) for k, v in elem.attrib.items()
+                     if k not in ("rn", "status"))
+        self.tree.set(elem.tag, dn, attrs)
+        if elem.tag == "storageVirtualDriveCreatorUsingUnusedPhysicalDrive" \
+                and attrs.get("adminState") == "trigger":
+            self._create_virtual_drive(dn, attrs)
+        if elem.tag == "storageVirtualDrive":
+            self._virtual_drive_action(dn, attrs)
+        if elem.tag in POWER_CLASSES:
+            self._power_action(dn, self.tree.mos[dn][1])
+        for child in elem:
+            self._configure(child, dn)
+        return self.tree.element(dn)
+
+    def _configConfMo(self, request, response, cookie):
+        response.set("dn", request.attrib.get("dn", ""))
+        out = ET.SubElement(response, "outConfig")
+        in_config = request.find("inConfig")
+        for elem in (in_config if in_config is not None else []):
+            try:
+                result = self._configure(elem)
+            except ValueError as e:
+                return self.error("configConfMo", ERR_CONFIG, str(e), cookie)
+            if result is not None:
+                out.append(result)
+
+    def _configConfMos(self, request, response, cookie):
+        out = ET.SubElement(response, "outConfigs")
+        in_configs = request.find("inConfigs")
+        passed = failed = 0
+        for pair in (in_configs if in_configs is not None else []):
+            for elem in pair:
+                try:
+                    result = self._configure(elem)
+                except (KeyError, ValueError) as e:
+                    failed_mos = out.find("failedMos")
+                    if failed_mos is None:
+                        failed_mos = ET.SubElement(out, "failedMos")
+                    ET.SubElement(failed_mos, "failedMo", {
+                        "dn": pair.attrib.get("key", ""), "errorCode": "1",
+                        "errorDescr": str(e)})
+                    failed += 1
+                    continue
+                out_pair = ET.SubElement(out, "pair",
+                                         {"key": pair.attrib.get("key", "")})
+                if result is not None:
+                    out_pair.append(result)
+                passed += 1
+        if failed and passed:
+            # sic, the spelling imcsdk expects
+            status = "paritial success"
+        elif failed:
+            status = "failure"
+        else:
+            status = "success"
+        ET.SubElement(out, "operationStatus").text = status
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def _reply(self, code, body, content_type):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/nuova":
+            return self._reply(404, b"", "text/plain")
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if body.lstrip().startswith(b"<eventSubscribe"):
+            return self._stream_events(body)
+        self._reply(200, self.server.imc.handle(body), "text/xml")
+
+    def _stream_events(self, body):
+        imc = self.server.imc
+        events, error = imc.subscribe(body)
+        if error is not None:
+            return self._reply(200, error, "text/xml")
+        cookie = ET.fromstring(body).attrib.get("cookie")
+        # no Content-Length, the stream ends when the connection is closed
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml")
+        self.end_headers()
+        try:
+            while True:
+                event = imc.next_event(cookie, 0.05)
+                if event is not None:
+                    self.wfile.write(("%d\n" % len(event)).encode() + event)
+                    self.wfile.flush()
+        except (KeyError, IOError):
+            # logged out, or the client went away
+            pass
+        finally:
+            imc.unsubscribe(cookie)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        reset = parse_qs(url.query).get("reset", ["0"])[0] in ("1", "true")
+        if url.path == "/stats":
+            report = self.server.imc.report(reset)
+        elif url.path == "/stats/all":
+            report = [server.imc.report(reset)
+                      for server in self.server.fleet]
+        else:
+            return self._reply(404, b"", "text/plain")
+        self._reply(200, json.dumps(report).encode("utf-8"),
+                    "application/json")
+
+
+def load_snapshots(paths):
+    tree = MoTree()
+    for path in paths or [DEFAULT_SNAPSHOT]:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(".xml"):
+                    tree.load_file(os.path.join(path, name))
+        else:
+            tree.load_file(path)
+    return tree
+
+
+def add_drives(tree, drives):
+    '''
+    Fills every storage controller of tree with disks up to slot drives,
+    copies of its first disk.
+    '''
+    for controller_dn in tree.by_class("storageController"):
+        disks = [dn for dn in tree.children.get(controller_dn, [])
+                 if tree.mos[dn][0] == "storageLocalDisk"]
+        if not disks:
+            continue
+        tag, template = tree.mos[disks[0]]
+        for slot in range(1, drives + 1):
+            dn = "%s/pd-%d" % (controller_dn, slot)
+            if dn not in tree.mos:
+                tree.set(tag, dn, dict(
+                    template, id=str(slot),
+                    driveSerialNumber="SIMPD%04d" % slot))
+
+
+def start_fleet(port=8001, count=1, host="127.0.0.1", snapshots=None,
+                certfile=None, keyfile=None, verbose=False, drives=0,
+                **options):
+    '''
+    Starts count simulated servers on consecutive ports, each on its own
+    thread, and returns their HTTP servers.
+    '''
+    seed_tree = load_snapshots(snapshots)
+    if drives:
+        add_drives(seed_tree, drives)
+    fleet = []
+    for index in range(count):
+        tree = copy.deepcopy(seed_tree)
+        if "sys" in tree.mos:
+            tree.mos["sys"][1].update(name="sim-%d" % (port + index),
+                                      address=host)
+        for dn in tree.by_class("computeRackUnit"):
+            tree.mos[dn][1]["serial"] = "SIM%07d" % (port + index)
+        imc = SimulatedImc(port + index, tree, **options)
+        server = _ThreadingHTTPServer((host, port + index), _Handler)
+        if certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            server.socket = context.wrap_socket(server.socket,
+                                                server_side=True)
+        server.imc = imc
+        server.fleet = fleet
+        server.verbose = verbose
+        fleet.append(server)
+
+    for server in fleet:
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+    return fleet
+
+
+def stop_fleet(fleet):
+    for server in fleet:
+        server.shutdown()
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cisco IMC XML API simulator")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address to listen on")
+    parser.add_argument("--port", type=int, default=8001,
+                        help="port of the first simulated server")
+    parser.add_argument("--count", type=int, default=1,
+                        help="number of simulated servers, on consecutive ports")
+    parser.add_argument("--snapshot", action="append", dest="snapshots",
+                        help="XML snapshot file or directory seeding the MO "
+                             "tree, may be repeated (default: %s)"
+                             % DEFAULT_SNAPSHOT)
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="up to this many random seconds added on top")
+    parser.add_argument("--login-latency", type=float, default=0.0,
+                        help="extra seconds for aaaLogin")
+    parser.add_argument("--max-sessions", type=int, default=0,
+                        help="concurrent sessions per server, 0 is unlimited")
+    parser.add_argument("--max-concurrent", type=int, default=0,
+                        help="requests served at the same time per server, "
+                             "0 is unlimited")
+    parser.add_argument("--refresh-period", type=int, default=600,
+                        help="seconds before an idle session expires")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of non-session requests that fail")
+    parser.add_argument("--fail-method", action="append", dest="fail_methods",
+                        help="XML API method that always fails, may be repeated")
+    parser.add_argument("--no-filters", action="store_false", dest="filters",
+                        help="reject class queries with an inFilter, like "
+                             "older firmware")
+    parser.add_argument("--drives", type=int, default=0,
+                        help="disks per storage controller, copies of the "
+                             "first one")
+    parser.add_argument("--init-seconds", type=float, default=0.0,
+                        help="seconds the background initialization of new "
+                             "RAID 5/6/50/60 drives takes")
+    parser.add_argument("--power-seconds", type=float, default=0.0,
+                        help="seconds a power action takes to change the "
+                             "operPower")
+    parser.add_argument("--no-events", action="store_false", dest="events",
+                        help="reject eventSubscribe, like firmware without "
+                             "an event channel")
+    parser.add_argument("--seed", type=int, help="seed of the random errors "
+                                                 "and jitter")
+    parser.add_argument("--certfile", help="serve HTTPS with this certificate")
+    parser.add_argument("--keyfile", help="private key of --certfile")
+    parser.add_argument("--verbose", action="store_true",
+                        help="log every HTTP request")
+    args = parser.parse_args()
+
+    fleet = start_fleet(port=args.port, count=args.count, host=args.host,
+                        snapshots=args.snapshots, certfile=args.certfile,
+                        keyfile=args.keyfile, verbose=args.verbose,
+                        drives=args.drives,
+                        username=args.username, password=args.password,
+                        latency=args.latency, jitter=args.jitter,
+                        login_latency=args.login_latency,
+                        max_sessions=args.max_sessions,
+                        max_concurrent=args.max_concurrent,
+                        refresh_period=args.refresh_period,
+                        error_rate=args.error_rate,
+                        fail_methods=args.fail_methods, filters=args.filters,
+                        init_seconds=args.init_seconds,
+                        power_seconds=args.power_seconds,
+                        events=args.events, seed=args.seed)
+    print("simulating %d server(s) on %s:%d-%d"
+          % (args.count, args.host, args.port, args.port + args.count - 1))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_fleet(fleet)
+
+
+if __name__ == '__main__':
+    main()
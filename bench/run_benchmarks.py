@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+'''
+Runs the modules in library/ and the site.yml roles against fleets of
+simulated IMC servers (bench/imc_simulator.py) and records, per scenario
+and fleet size, the wall time, XML API round trips per task, logins per
+play, CPU time per host and the largest RSS of a single process.
+
+    python bench/run_benchmarks.py run --sizes 1,50,500 --output new.json
+    python bench/run_benchmarks.py compare old.json new.json --threshold 10
+
+compare exits with 1 when a metric got worse by more than threshold percent.
+'''
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import imc_simulator
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules whose login parameters come from the play's module_defaults,
+# cisco_imc_logout only takes the session
+IMC_MODULES = sorted(name[:-3] for name in os.listdir(os.path.join(REPO, "library"))
+                     if name.endswith(".py") and not name.startswith("_") and
+                     name != "cisco_imc_logout.py")
+
+NTP_SERVERS = [{"id": 1, "ip": "192.168.1.10"}, {"id": 2, "ip": "192.168.1.11"}]
+NTP_OBJECT = {"module": "imcsdk.mometa.comm.CommNtpProvider",
+              "class": "CommNtpProvider",
+              "properties": {"parent_mo_or_dn": "sys/svc-ext",
+                             "ntp_enable": "yes",
+                             "ntp_server1": "ntp.esl.cisco.com"}}
+
+# scenario: tasks of the play, or roles when the value is a dict with roles
+SCENARIOS = {
+    "cisco_imc_login": [
+        {"name": "login", "cisco_imc_login": {}, "register": "login"},
+        {"name": "ntp with session", "cisco_imc_ntp": {
+            "ntp_servers": NTP_SERVERS, "state": "present",
+            "server": "{{ login.server }}"}},
+        {"name": "logout", "cisco_imc_logout": {"server": "{{ login.server }}"}},
+    ],
+    "cisco_imc_inventory": [{"cisco_imc_inventory": {}}],
+    "cisco_imc_ntp": [{"cisco_imc_ntp": {"ntp_servers": NTP_SERVERS,
+                                         "state": "present"}}],
+    "cisco_imc_ldap": [{"cisco_imc_ldap": {"state": "present", "timeout": 60}}],
+    "cisco_imc_user": [{"cisco_imc_user": {"name": "jdoe", "pwd": "G3N3-123",
+                                           "priv": "admin",
+                                           "state": "present"}}],
+    "cisco_imc_password_policy": [{"cisco_imc_password_policy": {
+        "strong_password": "enabled"}}],
+    "cisco_imc_ipmi": [{"cisco_imc_ipmi": {"state": "present"}}],
+    "cisco_imc_sol": [{"cisco_imc_sol": {"state": "present"}}],
+    "cisco_imc_boot_order_precision": [{"cisco_imc_boot_order_precision": {
+        "boot_devices": [{"order": "1", "device-type": "hdd", "name": "hdd"},
+                         {"order": "2", "device-type": "pxe", "name": "pxe"}]}}],
+    "cisco_imc_server": [{"cisco_imc_server": {"locator_led": "on"}}],
+    "cisco_imc_virtual_drive": [{"cisco_imc_virtual_drive": {
+        "raid_level": 0, "drive_group": [[1]], "controller_slot": "MRAID",
+        "state": "present"}}],
+    "cisco_imc_drive_groups": [{"cisco_imc_drive_groups": {
+        "raid_level": 5, "drive_count": 4, "controller_slot": "MRAID"}}],
+    # creates a RAID 5 drive in the background and waits for --init-seconds
+    "cisco_imc_storage_job": [
+        {"name": "create", "register": "vd", "cisco_imc_virtual_drive": {
+            "raid_level": 5, "drive_group": [[2, 3, 4]],
+            "controller_slot": "MRAID", "state": "present",
+            "background": True}},
+        {"name": "wait", "cisco_imc_storage_job": {
+            "job": "{{ vd.storage_job }}", "min_interval": 1}},
+    ],
+    "imc_managed_objects": [{"imc_managed_objects": {"objects": [NTP_OBJECT]}}],
+    "imc_query": [{"imc_query": {"class_ids": "computeRackUnit,biosUnit"}}],
+    "cisco_imc_fleet": [{"cisco_imc_fleet": {
+        "hosts": "{{ fleet_hosts }}", "objects": [NTP_OBJECT]},
+        "run_once": True}],
+    # off and on again, each taking --power-seconds
+    "cisco_imc_power_fleet": [{"cisco_imc_power_fleet": {
+        "hosts": "{{ fleet_hosts }}", "state": "boot", "max_in_flight": 50},
+        "run_once": True}],
+    # site.yml without the common role, which installs imcsdk with pip
+    "site_roles": {"roles": ["admin", "boot", "storage"]},
+}
+
+# lower is better for all of them
+COMPARED_METRICS = ["wall_time", "round_trips_per_task", "logins_per_play",
+                    "cpu_time_per_host", "max_process_rss_kb"]
+
+
+def write_inventory(path, fleet, username, password):
+    lines = ["[imc]"]
+    for server in fleet:
+        port = server.imc.port
+        lines.append("sim-%d ansible_connection=local "
+                     "ansible_python_interpreter=%s imc_ip=127.0.0.1 "
+                     "imc_port=%d imc_username=%s imc_password=%s"
+                     % (port, sys.executable, port, username, password))
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def write_playbook(path, scenario, fleet, username, password):
+    defaults = {"ip": "{{ imc_ip }}", "username": "{{ imc_username }}",
+                "password": "{{ imc_password }}", "port": "{{ imc_port }}",
+                "secure": False}
+    play = {"hosts": "imc", "gather_facts": False,
+            "module_defaults": dict((name, defaults) for name in IMC_MODULES),
+            "vars": {"ntp_servers": NTP_SERVERS,
+                     "boot_devices": [
+                         {"order": "1", "device-type": "hdd", "name": "hdd"},
+                         {"order": "2", "device-type": "pxe", "name": "pxe"}],
+                     "fleet_hosts": [
+                         {"ip": "127.0.0.1", "port": str(server.imc.port),
+                          "secure": False} for server in fleet]}}
+    # the fleet modules log in on their own, they only get the credentials
+    for name in ("cisco_imc_fleet", "cisco_imc_power_fleet"):
+        play["module_defaults"][name] = {"username": username,
+                                         "password": password}
+    tasks = SCENARIOS[scenario]
+    if isinstance(tasks, dict):
+        play.update(tasks)
+    else:
+        play["tasks"] = tasks
+    # JSON is valid YAML, no PyYAML needed
+    with open(path, "w") as f:
+        json.dump([play], f, indent=2)
+
+
+def run_playbook(workdir, playbook, inventory, forks):
+    env = dict(os.environ,
+               ANSIBLE_LIBRARY=os.path.join(REPO, "library"),
+               ANSIBLE_MODULE_UTILS=os.path.join(REPO, "module_utils"),
+               ANSIBLE_ROLES_PATH=os.path.join(REPO, "roles"),
+               ANSIBLE_STDOUT_CALLBACK="json",
+               ANSIBLE_HOST_KEY_CHECKING="False",
+               ANSIBLE_RETRY_FILES_ENABLED="False",
+               ANSIBLE_FORKS=str(forks))
+    out_path = os.path.join(workdir, "ansible.json")
+    start = time.time()
+    with open(out_path, "w") as out, \
+            open(os.path.join(workdir, "ansible.log"), "w") as log:
+        process = subprocess.Popen(["ansible-playbook", "-i", inventory,
+                                    playbook], stdout=out, stderr=log,
+                                   env=env, cwd=workdir)
+        # wait4 reports the usage of ansible-playbook and every fork it reaped
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.WEXITSTATUS(status) \
+            if os.WIFEXITED(status) else -1
+    wall_time = time.time() - start
+
+    try:
+        with open(out_path) as f:
+            output = json.load(f)
+    except ValueError:
+        output = {}
+    return process.returncode, wall_time, usage, output
+
+
+def run_scenario(scenario, fleet, forks, username, password):
+    workdir = tempfile.mkdtemp(prefix="imc-bench-")
+    try:
+        inventory = os.path.join(workdir, "inventory")
+        playbook = os.path.join(workdir, "play.yml")
+        write_inventory(inventory, fleet, username, password)
+        write_playbook(playbook, scenario, fleet, username, password)
+
+        for server in fleet:
+            server.imc.report(reset=True)
+        rc, wall_time, usage, output = run_playbook(workdir, playbook,
+                                                    inventory, forks)
+        stats = [server.imc.report() for server in fleet]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    hosts = len(fleet)
+    tasks = sum(len(play.get("tasks", [])) for play in output.get("plays", []))
+    plays = max(1, len(output.get("plays", [])))
+    requests = {}
+    for server_stats in stats:
+        for method, count in server_stats["requests"].items():
+            requests[method] = requests.get(method, 0) + count
+    round_trips = sum(requests.values())
+    logins = sum(server_stats["logins"] for server_stats in stats)
+    cpu_time = usage.ru_utime + usage.ru_stime
+    failed_hosts = sorted(host for host, host_stats in
+                          output.get("stats", {}).items()
+                          if host_stats.get("failures") or
+                          host_stats.get("unreachable"))
+    return dict(scenario=scenario, hosts=hosts, rc=rc, tasks=tasks,
+                wall_time=round(wall_time, 3),
+                round_trips=round_trips,
+                round_trips_per_task=round(
+                    round_trips / float(max(1, tasks) * hosts), 2),
+                requests=requests,
+                logins=logins,
+                logins_per_play=round(logins / float(plays), 2),
+                logins_per_host=round(logins / float(hosts), 2),
+                peak_sessions=max(s["peak_sessions"] for s in stats),
+                # ru_maxrss of wait4 is the largest resident set of
+                # ansible-playbook or any one of its forks, not a sum
+                max_process_rss_kb=usage.ru_maxrss,
+                cpu_time=round(cpu_time, 3),
+                cpu_time_per_host=round(cpu_time / hosts, 4),
+                failed_hosts=len(failed_hosts))
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"],
+                                       cwd=REPO).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    scenarios = args.scenarios or sorted(SCENARIOS)
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        sys.exit("unknown scenario(s): %s" % ", ".join(sorted(unknown)))
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    # the open sockets of the largest fleet plus the forks' connections
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = max(sizes) * 4 + 256
+    if soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE,
+                           (min(wanted, hard), hard))
+
+    results = []
+    for size in sizes:
+        fleet = imc_simulator.start_fleet(
+            port=args.port, count=size, snapshots=args.snapshots,
+            username=args.username, password=args.password,
+            latency=args.latency, jitter=args.jitter,
+            login_latency=args.login_latency,
+            max_sessions=args.max_sessions, drives=args.drives,
+            init_seconds=args.init_seconds,
+            power_seconds=args.power_seconds, seed=0)
+        try:
+            for scenario in scenarios:
+                result = run_scenario(scenario, fleet, args.forks,
+                                      args.username, args.password)
+                results.append(result)
+                print("%-32s hosts=%-4d wall=%8.2fs rt/task=%6.1f "
+                      "logins/play=%6.1f cpu/host=%.3fs max-rss=%dkB "
+                      "failed=%d"
+                      % (scenario, size, result["wall_time"],
+                         result["round_trips_per_task"],
+                         result["logins_per_play"],
+                         result["cpu_time_per_host"],
+                         result["max_process_rss_kb"],
+                         result["failed_hosts"]))
+        finally:
+            imc_simulator.stop_fleet(fleet)
+
+    report = dict(created=time.strftime("%Y-%m-%dT%H:%M:%S"),
+                  revision=git_revision(),
+                  python=platform.python_version(),
+                  forks=args.forks,
+                  simulator=dict(latency=args.latency, jitter=args.jitter,
+                                 login_latency=args.login_latency,
+                                 max_sessions=args.max_sessions,
+                                 drives=args.drives,
+                                 init_seconds=args.init_seconds,
+                                 power_seconds=args.power_seconds),
+                  results=results)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print("results written to %s" % args.output)
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    old = dict(((r["scenario"], r["hosts"]), r) for r in baseline["results"])
+    regressions = 0
+    print("%-32s %5s %-22s %12s %12s %8s"
+          % ("scenario", "hosts", "metric", "baseline", "current", "change"))
+    for result in current["results"]:
+        key = (result["scenario"], result["hosts"])
+        if key not in old:
+            continue
+        for metric in COMPARED_METRICS:
+            before, after = old[key].get(metric), result.get(metric)
+            if before is None or after is None:
+                continue
+            change = (after - before) * 100.0 / before if before else 0.0
+            flag = ""
+            if change > args.threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            print("%-32s %5d %-22s %12s %12s %+7.1f%%%s"
+                  % (key[0], key[1], metric, before, after, change, flag))
+    if regressions:
+        print("%d regression(s) above %.1f%%" % (regressions, args.threshold))
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="imc-ansible benchmarks")
+    commands = parser.add_subparsers(dest="command")
+
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--sizes", default="1,50,500",
+                            help="comma separated fleet sizes")
+    run_parser.add_argument("--scenario", action="append", dest="scenarios",
+                            help="scenario to run, may be repeated "
+                                 "(default: all of %s)"
+                                 % ", ".join(sorted(SCENARIOS)))
+    run_parser.add_argument("--output", default="benchmark.json")
+    run_parser.add_argument("--forks", type=int, default=50)
+    run_parser.add_argument("--port", type=int, default=18001,
+                            help="port of the first simulated server")
+    run_parser.add_argument("--snapshot", action="append", dest="snapshots")
+    run_parser.add_argument("--username", default="admin")
+    run_parser.add_argument("--password", default="password")
+    run_parser.add_argument("--latency", type=float, default=0.02)
+    run_parser.add_argument("--jitter", type=float, default=0.0)
+    run_parser.add_argument("--login-latency", type=float, default=0.2)
+    run_parser.add_argument("--max-sessions", type=int, default=0)
+    run_parser.add_argument("--drives", type=int, default=8)
+    run_parser.add_argument("--init-seconds", type=float, default=2.0)
+    run_parser.add_argument("--power-seconds", type=float, default=1.0)
+
+    compare_parser = commands.add_parser(
+        "compare", help="compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=10.0,
+                                help="percent a metric may get worse")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    elif args.command == "compare":
+        compare(args)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+callback: cisco_imc_metrics
+type: aggregate
+short_description: Sums up the imc_metrics of Cisco IMC modules per play and per host
+description:
+- Collects the imc_metrics returned by the Cisco IMC modules when CISCO_IMC_METRICS is set
+  and prints the number of XML API requests, bytes and request time per play, host and method.
+requirements:
+- enable in ansible.cfg (callback_whitelist / callbacks_enabled = cisco_imc_metrics)
+'''
+
+from ansible.plugins.callback import CallbackBase
+
+
+def _add(totals, metrics):
+    for key in ('requests', 'bytes_sent', 'bytes_received', 'errors'):
+        totals[key] = totals.get(key, 0) + metrics.get(key, 0)
+    totals['time'] = totals.get('time', 0.0) + metrics.get('time', 0.0)
+
+
+class CallbackModule(CallbackBase):
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'cisco_imc_metrics'
+    CALLBACK_NEEDS_WHITELIST = True
+    CALLBACK_NEEDS_ENABLED = True
+
+    def __init__(self):
+        super(CallbackModule, self).__init__()
+        self.plays = []
+
+    def _new_play(self, name):
+        self.plays.append(dict(name=name, hosts={}, methods={}, totals={}))
+
+    def v2_playbook_on_play_start(self, play):
+        self._new_play(play.get_name().strip())
+
+    def _record(self, host, metrics):
+        if not self.plays:
+            self._new_play('')
+        play = self.plays[-1]
+        task_totals = dict(metrics, time=metrics.get('request_time', 0.0))
+        _add(play['hosts'].setdefault(host, {}), task_totals)
+        _add(play['totals'], task_totals)
+        for method, totals in metrics.get('methods', {}).items():
+            _add(play['methods'].setdefault(method, {}), totals)
+
+    def _collect(self, result):
+        host = result._host.get_name()
+        metrics = result._result.get('imc_metrics')
+        if metrics:
+            self._record(host, metrics)
+        # loops return the metrics of every item
+        for item in result._result.get('results', []):
+            if isinstance(item, dict) and item.get('imc_metrics'):
+                self._record(host, item['imc_metrics'])
+
+    def v2_runner_on_ok(self, result):
+        self._collect(result)
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self._collect(result)
+
+    def _line(self, name, totals):
+        self._display.display(
+            "%-40s requests=%-6d sent=%-10d received=%-10d time=%.3fs%s"
+            % (name, totals.get('requests', 0), totals.get('bytes_sent', 0),
+               totals.get('bytes_received', 0), totals.get('time', 0.0),
+               " errors=%d" % totals['errors'] if totals.get('errors') else ""))
+
+    def v2_playbook_on_stats(self, stats):
+        for play in self.plays:
+            if not play['totals']:
+                continue
+            self._display.banner("CISCO IMC METRICS [%s]" % play['name'])
+            self._line("total", play['totals'])
+            for host in sorted(play['hosts']):
+                self._line("host %s" % host, play['hosts'][host])
+            for method in sorted(play['methods'],
+                                 key=lambda m: -play['methods'][m]['requests']):
+                self._line("method %s" % method, play['methods'][method])
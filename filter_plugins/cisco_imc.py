@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+
+def _is_columnar(data):
+    return isinstance(data, dict) and 'columns' in data and 'rows' in data
+
+
+def imc_objects(data):
+    '''
+    Turns imc_query format: columnar back into what format: dict returns,
+    for one {query, columns, rows, values} (a list of dicts, or the dict of
+    a dn query) or a dict of them, children included.
+    '''
+    if _is_columnar(data):
+        columns = data['columns']
+        values = data.get('values') or {}
+        lookups = [values.get(name) for name in columns]
+        objects = []
+        for row in data['rows']:
+            obj_dict = {}
+            for name, lookup, value in zip(columns, lookups, row):
+                if name == 'children':
+                    # objects without children have no children key
+                    if value is not None:
+                        obj_dict[name] = imc_objects(value)
+                    continue
+                if lookup is not None and value is not None:
+                    value = lookup[value]
+                obj_dict[name] = value
+            objects.append(obj_dict)
+        if data.get('query') == 'dn':
+            return objects[0] if objects else {}
+        return objects
+    if isinstance(data, dict):
+        return dict((key, imc_objects(value)) for key, value in data.items())
+    return data
+
+
+class FilterModule(object):
+
+    def filters(self):
+        return {
+            'imc_objects': imc_objects,
+        }
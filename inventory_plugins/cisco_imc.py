@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+name: cisco_imc
+plugin_type: inventory
+short_description: Cisco IMC servers grouped by their hardware
+description:
+- Logs in to every IMC of I(hosts) concurrently and builds groups by model, firmware version,
+  power state and storage controller type from what the IMC reports.
+- The servers are collected into the inventory cache, with C(cache) enabled
+  C(ansible-playbook) reads it instead of contacting every IMC until C(cache_timeout) expires.
+  Only the collected data of reachable servers is cached, never the credentials, the unreachable ones and servers
+  added to hosts are collected again on the next run.
+- Servers that could not be collected are put into the C(<group_prefix>unreachable) group
+  with the error in C(imc_error).
+- The configuration file name must end with C(cisco_imc.yml) or C(cisco_imc.yaml).
+requirements:
+- imcsdk
+- the module_utils of this repository copied by install.py
+- enable in ansible.cfg ([inventory] enable_plugins = cisco_imc)
+extends_documentation_fragment:
+- constructed
+- inventory_cache
+options:
+  plugin:
+    description: Marks the file as a configuration of this plugin.
+    required: true
+    choices: ['cisco_imc']
+  hosts:
+    description:
+    - Servers to collect, an IP address, a range such as C(172.28.225.[122:123]), or a dict
+      with ip and optionally name, username, password, port, secure and proxy overriding the
+      values below.
+    - The inventory host is named after name, the ip by default.
+    type: list
+    required: true
+  username:
+    description: IMC user name.
+    default: admin
+    env:
+    - name: CISCO_IMC_USERNAME
+  password:
+    description: IMC password.
+    env:
+    - name: CISCO_IMC_PASSWORD
+  port:
+    description: IMC port, 443 with secure, 80 without by default.
+  secure:
+    description: Use https.
+    type: bool
+  proxy:
+    description: Proxy to reach the IMC through.
+  max_workers:
+    description: Number of servers collected at the same time.
+    type: int
+    default: 10
+  timeout:
+    description: Seconds after which a single server is given up.
+    type: int
+    default: 60
+  group_by:
+    description: Groups built from the collected data, C(<group_prefix><key>_<value>).
+    type: list
+    default: ['model', 'firmware', 'power', 'controller']
+    choices: ['model', 'firmware', 'power', 'controller']
+  group_prefix:
+    description: Prefix of the groups built from group_by.
+    default: imc_
+  host_credentials:
+    description:
+    - Set imc_username and imc_password of every host, the ones the roles log in with.
+    - Off by default as the password would show in plain text in the output of ansible-inventory and wherever
+      hostvars are dumped, give the roles their credentials with group_vars or a vault otherwise.
+    type: bool
+    default: false
+'''
+
+EXAMPLES = r'''
+# cisco_imc.yml, ansible-playbook -i cisco_imc.yml site.yml
+plugin: cisco_imc
+hosts:
+  - 10.29.131.102
+  - 172.28.225.[122:123]
+  - {ip: 172.28.225.130, name: colusa2, password: other}
+username: admin
+password: password
+max_workers: 50
+cache: true
+cache_plugin: jsonfile
+cache_connection: ~/.ansible/cisco_imc/inventory_plugin
+cache_timeout: 3600
+host_credentials: true
+keyed_groups:
+  - key: imc_memory_gb
+    prefix: memory
+'''
+
+from ansible.errors import AnsibleParserError
+from ansible.module_utils.six import string_types
+from ansible.plugins.inventory import BaseInventoryPlugin, Cacheable, Constructable
+
+# computeRackUnit properties kept of every server
+UNIT_PROPERTIES = ('serial', 'uuid', 'oper_power', 'num_of_cpus', 'total_memory')
+
+# per server parameters a hosts entry may override
+LOGIN_PARAMS = ('username', 'password', 'port', 'secure', 'proxy')
+
+
+def collect_server(params):
+    '''
+    Returns the model, firmware, power state and storage controllers of the
+    server, the model and firmware come with the login, the rest from two
+    class queries sent at the same time.
+    '''
+    from imcsdk.imchandle import ImcHandle
+    from ansible.module_utils.cisco_imc import limit_requests, secure_param
+    from ansible.module_utils.cisco_imc_query import mo_accessor, resolve_classes
+
+    handle = ImcHandle(params['ip'], params['username'], params['password'],
+                       port=params['port'], secure=secure_param(params['secure']),
+                       proxy=params['proxy'])
+    limit_requests(handle, params['deadline'])
+    handle.login()
+    # logout clears both
+    server = dict(model=handle.model, firmware=str(handle.version), units=[],
+                  controllers=[])
+    try:
+        mos = resolve_classes(handle, ['computeRackUnit', 'storageController'],
+                              concurrency=2)
+    finally:
+        handle.logout()
+
+    for unit in mos['computeRackUnit']:
+        names, getter = mo_accessor(unit.__class__, UNIT_PROPERTIES)
+        server['units'].append(dict(zip(names, getter(unit)), dn=unit.dn))
+    for controller in mos['storageController']:
+        server['controllers'].append(dict(id=controller.id, type=controller.type,
+                                          model=controller.model))
+    return dict(server=server)
+
+
+class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
+
+    NAME = 'cisco_imc'
+
+    def verify_file(self, path):
+        return super(InventoryModule, self).verify_file(path) and \
+            path.endswith(('cisco_imc.yml', 'cisco_imc.yaml'))
+
+    def _host_params(self):
+        '''
+        Returns the login parameters of every server of hosts, ranges
+        expanded, named after the name of the entry or the ip.
+        '''
+        hosts = []
+        for entry in self.get_option('hosts'):
+            if isinstance(entry, string_types):
+                entry = dict(ip=entry)
+            if not isinstance(entry, dict) or not entry.get('ip'):
+                raise AnsibleParserError("invalid hosts entry %s, expected an ip "
+                                         "or a dict with ip" % entry)
+            ips = self._expand_hostpattern(entry['ip'])[0]
+            for ip in ips:
+                params = dict(ip=ip, name=entry.get('name') if len(ips) == 1 else None)
+                params['name'] = params['name'] or ip
+                for param in LOGIN_PARAMS:
+                    params[param] = entry.get(param, self.get_option(param))
+                hosts.append(params)
+        return hosts
+
+    def _collect(self, hosts):
+        '''
+        Returns {name: server or {'error': msg}} of every server of hosts,
+        max_workers at a time.
+        '''
+        from ansible.module_utils.cisco_imc_hosts import run_hosts
+
+        servers = {}
+        for result in run_hosts(hosts, collect_server,
+                                max_workers=self.get_option('max_workers'),
+                                timeout=self.get_option('timeout')):
+            if result.get('failed'):
+                servers[result['name']] = dict(ip=result['ip'], error=result['msg'])
+            else:
+                servers[result['name']] = dict(result['server'], ip=result['ip'])
+        return servers
+
+    def _add_group(self, host, key, value):
+        if value in (None, ''):
+            return
+        group = self._sanitize_group_name('%s%s_%s' % (self.get_option('group_prefix'),
+                                                       key, value))
+        self.inventory.add_group(group)
+        self.inventory.add_child(group, host)
+
+    def _populate(self, servers, hosts):
+        prefix = self.get_option('group_prefix')
+        group_by = self.get_option('group_by')
+        for login in hosts:
+            # the cache may still hold servers removed from hosts
+            name = login['name']
+            server = servers[name]
+            self.inventory.add_host(name)
+            self.inventory.set_variable(name, 'imc_ip', server['ip'])
+            if self.get_option('host_credentials'):
+                self.inventory.set_variable(name, 'imc_username', login.get('username'))
+                self.inventory.set_variable(name, 'imc_password', login.get('password'))
+            for param in ('port', 'secure', 'proxy'):
+                if login.get(param) is not None:
+                    self.inventory.set_variable(name, 'imc_' + param, login[param])
+
+            if 'error' in server:
+                group = self._sanitize_group_name(prefix + 'unreachable')
+                self.inventory.add_group(group)
+                self.inventory.add_child(group, name)
+                self.inventory.set_variable(name, 'imc_error', server['error'])
+                continue
+
+            unit = server['units'][0] if server['units'] else {}
+            host_vars = dict(imc_model=server['model'], imc_firmware=server['firmware'],
+                             imc_serial=unit.get('serial'), imc_uuid=unit.get('uuid'),
+                             imc_power=unit.get('oper_power'),
+                             imc_num_of_cpus=unit.get('num_of_cpus'),
+                             imc_memory_gb=int(unit.get('total_memory') or 0) // 1024,
+                             imc_units=server['units'],
+                             imc_controllers=server['controllers'],
+                             imc_controller_types=sorted(set(
+                                 each['type'] for each in server['controllers'])))
+            for var, value in host_vars.items():
+                self.inventory.set_variable(name, var, value)
+
+            if 'model' in group_by:
+                self._add_group(name, 'model', server['model'])
+            if 'firmware' in group_by:
+                self._add_group(name, 'firmware', server['firmware'])
+            if 'power' in group_by:
+                self._add_group(name, 'power', unit.get('oper_power'))
+            if 'controller' in group_by:
+                for controller_type in host_vars['imc_controller_types']:
+                    self._add_group(name, 'controller', controller_type)
+
+            strict = self.get_option('strict')
+            self._set_composite_vars(self.get_option('compose'), host_vars, name, strict)
+            self._add_host_to_composed_groups(self.get_option('groups'), host_vars, name,
+                                              strict)
+            self._add_host_to_keyed_groups(self.get_option('keyed_groups'), host_vars,
+                                           name, strict)
+
+    def parse(self, inventory, loader, path, cache=True):
+        super(InventoryModule, self).parse(inventory, loader, path, cache)
+        self._read_config_data(path)
+        hosts = self._host_params()
+
+        cache_key = self.get_cache_key(path)
+        user_cache_setting = self.get_option('cache')
+        attempt_to_read_cache = user_cache_setting and cache
+        cache_needs_update = user_cache_setting and not cache
+
+        servers = None
+        if attempt_to_read_cache:
+            try:
+                servers = self._cache[cache_key]
+            except KeyError:
+                cache_needs_update = True
+        if servers is None:
+            servers = self._collect(hosts)
+        else:
+            # servers added to hosts since the cache was written, and the
+            # ones unreachable then, which the cache leaves out
+            missing = [params for params in hosts if params['name'] not in servers]
+            if missing:
+                servers = dict(servers, **self._collect(missing))
+                cache_needs_update = True
+        if cache_needs_update:
+            self._cache[cache_key] = dict(
+                (name, server) for name, server in servers.items() if 'error' not in server)
+
+        self._populate(servers, hosts)
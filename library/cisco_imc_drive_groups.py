@@ -0,0 +1,201 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+ANSIBLE_METADATA = {'metadata_version': '1.1',
+                    'status': ['preview'],
+                    'supported_by': 'community'}
+
+DOCUMENTATION = r'''
+---
+module: cisco_imc_drive_groups
+short_description: Plans drive groups out of the unused physical drives of a Cisco IMC storage controller
+description:
+- Reads the physical drives of a storage controller once and plans the drive groups of virtual drives of a RAID
+  level, capacity and media type, without writing anything.
+- The drives are pooled by size, link speed and media type and every drive group is made of one pool, laid out in
+  the fewest spans the RAID level allows. Drive groups that do not fit fail the task before anything is created.
+- The drive_group option of cisco_imc_virtual_drive can be left out to plan the drive group the same way as the
+  virtual drive is created.
+options:
+  controller_type:
+    description:
+    - Type of the storage controller.
+    type: str
+    default: SAS
+  controller_slot:
+    description:
+    - Slot of the storage controller, i.e. C(MEZZ) or C(0) to C(9).
+    type: str
+    required: true
+  server_id:
+    description:
+    - Server id of UCS C3260 modular servers.
+    type: int
+    default: 1
+  raid_level:
+    description:
+    - RAID level of the drive group.
+    type: int
+    choices: [0, 1, 5, 6, 10, 50, 60]
+    default: 0
+  capacity:
+    description:
+    - Size the drive group has to hold at least, i.e. C(2 TB) or C(1.5 TB), the fewest drives holding it are taken, the
+      smaller drives first.
+    - Without capacity and drive_count every drive of the pool giving the most capacity is taken.
+    type: str
+  drive_count:
+    description:
+    - Number of drives of the drive group.
+    type: int
+  media_type:
+    description:
+    - Only use drives of this media type.
+    type: str
+    choices: [HDD, SSD]
+  drive_groups:
+    description:
+    - Several drive groups to plan instead, a list of dicts with raid_level, capacity, drive_count and media_type.
+    - Every drive group is planned out of the drives the ones before it left.
+    type: list
+  ip:
+    description:
+    - IP address of the IMC.
+    type: str
+  username:
+    description:
+    - Username used to login to the IMC.
+    type: str
+    default: admin
+  password:
+    description:
+    - Password used to login to the IMC.
+    type: str
+  port:
+    description:
+    - Port number to be used during connection.
+    type: str
+  secure:
+    description:
+    - True for secure connection, otherwise False.
+    type: str
+  proxy:
+    description:
+    - Proxy address to be used during connection.
+    type: str
+  server:
+    description:
+    - Session descriptor of cisco_imc_login, used instead of logging in.
+    type: dict
+requirements:
+- imcsdk
+author:
+- CiscoUcs (@CiscoUcs)
+version_added: '2.6'
+'''
+
+EXAMPLES = r'''
+- name: Plan a RAID 6 drive group of at least 8 TB out of the hard disks
+  cisco_imc_drive_groups:
+    controller_slot: MEZZ
+    raid_level: 6
+    capacity: 8 TB
+    media_type: HDD
+    ip: "{{ imc_ip }}"
+    username: "{{ imc_username }}"
+    password: "{{ imc_password }}"
+  register: planned
+
+- name: Create it
+  cisco_imc_virtual_drive:
+    controller_slot: MEZZ
+    raid_level: 6
+    drive_group: "{{ planned.drive_groups[0] }}"
+    virtual_drive_name: data
+    ip: "{{ imc_ip }}"
+    username: "{{ imc_username }}"
+    password: "{{ imc_password }}"
+'''
+
+RETURN = r'''
+drive_groups:
+    description: The drive group of every request, a list of spans of slots.
+    returned: always
+    type: list
+    sample: [[[1, 2, 3, 4, 5, 6]], [[7, 8, 9], [10, 11, 12]]]
+pools:
+    description: The unused drives by size, link speed and media type.
+    returned: always
+    type: list
+    sample: [{"size": "951766 MB", "link_speed": "12.0 Gb/s", "media_type": "HDD", "slots": [1, 2, 3]}]
+'''
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.cisco_imc import ImcConnection
+from ansible.module_utils.cisco_imc_storage import ControllerSnapshot, drive_pools, plan_drive_groups
+
+
+def main():
+    argument_spec = dict(
+        controller_type=dict(type='str', default='SAS'),
+        controller_slot=dict(type='str', required=True),
+        server_id=dict(type='int', default=1),
+        raid_level=dict(type='int', choices=[0, 1, 5, 6, 10, 50, 60], default=0),
+        capacity=dict(type='str'),
+        drive_count=dict(type='int'),
+        media_type=dict(type='str', choices=['HDD', 'SSD']),
+        drive_groups=dict(type='list'),
+        ip=dict(type='str'),
+        username=dict(type='str', default='admin'),
+        password=dict(type='str', no_log=True),
+        port=dict(type='str'),
+        secure=dict(type='str'),
+        proxy=dict(type='str'),
+        server=dict(type='dict'),
+    )
+
+    module = AnsibleModule(
+        argument_spec,
+        supports_check_mode=True,
+        mutually_exclusive=[
+            ['drive_groups', 'capacity'],
+            ['drive_groups', 'drive_count'],
+            ['drive_groups', 'media_type'],
+        ],
+    )
+
+    requests = module.params['drive_groups']
+    if requests is None:
+        requests = [dict((option, module.params[option])
+                         for option in ('raid_level', 'capacity', 'drive_count', 'media_type'))]
+
+    imc = ImcConnection(module)
+    imc.result = dict(changed=False)
+    imc.login()
+    try:
+        snapshot = ControllerSnapshot(imc.handle,
+                                      controller_type=module.params['controller_type'],
+                                      controller_slot=module.params['controller_slot'],
+                                      server_id=module.params['server_id'])
+    except Exception as e:
+        imc.logout()
+        module.fail_json(msg=str(e), **imc.result)
+    imc.logout()
+
+    imc.result['pools'] = [dict(size="%d MB" % (size >> 20), link_speed=speed, media_type=media, slots=slots)
+                           for (size, speed, media), slots
+                           in sorted(drive_pools(snapshot, snapshot.unused_slots()).items())]
+    try:
+        imc.result['drive_groups'] = plan_drive_groups(snapshot, requests)
+    except ValueError as e:
+        module.fail_json(msg=str(e), **imc.result)
+    module.exit_json(**imc.result)
+
+
+if __name__ == '__main__':
+    main()
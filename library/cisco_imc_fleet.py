@@ -0,0 +1,212 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+ANSIBLE_METADATA = {'metadata_version': '1.1',
+                    'status': ['preview'],
+                    'supported_by': 'community'}
+
+DOCUMENTATION = r'''
+---
+module: cisco_imc_fleet
+short_description: Configures Managed Objects on many Cisco IMC servers from one task
+description:
+- Applies an imc_managed_objects style objects tree to a list of IMC servers concurrently from a single process.
+- Every server is configured exactly like imc_managed_objects would, with its own session and its own result.
+- A failing or slow server does not stop the others, the task fails at the end if any server failed.
+- Run it once for the whole fleet, e.g. with C(run_once) or against localhost.
+options:
+  hosts:
+    description:
+    - List of servers to configure.
+    - Either an IP address or a dict with ip and optionally username, port, secure and proxy overriding the task level values.
+    - Passwords of single servers go into host_passwords, hosts is not hidden from the logs.
+    type: list
+    required: true
+  username:
+    description:
+    - Default username for the servers in hosts.
+  password:
+    description:
+    - Default password for the servers in hosts.
+  host_passwords:
+    description:
+    - Passwords of single servers by their ip, or their name when hosts gives one, overriding password.
+    type: dict
+  port:
+    description:
+    - Default port for the servers in hosts.
+  secure:
+    description:
+    - Default secure setting for the servers in hosts.
+  proxy:
+    description:
+    - Default proxy for the servers in hosts.
+  objects:
+    description:
+    - List of managed objects to configure, see imc_managed_objects.
+    - Either objects or json_config_file must be specified.
+  json_config_file:
+    description:
+    - Filename (absolute path) of a JSON configuration file, see imc_managed_objects.
+    - Either objects or json_config_file must be specified.
+  state:
+    description:
+    - See imc_managed_objects.
+    choices: [present, absent]
+    default: present
+  prefetch:
+    description:
+    - See imc_managed_objects.
+    type: bool
+    default: false
+  transaction:
+    description:
+    - See imc_managed_objects.
+    type: bool
+    default: false
+  transaction_size:
+    description:
+    - See imc_managed_objects.
+    type: int
+    default: 10
+  max_workers:
+    description:
+    - Number of servers configured at the same time.
+    type: int
+    default: 10
+  timeout:
+    description:
+    - Seconds a single server may take, from login to logout.
+    - No request is sent to a server after that, it is reported as failed once the request it was waiting for ended.
+      Changes it had already sent are not rolled back.
+    type: int
+    default: 300
+requirements:
+- imcsdk
+author:
+- CiscoUcs (@CiscoUcs)
+version_added: '2.6'
+'''
+
+EXAMPLES = r'''
+- name: NTP config on every server
+  cisco_imc_fleet:
+    hosts: "{{ groups['imc'] | map('extract', hostvars, 'ansible_host') | list }}"
+    username: admin
+    password: password
+    objects:
+    - {
+      "module": "imcsdk.mometa.comm.CommNtpProvider",
+      "class": "CommNtpProvider",
+      "properties": {
+          "parent_mo_or_dn": "sys/svc-ext",
+          "ntp_enable": "yes",
+          "ntp_server1": "ntp.esl.cisco.com"
+      }
+    }
+  delegate_to: localhost
+  run_once: true
+'''
+
+RETURN = r'''
+results:
+    description: Result of every server, in the order of hosts.
+    returned: always
+    type: list
+    sample: [{"ip": "192.168.1.1", "changed": true, "failed": false, "changes": []}]
+failed_hosts:
+    description: Servers that failed or timed out.
+    returned: always
+    type: list
+'''
+
+from copy import deepcopy
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.cisco_imc import ImcConnection
+from ansible.module_utils.cisco_imc_hosts import host_params, run_hosts
+from ansible.module_utils.cisco_imc_mo import apply_objects, load_objects
+
+
+def configure_host(module, params, objects):
+    imc = ImcConnection(module, params=params)
+    imc.result = {}
+    try:
+        imc.connect()
+        try:
+            failed = apply_objects(module, imc, objects)
+        finally:
+            imc.logout()
+        imc.result['failed'] = bool(failed)
+        if failed:
+            imc.result['msg'] = "transaction failed for: %s" % ", ".join(
+                result['dn'] for result in failed)
+    except Exception as e:
+        imc.result['failed'] = True
+        imc.result['msg'] = str(e)
+    return imc.result
+
+
+def main():
+    argument_spec = dict(
+        hosts=dict(type='list', required=True),
+        username=dict(type='str'),
+        password=dict(type='str', no_log=True),
+        host_passwords=dict(type='dict', no_log=True),
+        port=dict(type='str'),
+        secure=dict(type='str'),
+        proxy=dict(type='str'),
+        objects=dict(type='list'),
+        json_config_file=dict(type='str'),
+        state=dict(type='str', choices=['present', 'absent'], default='present'),
+        prefetch=dict(type='bool', default=False),
+        transaction=dict(type='bool', default=False),
+        transaction_size=dict(type='int', default=10),
+        max_workers=dict(type='int', default=10),
+        timeout=dict(type='int', default=300),
+    )
+
+    module = AnsibleModule(
+        argument_spec,
+        supports_check_mode=True,
+        required_one_of=[
+            ['objects', 'json_config_file'],
+        ],
+        mutually_exclusive=[
+            ['objects', 'json_config_file'],
+        ],
+    )
+
+    result = dict(changed=False, results=[], failed_hosts=[])
+    try:
+        objects = load_objects(module.params)
+        hosts = [host_params(module, host) for host in module.params['hosts']]
+    except Exception as e:
+        module.fail_json(msg="setup error: %s " % str(e), **result)
+
+    def work(params):
+        # traverse_objects fills in parent dns, every server gets its own copy
+        return configure_host(module, params, deepcopy(objects))
+
+    result['results'] = run_hosts(hosts, work,
+                                  max_workers=module.params['max_workers'],
+                                  timeout=module.params['timeout'])
+
+    for host_result in result['results']:
+        if host_result.get('changed'):
+            result['changed'] = True
+        if host_result.get('failed'):
+            result['failed_hosts'].append(host_result['ip'])
+
+    if result['failed_hosts']:
+        module.fail_json(msg="failed on: %s" % ", ".join(result['failed_hosts']),
+                         **result)
+    module.exit_json(**result)
+
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,101 @@ short_description: Collect CIMC inventory
 version_added: ""
 description:
     - Puts CIMC inventory information into cimc_inventory host's variable.
+    - With hosts, collects the inventory of many servers concurrently from
+      one task into cimc_fleet_inventory or a fleet document.
+options:
+    hosts:
+        description:
+            - Servers to collect the inventory of instead of ip, either an IP
+              address or a dict with ip and optionally name, username,
+              port, secure and proxy overriding the task level values.
+            - The inventory of every server is keyed by its name, the ip by
+              default.
+            - Passwords of single servers go into host_passwords, hosts is
+              not hidden from the logs.
+            - A failing server does not stop the others, the task fails at
+              the end if any server failed, with output_file written for
+              the servers collected.
+        required: false
+    host_passwords:
+        description:
+            - Passwords of single servers by their ip, or their name when
+              hosts gives one, overriding password.
+        required: false
+    group:
+        description:
+            - Inventory group whose hosts are collected, expanded into hosts
+              by the cisco_imc_inventory action plugin. The address comes
+              from imc_ip, ansible_host or the inventory name and the
+              credentials from imc_username/imc_password or
+              username/password of every host, the passwords are passed in
+              host_passwords.
+        required: false
+    max_workers:
+        description:
+            - Number of servers collected at the same time.
+        default: 10
+    timeout:
+        description:
+            - Seconds after which a single server is given up, the others
+              are not affected.
+        default: 300
+    output_file:
+        description:
+            - Write the fleet document, C({"hosts": {name: inventory},
+              "failed": {name: error}}), to this file as the servers
+              complete instead of returning cimc_fleet_inventory, gzip
+              compressed when the name ends with C(.gz).
+        required: false
+    sections:
+        description:
+            - Only collect these sections of the inventory, the others are
+              not queried.
+            - By default all of them are collected.
+        choices: ["cpu", "memory", "psu", "pci", "vic", "lom", "tpm",
+                  "storage", "disks", "vNICs", "vHBAs"]
+        required: false
+    concurrency:
+        description:
+            - Number of class queries of a server sent at the same time,
+              the IMC resolves one class per request.
+        default: 4
+    incremental:
+        description:
+            - Keep a snapshot of every server's inventory
+              (C(CISCO_IMC_INVENTORY_CACHE), default
+              C(~/.ansible/cisco_imc/inventory)) with a fingerprint per
+              section and only fetch the sections that changed since.
+            - The CPU, memory, VIC, vNIC and vHBA counters and the serial
+              number of computeRackUnit are read first, one request, and
+              decide which of these sections changed. The other sections
+              (disks, storage, psu, pci, lom, tpm) have no counter and are
+              fetched again once older than I(max_age), and every section
+              when the server's serial or uuid changed.
+            - Returns changed_sections and fetched_sections and reports
+              changed when a section's fingerprint changed.
+        type: bool
+        default: false
+    max_age:
+        description:
+            - Seconds the sections without a counter are taken from the
+              snapshot, 0 fetches them on every run.
+        default: 604800
+    cache:
+        description:
+            - C(prefer) serves the queries from the controller side query
+              cache (C(CISCO_IMC_QUERY_CACHE), default
+              C(~/.ansible/cisco_imc/queries)) and stores what it had to
+              fetch, C(only) never contacts the server and fails on
+              anything not cached, C(bypass) does not use the cache.
+            - Writes of any module drop the cached queries they affect.
+        choices: ["bypass", "prefer", "only"]
+        default: "bypass"
+    cache_ttl:
+        description:
+            - Seconds a cached query stays valid, volatile classes
+              (power state, storage operations, faults) expire sooner.
+        default: 300
 
 requirements: ['imcsdk']
 author: "Nikolay Fedotov (nfedotov@cisco.com)"
@@ -20,12 +115,206 @@ EXAMPLES = '''
     ip: "192.168.1.1"
     username: "admin"
     password: "password"
+
+- name: Gather CIMC inventory, reusing recent reads
+  cisco_imc_inventory:
+    ip: "192.168.1.1"
+    username: "admin"
+    password: "password"
+    cache: prefer
+
+- name: Gather the CPU and memory inventory only
+  cisco_imc_inventory:
+    ip: "192.168.1.1"
+    username: "admin"
+    password: "password"
+    sections: [cpu, memory]
+
+- name: Gather CIMC inventory, only fetching the sections that changed
+  cisco_imc_inventory:
+    ip: "192.168.1.1"
+    username: "admin"
+    password: "password"
+    incremental: true
+  register: inventory
+
+- name: Gather the inventory of every server of the cimc group into one file
+  cisco_imc_inventory:
+    group: cimc
+    max_workers: 50
+    timeout: 120
+    output_file: "fleet_inventory.json.gz"
+  delegate_to: localhost
+  run_once: true
+
+- name: Gather the inventory of a list of servers
+  cisco_imc_inventory:
+    hosts:
+      - 192.168.1.1
+      - {ip: 192.168.1.2, name: rack2}
+    username: "admin"
+    password: "password"
+    host_passwords:
+      rack2: "other"
+  delegate_to: localhost
+  run_once: true
 '''
 
+RETURN = '''
+results:
+    description: ip, name, elapsed seconds and error of every server, with hosts
+    returned: with hosts
+    type: list
+failed_hosts:
+    description: names of the servers whose inventory could not be collected
+    returned: with hosts
+    type: list
+changed_sections:
+    description: sections whose content changed since the last run, per server in results with hosts
+    returned: with incremental
+    type: list
+fetched_sections:
+    description: sections queried from the server, per server in results with hosts
+    returned: with incremental
+    type: list
+output_file:
+    description: path of the fleet document
+    returned: with output_file
+    type: str
+'''
+
+import json
+import os
+import threading
+
+
+class FleetDocument(object):
+    '''
+    Writes the inventory of every server to a JSON document as it comes in,
+    so only the servers still being collected are held in memory.
+    '''
+
+    def __init__(self, output_file):
+        from ansible.module_utils.cisco_imc_query import open_output
+
+        self.lock = threading.Lock()
+        self.out, self.tmp_path = open_output(output_file)
+        self.count = 0
+        self._write('{"hosts": {')
+
+    def _write(self, data):
+        self.out.write(data.encode('utf-8'))
+
+    def add(self, name, inventory):
+        data = json.dumps(name) + ": " + json.dumps(inventory)
+        with self.lock:
+            self._write((", " if self.count else "") + data)
+            self.count += 1
+
+    def close(self, failed):
+        self._write('}, "failed": %s}\n' % json.dumps(failed))
+        self.out.close()
+
+    def discard(self):
+        if not self.out.closed:
+            self.out.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def gather(module, server):
+    '''
+    Returns the collect_inventory result of server, with incremental only
+    the sections its snapshot does not cover are fetched.
+    '''
+    from ansible.module_utils.cisco_imc import inventory_cache
+    from ansible.module_utils.cisco_imc_inventory import collect_inventory
+
+    sections = module.params['sections']
+    concurrency = module.params['concurrency']
+    if not module.params['incremental']:
+        return dict(inventory=collect_inventory(
+            server, sections=sections, concurrency=concurrency)['inventory'])
+
+    cache = inventory_cache()
+    result = collect_inventory(server, snapshot=cache.get(server.uri) or {},
+                               sections=sections, concurrency=concurrency,
+                               max_age=module.params['max_age'])
+    cache.set(server.uri, result.pop('snapshot'))
+    result['changed'] = bool(result['changed_sections'])
+    return result
+
+
+def collect_host(module, params):
+    from ansible.module_utils.cisco_imc import ImcConnection
+
+    conn = ImcConnection(module, params=params)
+    server = conn.connect()
+    try:
+        return gather(module, server)
+    finally:
+        conn.logout()
+
+
+def collect_fleet(module):
+    from ansible.module_utils.cisco_imc_hosts import host_params, run_hosts
+
+    result = dict(changed=False, results=[], failed_hosts=[])
+    try:
+        hosts = [host_params(module, host) for host in module.params['hosts']]
+    except ValueError as e:
+        module.fail_json(msg=str(e), **result)
+    output_file = module.params['output_file']
+    document = FleetDocument(output_file) if output_file else None
+    inventories = {}
+
+    def work(params):
+        return collect_host(module, params)
+
+    def on_result(host_result):
+        # only the summary of every server stays in results
+        inventory = host_result.pop('inventory', None)
+        if inventory is None:
+            return
+        if document:
+            document.add(host_result['name'], inventory)
+        else:
+            inventories[host_result['name']] = inventory
+
+    try:
+        result['results'] = run_hosts(hosts, work,
+                                      max_workers=module.params['max_workers'],
+                                      timeout=module.params['timeout'],
+                                      on_result=on_result)
+        failed = {}
+        for host_result in result['results']:
+            if host_result.get('changed'):
+                result['changed'] = True
+            if host_result.get('failed'):
+                result['failed_hosts'].append(host_result['name'])
+                failed[host_result['name']] = host_result.get('msg')
+
+        if document:
+            document.close(failed)
+            module.atomic_move(document.tmp_path,
+                               os.path.abspath(output_file))
+            result['changed'] = True
+            result['output_file'] = output_file
+        else:
+            result['ansible_facts'] = dict(cimc_fleet_inventory=inventories)
+    except Exception as e:
+        if document:
+            document.discard()
+        module.fail_json(msg="setup error: %s " % str(e), **result)
+
+    if result['failed_hosts']:
+        module.fail_json(msg="failed on: %s"
+                         % ", ".join(result['failed_hosts']), **result)
+    module.exit_json(**result)
+
 
 def main():
     from ansible.module_utils.cisco_imc import ImcConnection
-    from imcsdk.apis.server.inventory import inventory_get
     module = AnsibleModule(
         argument_spec=dict(
             # ImcHandle
@@ -37,16 +326,46 @@ def main():
             password=dict(required=False, type='str', no_log=True),
             port=dict(required=False, default=None),
             secure=dict(required=False, default=None),
-            proxy=dict(required=False, default=None)
+            proxy=dict(required=False, default=None),
+
+            # several servers at once
+            hosts=dict(required=False, type='list'),
+            host_passwords=dict(required=False, type='dict', no_log=True),
+            max_workers=dict(required=False, type='int', default=10),
+            timeout=dict(required=False, type='int', default=300),
+            output_file=dict(required=False, type='path'),
+
+            sections=dict(required=False, type='list',
+                          choices=["cpu", "memory", "psu", "pci", "vic",
+                                   "lom", "tpm", "storage", "disks",
+                                   "vNICs", "vHBAs"]),
+            concurrency=dict(required=False, type='int', default=4),
+
+            # only fetch what changed since the last run
+            incremental=dict(required=False, type='bool', default=False),
+            max_age=dict(required=False, type='int', default=604800),
+
+            cache=dict(required=False, default="bypass",
+                       choices=["bypass", "prefer", "only"]),
+            cache_ttl=dict(required=False, type='int', default=300)
         ),
+        mutually_exclusive=[['hosts', 'ip'], ['hosts', 'server']],
         supports_check_mode=False
     )
 
+    if module.params['hosts'] is not None:
+        collect_fleet(module)
+
     conn = ImcConnection(module)
     server = conn.login()
-    inventory = inventory_get(server)
-    conn.logout()
-    module.exit_json(ansible_facts=dict(cimc_inventory=inventory[server.ip]))
+    try:
+        result = gather(module, server)
+    except Exception as e:
+        module.fail_json(msg=str(e))
+    finally:
+        conn.logout()
+    inventory = result.pop('inventory')
+    module.exit_json(ansible_facts=dict(cimc_inventory=inventory), **result)
 
 
 if __name__ == '__main__':
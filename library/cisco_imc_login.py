@@ -10,6 +10,11 @@ version_added: "0.9.0.0"
 description:
   - Logs in to a cisco IMC server
   - Executes the aaaLogin method provided by the IMC Server
+  - Returns a serializable session descriptor in C(server) that later tasks
+    accept as their C(server) parameter instead of logging in again.
+    The descriptor is also kept in an on-disk cache (C(CISCO_IMC_SESSION_CACHE),
+    default C(~/.ansible/cisco_imc/sessions)) so that refreshes done by one
+    task are seen by the next one.
 
 requirements: ['imcsdk']
 author: "Vikrant Balyan(vvb@cisco.com)"
@@ -25,6 +30,14 @@ EXAMPLES = '''
       ip=192.168.1.1
       username=admin
       password=password
+    register: login
+
+  - name: enable ntp
+    cisco_imc_ntp:
+      ntp_servers:
+        - {"id": "1", "ip": "192.168.1.10"}
+      state: "present"
+      server: "{{ login.server }}"
 '''
 
 
@@ -37,6 +50,7 @@ def imc_login(module):
 
     Returns:
         (server(ImcHandle), results(dict), error(bool))
+        results["server"] holds the session descriptor
 
     '''
     ansible = module.params
@@ -53,17 +67,27 @@ def imc_login(module):
 
 def _login(ip, username, password, port=None, secure=None, proxy=None):
     from imcsdk.imchandle import ImcHandle
+    from ansible.module_utils.cisco_imc import session_descriptor
+    from ansible.module_utils.cisco_imc import cache_session
+    from ansible.module_utils.cisco_imc import session_cache
+    from ansible.module_utils.cisco_imc import secure_param
     results = {}
+    server = None
     try:
-        server = ImcHandle(ip, username, password, port, secure, proxy)
+        server = ImcHandle(ip, username, password, port,
+                           secure_param(secure), proxy)
         server.login()
+        descriptor = session_descriptor(server, port=port, secure=secure,
+                                        proxy=proxy)
+        cache_session(descriptor)
+        session_cache().purge()
     except Exception as e:
         results["msg"] = str(e)
         return server, results, True
 
     results["msg"] = "login succeded"
     results["changed"] = False
-    results["server"] = server
+    results["server"] = descriptor
     return server, results, False
 
 
@@ -72,7 +96,7 @@ def main():
         argument_spec=dict(
             ip=dict(required=True, type='str'),
             username=dict(required=False, default="admin", type='str'),
-            password=dict(required=True, type='str'),
+            password=dict(required=True, type='str', no_log=True),
             port=dict(required=False, default=None),
             secure=dict(required=False, default=None),
             proxy=dict(required=False, default=None)
@@ -10,6 +10,8 @@ version_added: "0.9.0.0"
 description:
   - Logs out of a cisco IMC server
   - Executes the aaaLogout method provided by the IMC Server
+  - Takes the session descriptor returned by cisco_imc_login and removes
+    it from the session cache
 
 requirements: ['imcsdk']
 author: "Vikrant Balyan(vvb@cisco.com)"
@@ -22,27 +24,37 @@ EXAMPLES = '''
   tasks:
   - name: logout from the server
     cisco_imc_logout:
-      server=frozen_server_handle
+      server: "{{ login.server }}"
 '''
 
 
 def imc_logout(module):
+    from ansible.module_utils.cisco_imc import ImcConnection
+    from ansible.module_utils.cisco_imc import forget_session
+
     results = {}
     results['changed'] = False
 
-    imc = module.params.get('server')
-    if imc:
-        imc.logout()
-        return results, False
+    descriptor = module.params.get('server')
+    if not descriptor:
+        results["msg"] = "server is a required parameter"
+        return results, True
 
-    results["msg"] = "server is a required parameter"
-    return results, True
+    conn = ImcConnection(module)
+    try:
+        server = conn.resume(descriptor)
+        server.logout()
+    except Exception as e:
+        # an expired session is as good as logged out
+        results["msg"] = str(e)
+    forget_session(descriptor)
+    return results, False
 
 
 def main():
     module = AnsibleModule(
         argument_spec=dict(
-            server=dict(required=True)
+            server=dict(required=True, type='dict')
         ),
         supports_check_mode=True
     )
@@ -0,0 +1,312 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+ANSIBLE_METADATA = {'metadata_version': '1.1',
+                    'status': ['preview'],
+                    'supported_by': 'community'}
+
+DOCUMENTATION = r'''
+---
+module: cisco_imc_power_fleet
+short_description: Rolls a power state out to many Cisco IMC servers from one task
+description:
+- Takes every server of hosts to a power state like cisco_imc_server does, concurrently from a single process, and
+  reports how long every server took.
+- The servers are powered in waves of wave_size, a wave starts once the one before it ended. Within a wave at most
+  max_in_flight servers, and at most max_per_group servers of the same group (a rack or a PDU), are powered at a
+  time, and a server starts stagger seconds after the one before it at the earliest, so a fleet does not draw its
+  inrush current or PXE boot all at once.
+- Every server waits for its power state on the IMC event channel and makes room for the next one as soon as the IMC
+  reports it, see cisco_imc_server.
+- A failing or slow server does not stop the others, the task fails at the end if any server failed.
+- Run it once for the whole fleet, e.g. with C(run_once) or against localhost.
+options:
+  hosts:
+    description:
+    - List of servers to power.
+    - Either an IP address or a dict with ip and optionally name, group, username, port, secure and proxy overriding
+      the task level values.
+    - Passwords of single servers go into host_passwords, hosts is not hidden from the logs.
+    type: list
+    required: true
+  state:
+    description:
+    - Power state of the servers, see cisco_imc_server.
+    type: str
+    choices: ['on', 'shutdown', 'off', 'reset', 'boot']
+    required: true
+  server_id:
+    description:
+    - Server id of UCS C3260 modular servers.
+    type: int
+    default: 1
+  wave_size:
+    description:
+    - Number of servers per wave, 0 puts all of them into one wave.
+    type: int
+    default: 0
+  max_fail_percentage:
+    description:
+    - The waves after one in which more than this percentage of servers failed are not started, their servers are
+      reported as skipped.
+    type: int
+  max_in_flight:
+    description:
+    - Number of servers powered at the same time.
+    type: int
+    default: 10
+  max_per_group:
+    description:
+    - Number of servers of the same group of hosts powered at the same time, 0 is unlimited.
+    type: int
+    default: 0
+  stagger:
+    description:
+    - Seconds between the starts of two servers at least.
+    type: float
+    default: 0
+  timeout:
+    description:
+    - Seconds to wait for every power change of a server, reset and boot take two.
+    - A server that takes longer than two timeouts and a minute, login included, is reported as failed, no request is
+      sent to it after that and it keeps its place in max_in_flight and max_per_group until its last request ended.
+    type: int
+    default: 60
+  interval:
+    description:
+    - Longest seconds between two polls of the power state, see cisco_imc_server.
+    type: int
+    default: 5
+  events:
+    description:
+    - Wait for the power state on the IMC event channel, only poll it when false.
+    type: bool
+    default: true
+  username:
+    description:
+    - Default username for the servers in hosts.
+  password:
+    description:
+    - Default password for the servers in hosts.
+  host_passwords:
+    description:
+    - Passwords of single servers by their ip, or their name when hosts gives one, overriding password.
+    type: dict
+  port:
+    description:
+    - Default port for the servers in hosts.
+  secure:
+    description:
+    - Default secure setting for the servers in hosts.
+  proxy:
+    description:
+    - Default proxy for the servers in hosts.
+requirements:
+- imcsdk
+author:
+- CiscoUcs (@CiscoUcs)
+version_added: '2.6'
+'''
+
+EXAMPLES = r'''
+- name: Reboot the fleet, 50 servers at a time, 4 per rack, one every 2 seconds
+  cisco_imc_power_fleet:
+    hosts:
+    - {ip: 192.168.1.1, group: rack-a1}
+    - {ip: 192.168.1.2, group: rack-a1}
+    - {ip: 192.168.2.1, group: rack-a2}
+    state: reset
+    max_in_flight: 50
+    max_per_group: 4
+    stagger: 2
+    username: admin
+    password: password
+  delegate_to: localhost
+  run_once: true
+
+- name: Power on in waves of 100, stop when more than 10 percent of a wave fail
+  cisco_imc_power_fleet:
+    hosts: "{{ groups['imc'] | map('extract', hostvars, 'ansible_host') | list }}"
+    state: "on"
+    wave_size: 100
+    max_fail_percentage: 10
+    max_in_flight: 25
+    username: admin
+    password: password
+  delegate_to: localhost
+  run_once: true
+'''
+
+RETURN = r'''
+results:
+    description:
+    - Result of every server, in the order of hosts, with its wave, group, started (seconds after the task started),
+      elapsed, previous_state, power_state, transition_time and transitions, see cisco_imc_server.
+    returned: always
+    type: list
+    sample: [{"ip": "192.168.1.1", "name": "192.168.1.1", "group": "rack-a1", "wave": 1, "changed": true,
+              "started": 0.0, "elapsed": 48.2, "previous_state": "on", "power_state": "on",
+              "transition_time": 47.9, "events": true}]
+timing:
+    description: Number of servers that changed power state and their shortest, mean and longest transition_time.
+    returned: always
+    type: dict
+    sample: {"hosts": 600, "min": 21.4, "mean": 38.2, "max": 71.9}
+elapsed:
+    description: Seconds the whole rollout took.
+    returned: always
+    type: float
+waves:
+    description: Number of waves started.
+    returned: always
+    type: int
+failed_hosts:
+    description: Names of the servers that failed or timed out.
+    returned: always
+    type: list
+skipped_hosts:
+    description: Names of the servers of the waves not started after max_fail_percentage was exceeded.
+    returned: always
+    type: list
+'''
+
+import time
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.cisco_imc import ImcConnection
+from ansible.module_utils.cisco_imc_hosts import host_params, run_rolling
+from ansible.module_utils.cisco_imc_power import set_power_state
+
+# seconds a server may take for login and logout on top of its transitions
+HOST_TIMEOUT_MARGIN = 60
+
+
+def power_host(module, params):
+    imc = ImcConnection(module, params=params)
+    imc.result = {}
+    try:
+        imc.connect()
+        try:
+            imc.result.update(set_power_state(
+                imc.handle, module.params['state'],
+                server_id=module.params['server_id'],
+                timeout=module.params['timeout'],
+                max_interval=module.params['interval'],
+                events=module.params['events'],
+                check_mode=module.check_mode))
+        finally:
+            imc.logout()
+        imc.result['failed'] = not imc.result['finished']
+        if imc.result['failed']:
+            imc.result['msg'] = "power %s did not complete within %d seconds" % (
+                module.params['state'], module.params['timeout'])
+    except Exception as e:
+        imc.result['failed'] = True
+        imc.result['msg'] = str(e)
+    return imc.result
+
+
+def timing(results):
+    times = [result['transition_time'] for result in results
+             if result.get('changed') and result.get('transitions')
+             and not result.get('failed')]
+    if not times:
+        return dict(hosts=0, min=None, mean=None, max=None)
+    return dict(hosts=len(times), min=min(times),
+                mean=round(sum(times) / len(times), 3), max=max(times))
+
+
+def main():
+    argument_spec = dict(
+        hosts=dict(type='list', required=True),
+        state=dict(type='str', choices=['on', 'shutdown', 'off', 'reset', 'boot'], required=True),
+        server_id=dict(type='int', default=1),
+        wave_size=dict(type='int', default=0),
+        max_fail_percentage=dict(type='int'),
+        max_in_flight=dict(type='int', default=10),
+        max_per_group=dict(type='int', default=0),
+        stagger=dict(type='float', default=0),
+        timeout=dict(type='int', default=60),
+        interval=dict(type='int', default=5),
+        events=dict(type='bool', default=True),
+        username=dict(type='str'),
+        password=dict(type='str', no_log=True),
+        host_passwords=dict(type='dict', no_log=True),
+        port=dict(type='str'),
+        secure=dict(type='str'),
+        proxy=dict(type='str'),
+    )
+
+    module = AnsibleModule(
+        argument_spec,
+        supports_check_mode=True,
+    )
+
+    result = dict(changed=False, results=[], waves=0, failed_hosts=[], skipped_hosts=[])
+    if module.params['max_in_flight'] < 1:
+        module.fail_json(msg="max_in_flight must be at least 1", **result)
+    if module.params['max_per_group'] < 0:
+        module.fail_json(msg="max_per_group must be 0 (unlimited) or more", **result)
+    try:
+        hosts = []
+        for host in module.params['hosts']:
+            params = host_params(module, host)
+            params['group'] = host.get('group') if isinstance(host, dict) else None
+            hosts.append(params)
+    except Exception as e:
+        module.fail_json(msg="setup error: %s " % str(e), **result)
+
+    started = time.time()
+
+    def work(params):
+        host_result = dict(started=round(time.time() - started, 3))
+        host_result.update(power_host(module, params))
+        return host_result
+
+    wave_size = module.params['wave_size'] or len(hosts) or 1
+    max_fail_percentage = module.params['max_fail_percentage']
+    stopped = False
+    for first in range(0, len(hosts), wave_size):
+        wave = hosts[first:first + wave_size]
+        number = first // wave_size + 1
+        if stopped:
+            for params in wave:
+                result['results'].append(dict(ip=params['ip'], name=params['name'],
+                                              group=params['group'], wave=number,
+                                              changed=False, skipped=True))
+                result['skipped_hosts'].append(params['name'])
+            continue
+
+        wave_results = run_rolling(wave, work,
+                                   max_in_flight=module.params['max_in_flight'],
+                                   max_per_group=module.params['max_per_group'],
+                                   stagger=module.params['stagger'],
+                                   timeout=2 * module.params['timeout'] + HOST_TIMEOUT_MARGIN)
+        result['waves'] = number
+        failed = 0
+        for params, host_result in zip(wave, wave_results):
+            host_result.update(group=params['group'], wave=number)
+            if host_result.get('changed'):
+                result['changed'] = True
+            if host_result.get('failed'):
+                result['failed_hosts'].append(host_result['name'])
+                failed += 1
+        result['results'].extend(wave_results)
+        if max_fail_percentage is not None and \
+                100.0 * failed / len(wave) > max_fail_percentage:
+            stopped = True
+
+    result['timing'] = timing(result['results'])
+    result['elapsed'] = round(time.time() - started, 3)
+    if result['failed_hosts']:
+        module.fail_json(msg="failed on: %s" % ", ".join(result['failed_hosts']),
+                         **result)
+    module.exit_json(**result)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,30 +5,44 @@ from ansible.module_utils.basic import *
 DOCUMENTATION = '''
 ---
 module: cisco_imc_server
-short_description: Configures sol on a Cisco IMC Server
+short_description: Controls the power and the locator LED of a Cisco IMC Server
 version_added: "0.9.0.0"
 description:
-    - Configures the Serial Over Lan(SOL) service on a Cisco IMC Server
+    - Powers a Cisco IMC Server on, off or down gracefully, resets it and
+      turns its locator LED on or off.
+    - Power changes wait until the server reached the state. The IMC event
+      channel reports it as soon as it happens where the firmware supports
+      it, the power state is polled meanwhile with growing intervals in case
+      the event gets lost, or instead when there is no event channel.
 Input Params:
     state:
-        description: speed of the connection
+        description: power state of the server, reset and boot (of a
+            powered on server) power it down and up again
         required: False
         choices: ["on", "shutdown", "off", "reset", "boot"]
 
-    indicator_led:
-        description: enable or disable indicator_led
+    locator_led:
+        description: enable or disable the locator led, indicator_led is an
+            alias
         required: False
         choices: ["on", "off"]
 
     timeout:
-        description: number of seconds to wait for state change
+        description: number of seconds to wait for each state change
         required: False
         default: 60
 
     interval:
-        description: number of seconds to wait for between state change valudation tests
+        description: longest number of seconds between two polls of the power
+            state, the first poll is after half a second and the interval
+            doubles up to this one
         default: 5
 
+    events:
+        description: wait for the power state on the IMC event channel, only
+            poll it when False
+        default: True
+
     server_id:
         description: Server Id to be specified for C3260 platforms
         required: False
@@ -40,7 +54,9 @@ Input Params:
 
 notes:
     - check_mode supported for power but not LED status
-    - returns power_state
+    - returns power_state, previous_state and transition_time, the seconds
+      from the power action until the server was in state, and transitions,
+      the timing of every step
 requirements: ['imcsdk']
 author: "Branson Matheson (brmathes@cisco.com)"
 '''
@@ -56,7 +72,7 @@ EXAMPLES = '''
 - name: shutdown and enable indicator
   cisco_imc_server:
     state: shutdown
-    indicator_led: on
+    locator_led: "on"
     timeout: 300
     ip: "192.168.1.1"
     username: "admin"
@@ -65,69 +81,52 @@ EXAMPLES = '''
 '''
 
 
-def setup_server_power(server, module, status, timeout, interval):
-    from imcsdk.apis.server.serveractions import server_power_state_get
-    from imcsdk.apis.server.serveractions import server_power_up
-    from imcsdk.apis.server.serveractions import server_power_down
-    from imcsdk.apis.server.serveractions import server_power_down_gracefully
-    from imcsdk.apis.server.serveractions import server_power_cycle
+def setup_server_power(server, module, state):
+    from ansible.module_utils.cisco_imc_power import set_power_state
 
     ansible = module.params
-    timeout, interval = ansible["timeout"], ansible["interval"]
-    server_id = ansible["server_id"]
-    changed = False
-
-    state = server_power_state_get(server, server_id=server_id)
-
-    if check_mode == True and state == "off":
-        if status == "on" or status == "boot":
-            changed = server_power_up(server, timeout=timeout, 
-                            interval=interval, serverid_=server_id)
-        
-    elif check_mode == True and state == "on":
-        if status == "shutdown":
-            changed = server_power_down_gracefully(server, timeout=timeout, 
-                            interval=interval, serverid_=server_id)
-        elif status == "off":
-            changed = server_power_down(server, timeout=timeout, 
-                            interval=interval, serverid_=server_id)
-        elif status == "boot" or status == "reset":
-             changed = server_power_cycle(server, timeout=timeout, 
-                            interval=interval, serverid_=server_id)
-            
-    return change, state
+    return set_power_state(server, state,
+                           server_id=ansible["server_id"],
+                           timeout=ansible["timeout"],
+                           max_interval=ansible["interval"],
+                           events=ansible["events"],
+                           check_mode=module.check_mode)
 
 
 def setup_server_led(server, module, locator_led):
     from imcsdk.apis.server.serveractions import locator_led_off
     from imcsdk.apis.server.serveractions import locator_led_on
 
+    ansible = module.params
     server_id, chassis_id = ansible["server_id"], ansible["chassis_id"]
-    
+
     # no method for determining current LED status.
-    if locator_led == "on": 
+    if module.check_mode:
+        return True
+    if locator_led == "on":
         locator_led_on(server,
                        server_id=server_id,
                        chassis_id=chassis_id)
     elif locator_led == "off":
-        locator_led_off(server, 
-                        server_id=server_id, 
+        locator_led_off(server,
+                        server_id=server_id,
                         chassis_id=chassis_id)
     return True
-    
+
 
 def setup_server(server, module):
     ansible = module.params
-    status, locator_led = ansible["status"], ansible["locator_led"]
-    
-    if status is not None:
-        power_changed, power_state = setup_server_power(
-            server, module, status, timeout, interval)
-        
+    state, locator_led = ansible["state"], ansible["locator_led"]
+    results = dict(changed=False)
+
+    if state is not None:
+        results.update(setup_server_power(server, module, state))
+
     if locator_led is not None:
         led_changed = setup_server_led(server, module, locator_led)
-            
-    return (power_changed or led_changed), power_state
+        results["changed"] = results["changed"] or led_changed
+
+    return results
 
 
 def setup(server, module):
@@ -135,9 +134,11 @@ def setup(server, module):
     err = False
 
     try:
-        results["changed"], results['power_state'] = setup_server(
-            server, module)
-
+        results = setup_server(server, module)
+        if not results.get("finished", True):
+            err = True
+            results["msg"] = "power %s did not complete within %d seconds" % (
+                module.params["state"], module.params["timeout"])
 
     except Exception as e:
         err = True
@@ -156,9 +157,11 @@ def main():
             state=dict(required=False, type='str',
                        choices=["on", "shutdown", "off", "reset", "boot"]),
             locator_led=dict(required=False, type='str',
-                       choices=["on", "off"]),
+                             choices=["on", "off"],
+                             aliases=["indicator_led"]),
             timeout=dict(type='int', default=60),
             interval=dict(type='int', default=5),
+            events=dict(type='bool', default=True),
 
             # ImcHandle
             server=dict(required=False, type='dict'),
@@ -0,0 +1,204 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+ANSIBLE_METADATA = {'metadata_version': '1.1',
+                    'status': ['preview'],
+                    'supported_by': 'community'}
+
+DOCUMENTATION = r'''
+---
+module: cisco_imc_storage_job
+short_description: Waits for the initialization of virtual drives created in the background
+description:
+- Reports the progress of the long running storage operations (background or full initialization) of the virtual
+  drives of a storage_job returned by cisco_imc_virtual_drive with background, and waits for them to end.
+- Every poll reads the storageOperation of all the drives with one query. Polls get closer as the IMC's estimate of
+  the remaining time gets shorter and further apart, up to max_interval, when the IMC gives no estimate.
+- Creating the drives of every host with background and waiting for them in a later task lets the initializations
+  of a fleet run at the same time.
+options:
+  job:
+    description:
+    - The storage_job returned by cisco_imc_virtual_drive.
+    type: dict
+    required: true
+  wait:
+    description:
+    - Wait until no operation of the job is in progress, otherwise report the progress once.
+    type: bool
+    default: true
+  timeout:
+    description:
+    - Seconds to wait, the task fails when the operations did not end by then.
+    type: int
+    default: 3600
+  min_interval:
+    description:
+    - Seconds between two polls at least.
+    type: int
+    default: 5
+  max_interval:
+    description:
+    - Seconds between two polls at most.
+    type: int
+    default: 60
+  ip:
+    description:
+    - IP address of the IMC, the one of the job by default.
+    type: str
+  username:
+    description:
+    - Username used to login to the IMC.
+    type: str
+    default: admin
+  password:
+    description:
+    - Password used to login to the IMC.
+    type: str
+  port:
+    description:
+    - Port number to be used during connection.
+    type: str
+  secure:
+    description:
+    - True for secure connection, otherwise False.
+    type: str
+  proxy:
+    description:
+    - Proxy address to be used during connection.
+    type: str
+  server:
+    description:
+    - Session descriptor of cisco_imc_login, used instead of logging in.
+    type: dict
+requirements:
+- imcsdk
+author:
+- CiscoUcs (@CiscoUcs)
+version_added: '2.6'
+'''
+
+EXAMPLES = r'''
+- name: Create the data drive, initialized in the background
+  cisco_imc_virtual_drive:
+    drive_group: [[1,2,3,4,5,6]]
+    raid_level: 6
+    controller_slot: "MEZZ"
+    background: true
+    ip: "{{ imc_ip }}"
+    username: "{{ imc_username }}"
+    password: "{{ imc_password }}"
+  register: vd
+
+- name: Wait for the initialization of the data drive
+  cisco_imc_storage_job:
+    job: "{{ vd.storage_job }}"
+    timeout: 7200
+    username: "{{ imc_username }}"
+    password: "{{ imc_password }}"
+
+- name: Report the progress without waiting
+  cisco_imc_storage_job:
+    job: "{{ vd.storage_job }}"
+    wait: false
+    username: "{{ imc_username }}"
+    password: "{{ imc_password }}"
+  register: progress
+  until: progress.finished
+  retries: 100
+  delay: 60
+'''
+
+RETURN = r'''
+finished:
+    description: No operation of the job is in progress.
+    returned: always
+    type: bool
+progress:
+    description: Progress of the whole job in percent, the mean of its virtual drives.
+    returned: always
+    type: int
+operations:
+    description: name, dn, operation, in_progress, progress, elapsed and remaining seconds of every virtual drive.
+    returned: always
+    type: list
+    sample: [{"name": "RAID6_123456", "dn": "sys/rack-unit-1/board/storage-SAS-MEZZ/vd-0",
+              "operation": "Background Initialization", "in_progress": true, "progress": 42,
+              "elapsed": 840, "remaining": 1160}]
+elapsed:
+    description: Seconds since the job was started.
+    returned: always
+    type: int
+polls:
+    description: Number of polls of the IMC.
+    returned: always
+    type: int
+'''
+
+import time
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.cisco_imc import ImcConnection
+from ansible.module_utils.cisco_imc_storage import job_operations, job_progress, poll_storage_job
+
+
+def main():
+    argument_spec = dict(
+        job=dict(type='dict', required=True),
+        wait=dict(type='bool', default=True),
+        timeout=dict(type='int', default=3600),
+        min_interval=dict(type='int', default=5),
+        max_interval=dict(type='int', default=60),
+        ip=dict(type='str'),
+        username=dict(type='str', default='admin'),
+        password=dict(type='str', no_log=True),
+        port=dict(type='str'),
+        secure=dict(type='str'),
+        proxy=dict(type='str'),
+        server=dict(type='dict'),
+    )
+
+    module = AnsibleModule(
+        argument_spec,
+        supports_check_mode=True,
+    )
+
+    job = module.params['job']
+    if 'virtual_drives' not in job:
+        module.fail_json(msg="job is not a storage_job of cisco_imc_virtual_drive")
+    if module.params['ip'] is None:
+        module.params['ip'] = job.get('ip')
+
+    imc = ImcConnection(module)
+    imc.result = dict(changed=False)
+    imc.login()
+    try:
+        if module.params['wait']:
+            finished, states, polls = poll_storage_job(
+                imc.handle, job, module.params['timeout'],
+                min_interval=module.params['min_interval'],
+                max_interval=module.params['max_interval'])
+        else:
+            states = job_operations(imc.handle, job)
+            finished = not any(state['in_progress'] for state in states)
+            polls = 1
+    except Exception as e:
+        imc.logout()
+        module.fail_json(msg=str(e), **imc.result)
+    imc.logout()
+
+    imc.result.update(finished=finished, progress=job_progress(states),
+                      operations=states, polls=polls,
+                      elapsed=int(time.time() - job.get('started', time.time())))
+    if module.params['wait'] and not finished:
+        module.fail_json(msg="storage operations still in progress after %d seconds"
+                         % module.params['timeout'], **imc.result)
+    module.exit_json(**imc.result)
+
+
+if __name__ == '__main__':
+    main()
@@ -20,7 +20,41 @@ options:
                 example - [[1]]
                         - [[1, 2]]
                         - [[1, 2],[3, 4]]
-    required: true
+                 Required unless virtual_drive_name or virtual_drives is given.
+                 Without it the drive group of a new virtual drive is planned
+                 from the unused drives of the controller, see capacity and
+                 drive_count, one of which is then required, and
+                 virtual_drive_name is required.
+    required: false
+
+  capacity:
+    description: Size the planned drive group has to hold at least, i.e. "1.5 TB".
+                 The fewest unused drives of the same size, speed and media type
+                 laid out for raid_level are taken, the smaller drives first.
+                 A virtual drive without drive_group, capacity and drive_count
+                 is only checked to exist, it is not created.
+    required: false
+
+  drive_count:
+    description: Number of drives of the planned drive group.
+    required: false
+
+  media_type:
+    description: Only plan the drive group out of these drives.
+    choices: ["HDD", "SSD"]
+    required: false
+
+  virtual_drives:
+    description: Virtual drives of the controller to create or delete in one task,
+                 a list of dicts with drive_group, raid_level, virtual_drive_name,
+                 state, boot_drive, size and the policies below, the task level
+                 values are the defaults of every entry.
+                 The physical and virtual drives of the controller are read once
+                 and every entry is checked against them (drives present, unused
+                 or freed by a delete of the same task, RAID layout, size) before
+                 anything is written. Then the deletes, the creates and the boot
+                 drive are done in that order within the same session.
+    required: false
 
   controller_type:
     description: Name of the controller
@@ -111,6 +145,19 @@ options:
     default: 1
     required: false
 
+  background:
+    description: Return a storage_job right after the virtual drives were
+                 created, while the IMC initializes them, for
+                 cisco_imc_storage_job to wait for or report the progress of.
+    default: false
+    required: false
+
+  state:
+    description: Create or delete the virtual drive
+    choices: ["present", "absent"]
+    default: "present"
+    required: false
+
 requirements: ['imcsdk']
 author: "Vikrant Balyan(vvb@cisco.com)"
 '''
@@ -124,6 +171,54 @@ EXAMPLES = '''
     ip: "192.168.1.1"
     username: "admin"
     password: "password"
+
+- name: Provision the drives of a 24 bay server in one task
+  cisco_imc_virtual_drive:
+    controller_slot: "MEZZ"
+    virtual_drives:
+      - {drive_group: [[1,2]], raid_level: 1, boot_drive: true}
+      - {drive_group: [[3,4,5,6],[7,8,9,10]], raid_level: 50, virtual_drive_name: "data"}
+      - {drive_group: [[11,12,13,14,15,16]], raid_level: 6, size: "2 TB"}
+      - {virtual_drive_name: "scratch", state: absent}
+    ip: "192.168.1.1"
+    username: "admin"
+    password: "password"
+
+- name: Same layout on every server whatever its drives
+  cisco_imc_virtual_drive:
+    controller_slot: "MEZZ"
+    virtual_drives:
+      - {virtual_drive_name: "boot", raid_level: 1, drive_count: 2, media_type: SSD, boot_drive: true}
+      - {virtual_drive_name: "data", raid_level: 6, capacity: "8 TB", media_type: HDD}
+    ip: "192.168.1.1"
+    username: "admin"
+    password: "password"
+
+- name: Create a RAID 6 drive, initialized in the background
+  cisco_imc_virtual_drive:
+    drive_group: [[1,2,3,4,5,6]]
+    raid_level: 6
+    controller_slot: "MEZZ"
+    background: true
+    ip: "192.168.1.1"
+    username: "admin"
+    password: "password"
+  register: vd
+'''
+
+RETURN = '''
+plan:
+    description: delete, create and set-boot-drive steps with the drive groups, done or in check mode to be done
+    returned: always
+    type: list
+virtual_drives:
+    description: name, state and changed of every entry of virtual_drives
+    returned: with virtual_drives
+    type: list
+storage_job:
+    description: ip, controller dn, start time and dn of every virtual drive created, see cisco_imc_storage_job
+    returned: with background
+    type: dict
 '''
 
 
@@ -163,92 +258,47 @@ def logout(module, imc_server):
     return False
 
 
-def exists(server, module):
-    from imcsdk.apis.server.storage import virtual_drive_exists as vd_exists
-    from imcsdk.apis.server.storage import vd_name_derive
-
-    ansible = module.params
-    # VD name may have been derived while creation
-    vd_name = ansible["virtual_drive_name"]
-    if vd_name is None:
-        vd_name = vd_name_derive(ansible["raid_level"],
-                                 ansible["drive_group"])
-    exists, err = vd_exists(handle=server,
-                            controller_type=ansible['controller_type'],
-                            controller_slot=ansible["controller_slot"],
-                            virtual_drive_name=vd_name,
-                            server_id=ansible['server_id'])
-    if err:
-        print(err)
-    return exists
-
-
 def virtual_drive(server, module):
-    from imcsdk.apis.server.storage import virtual_drive_create as vd_create
-    from imcsdk.apis.server.storage import vd_query_by_name
-    from imcsdk.apis.server.storage import virtual_drive_delete as vd_delete
-    from imcsdk.apis.server.storage import vd_name_derive
+    from ansible.module_utils.cisco_imc_storage import ControllerSnapshot
+    from ansible.module_utils.cisco_imc_storage import apply_plan
+    from ansible.module_utils.cisco_imc_storage import plan_virtual_drives
+    from ansible.module_utils.cisco_imc_storage import storage_job
+    from ansible.module_utils.cisco_imc_storage import vd_entry
 
     results = {}
     err = False
 
     try:
         ansible = module.params
-        _exists = exists(server, module)
-        if ansible["state"] == "present":
-            if module.check_mode or _exists:
-                results["changed"] = not _exists
-                return results, False
-
-            vd_create(handle=server,
-                      drive_group=ansible["drive_group"],
-                      controller_type=ansible['controller_type'],
-                      controller_slot=ansible["controller_slot"],
-                      raid_level=ansible["raid_level"],
-                      virtual_drive_name=ansible["virtual_drive_name"],
-                      access_policy=ansible["access_policy"],
-                      read_policy=ansible["read_policy"],
-                      cache_policy=ansible["cache_policy"],
-                      disk_cache_policy=ansible["disk_cache_policy"],
-                      write_policy=ansible["write_policy"],
-                      strip_size=ansible["strip_size"],
-                      size=ansible["size"],
-                      server_id=ansible['server_id'])
-            if ansible['boot_drive']:
-                # VD name may have been derived while creation
-                vd_name = ansible["virtual_drive_name"]
-                if vd_name is None:
-                    vd_name = vd_name_derive(ansible["raid_level"],
-                                             ansible["drive_group"])
-	        vd = vd_query_by_name(handle=server,
+        entries = ansible["virtual_drives"]
+        if entries is None:
+            entries = [{}]
+        vds = [vd_entry(entry, ansible) for entry in entries]
+
+        # one read of the controller, the whole plan is checked against it
+        # before the first write
+        snapshot = ControllerSnapshot(server,
                                       controller_type=ansible['controller_type'],
- 			              controller_slot=ansible['controller_slot'],
- 			              name=vd_name,
- 			              server_id=ansible['server_id'])
-                vd.admin_action = 'set-boot-drive'
-                server.set_mo(vd)
-        else:
-            if module.check_mode:
-                results["changed"] = _exists
-                return results, False
-
-            if not _exists:
-                results["changed"] = False
-                return results, False
-
-            # VD name may have been derived while creation
-            vd_name = ansible["virtual_drive_name"]
-            if vd_name is None:
-                vd_name = vd_name_derive(ansible["raid_level"],
-                                         ansible["drive_group"])
-
-            vd_delete(handle=server,
-                      controller_type=ansible['controller_type'],
-                      controller_slot=ansible["controller_slot"],
-                      name=vd_name,
-                      server_id=ansible['server_id'])
-
-        results["changed"] = True
+                                      controller_slot=ansible['controller_slot'],
+                                      server_id=ansible['server_id'])
+        steps = plan_virtual_drives(snapshot, vds)
+        if not module.check_mode:
+            apply_plan(server, snapshot, steps)
+            if ansible["background"]:
+                results["storage_job"] = storage_job(server, snapshot, steps)
+
+        changed_names = set(step["name"] for step in steps)
+        results["plan"] = [dict(action=step["action"], name=step["name"],
+                                size=step.get("size"),
+                                drive_group=step["vd"]["drive_group"]
+                                if "vd" in step else None)
+                           for step in steps]
+        if ansible["virtual_drives"] is not None:
+            results["virtual_drives"] = [
+                dict(name=vd["virtual_drive_name"], state=vd["state"],
+                     changed=vd["virtual_drive_name"] in changed_names)
+                for vd in vds]
+        results["changed"] = bool(steps)
     except Exception as e:
         err = True
         results["msg"] = str(e)
@@ -264,7 +314,7 @@ def main():
     module = AnsibleModule(
         argument_spec=dict(
             boot_drive=dict(required=False, default=False, type='bool'),
-            drive_group=dict(required=True, type='list'),
+            drive_group=dict(required=False, type='list'),
             controller_type=dict(required=False, default='SAS', type='str'),
             controller_slot=dict(required=True, type='str'),
             raid_level=dict(required=False,
@@ -306,6 +356,16 @@ def main():
                        type='str'),
             server_id=dict(required=False, default=1, type='int'),
 
+            # several virtual drives of the controller at once
+            virtual_drives=dict(required=False, type='list'),
+            background=dict(required=False, default=False, type='bool'),
+
+            # drive group planned from the unused drives
+            capacity=dict(required=False, type='str'),
+            drive_count=dict(required=False, type='int'),
+            media_type=dict(required=False, choices=["HDD", "SSD"],
+                            type='str'),
+
             # ImcHandle
             server=dict(required=False, type='dict'),
 
@@ -320,6 +380,10 @@ def main():
             # For debugging purposes
             print_exception=dict(required=False, default=False, type='bool')
         ),
+        required_one_of=[['drive_group', 'virtual_drive_name',
+                          'virtual_drives']],
+        mutually_exclusive=[['drive_group', 'virtual_drives'],
+                            ['virtual_drive_name', 'virtual_drives']],
         supports_check_mode=True
     )
 
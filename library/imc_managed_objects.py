@@ -33,6 +33,25 @@ options:
     description:
     - 'Filename (absolute path) of a JSON configuration file.  The JSON file should have the same fields described in the objects option.'
     - Either objects or json_config_file must be specified.
+  prefetch:
+    description:
+    - Read the subtree below every parent_mo_or_dn in objects with one hierarchical query up front and check the objects against it.
+    - Saves one configResolveDn per object on large trees, but reads the whole subtree so keep parents specific (e.g. not sys).
+    type: bool
+    default: false
+  transaction:
+    description:
+    - Stage every add and remove and commit them together with configConfMos instead of one auto-committed request per object.
+    - Per-object results are returned in object_results.
+    type: bool
+    default: false
+  transaction_size:
+    description:
+    - Maximum number of objects committed in one transaction when transaction is enabled.
+    - Larger trees are split into several bounded transactions, committed in order.
+    - The IMC accepts at most 10 objects per configConfMos request, larger transactions are sent as several requests.
+    type: int
+    default: 10
 requirements:
 - imcsdk
 author:
@@ -70,56 +89,32 @@ EXAMPLES = r'''
       }
     }
     state: absent
+
+- name: Configure a tree in one transaction
+  imc_managed_objects:
+    <<: *login_info
+    json_config_file: /tmp/vnic_config.json
+    prefetch: true
+    transaction: true
 '''
 
 RETURN = r'''
-#
+changes:
+    description: Objects created, modified or deleted (or that would be in check mode) with their changed properties.
+    returned: always
+    type: list
+    sample: [{"dn": "sys/svc-ext/ntp-svc", "class": "CommNtpProvider", "action": "modified",
+              "properties": {"ntp_server1": {"before": "", "after": "ntp.esl.cisco.com"}}}]
+object_results:
+    description: Per-object results of a transaction, in commit order.
+    returned: when transaction is enabled
+    type: list
+    sample: [{"dn": "sys/svc-ext/ntp-svc", "class": "CommNtpProvider", "action": "modified", "status": "committed"}]
 '''
 
-from importlib import import_module
-from copy import deepcopy
-import json
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.cisco_imc import ImcConnection
-
-
-def traverse_objects(module, imc, managed_object, mo=''):
-    props_match = False
-
-    mo_module = import_module(managed_object['module'])
-    mo_class = getattr(mo_module, managed_object['class'])
-
-    if not managed_object['properties'].get('parent_mo_or_dn'):
-        managed_object['properties']['parent_mo_or_dn'] = mo
-
-    mo = mo_class(**managed_object['properties'])
-
-    existing_mo = imc.handle.query_dn(mo.dn)
-
-    if module.params['state'] == 'absent':
-        # mo must exist, but all properties do not have to match
-        if existing_mo:
-            if not module.check_mode:
-                imc.handle.remove_mo(existing_mo)
-            imc.result['changed'] = True
-    else:
-        if existing_mo:
-            # check mo props
-            kwargs = dict(managed_object['properties'])
-            kwargs.pop('parent_mo_or_dn', None)
-            if existing_mo.check_prop_match(**kwargs):
-                props_match = True
-
-        if not props_match:
-            if not module.check_mode:
-                imc.handle.add_mo(mo)
-            imc.result['changed'] = True
-
-    if managed_object.get('children'):
-        for child in managed_object['children']:
-            # explicit deep copy of child object since traverse_objects may modify parent mo information
-            copy_of_child = deepcopy(child)
-            traverse_objects(module, imc, copy_of_child, mo)
+from ansible.module_utils.cisco_imc_mo import apply_objects, load_objects
 
 
 def main():
@@ -133,6 +128,9 @@ def main():
         objects=dict(type='list'),
         json_config_file=dict(type='str'),
         state=dict(type='str', choices=['present', 'absent'], default='present'),
+        prefetch=dict(type='bool', default=False),
+        transaction=dict(type='bool', default=False),
+        transaction_size=dict(type='int', default=10),
     )
 
     module = AnsibleModule(
@@ -150,18 +148,13 @@ def main():
     imc.login()
 
     err = False
-    # note that all objects specified in the object list report a single result (including a single changed).
-    imc.result['changed'] = False
     try:
-        if module.params.get('objects'):
-            objects = module.params['objects']
-        else:
-            # either objects or json_config_file will be specified, so if there is no objects option use a config file
-            with open(module.params['json_config_file']) as f:
-                objects = json.load(f)['objects']
-
-        for managed_object in objects:
-            traverse_objects(module, imc, managed_object)
+        objects = load_objects(module.params)
+        failed = apply_objects(module, imc, objects)
+        if failed:
+            err = True
+            imc.result['msg'] = "transaction failed for: %s" % ", ".join(
+                result['dn'] for result in failed)
 
     except Exception as e:
         err = True
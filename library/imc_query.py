@@ -32,6 +32,86 @@ options:
         - As a comma separtated list
         type: str
 
+    hierarchical:
+        description:
+        - Also return the children of every object, nested under a
+          children key by class, from the same request.
+        type: bool
+        default: false
+
+    filter:
+        description:
+        - Only return the objects of I(class_ids) matching this filter.
+        - A dict of operators, C(eq), C(ne), C(gt) and C(wcard) (a regular
+          expression) compare properties, as a dict of property and value,
+          C(and) and C(or) combine a list of filters. Several operators in
+          one dict must all match.
+        - Sent to the IMC as an inFilter so only the matching objects are
+          returned. Firmware that rejects the filter gets a plain class
+          query and the objects are filtered by the module.
+        - Fails before connecting when a class of I(class_ids) or a
+          property of the filter is unknown to imcsdk.
+        type: dict
+
+    properties:
+        description:
+        - Only return these properties of every object (and child).
+        - Either the python (coerced_size) or the XML API (coercedSize) name.
+        - By default all properties are returned.
+        type: list
+
+    format:
+        description:
+        - C(dict) returns a list of dicts per class id or dn.
+        - C(columnar) returns C({query: class|dn, columns: [...],
+          rows: [[...], ...], values: {...}}) per class id or dn (and
+          children class), every property name once instead of once per
+          object. A property repeating values keeps them once in values and
+          its rows hold their index. The C(imc_objects) filter turns it back
+          into what C(dict) returns.
+        - Not used with I(output_file).
+        choices: [dict, columnar]
+        default: dict
+
+    output_file:
+        description:
+        - Write the objects to this file on the controller instead of
+          returning them, one JSON document per line and object, written as
+          every class or dn comes in. Gzip compressed when the name ends
+          with C(.gz).
+        - Only the object counts and the path are returned, so the memory of
+          the module and of Ansible does not grow with the result.
+        - Every line is C({"query": <class id or dn>, "object": {...}}).
+        - In check mode the queries run but the file is not written and
+          nothing is reported changed.
+        type: path
+
+    concurrency:
+        description:
+        - Number of class or dn requests sent to the IMC at the same time.
+        - The IMC resolves one class or dn per request, so a list of them is
+          fetched in parallel over the module's single session.
+        - Set to 1 to send the requests one after the other.
+        type: int
+        default: 4
+
+    cache:
+        description:
+        - C(prefer) serves the queries from the controller side query cache
+          (C(CISCO_IMC_QUERY_CACHE), default C(~/.ansible/cisco_imc/queries))
+          and stores what it had to fetch, C(only) never contacts the IMC
+          and fails on anything not cached, C(bypass) does not use the cache.
+        - Writes of any module drop the cached queries they affect.
+        choices: [bypass, prefer, only]
+        default: bypass
+
+    cache_ttl:
+        description:
+        - Seconds a cached query stays valid, volatile classes (power state,
+          storage operations, faults) expire sooner.
+        type: int
+        default: 300
+
 requirements:
     - imcsdk
 
@@ -59,6 +139,69 @@ EXAMPLES = r'''
     class_ids: computeRackUnit, adaptorUnit
   delegate_to: localhost
 
+- name: Query IMC Class IDs, reusing reads from the last five minutes
+  imc_query:
+    hostname: "{{ inventory_hostname }}"
+    username: "{{ username }}"
+    password: "{{ password }}"
+    class_ids: computeRackUnit, adaptorUnit
+    cache: prefer
+  delegate_to: localhost
+
+- name: Query the storage controllers with their disks, only a few properties
+  imc_query:
+    hostname: "{{ inventory_hostname }}"
+    username: "{{ username }}"
+    password: "{{ password }}"
+    class_ids: storageController
+    hierarchical: true
+    properties: [dn, id, model, coercedSize, driveState]
+  delegate_to: localhost
+
+- name: Query the Seagate disks that are not online
+  imc_query:
+    hostname: "{{ inventory_hostname }}"
+    username: "{{ username }}"
+    password: "{{ password }}"
+    class_ids: storageLocalDisk
+    filter:
+      ne: {pdStatus: Online}
+      wcard: {productId: "^ST"}
+  delegate_to: localhost
+
+- name: Query the DIMMs larger than 16GB
+  imc_query:
+    hostname: "{{ inventory_hostname }}"
+    username: "{{ username }}"
+    password: "{{ password }}"
+    class_ids: memoryUnit
+    filter:
+      gt: {capacity: 16384}
+  delegate_to: localhost
+
+- name: Query the disks as columns and rows, a fraction of the dict size
+  imc_query:
+    hostname: "{{ inventory_hostname }}"
+    username: "{{ username }}"
+    password: "{{ password }}"
+    class_ids: storageLocalDisk
+    format: columnar
+  delegate_to: localhost
+  register: disks
+
+- name: Print the disk serial numbers
+  debug:
+    msg: "{{ (disks.objects | imc_objects).storageLocalDisk | map(attribute='drive_serial_number') | list }}"
+
+- name: Dump every disk of the fleet to one file per server
+  imc_query:
+    hostname: "{{ inventory_hostname }}"
+    username: "{{ username }}"
+    password: "{{ password }}"
+    class_ids: storageController, storageLocalDisk, storageVirtualDrive
+    output_file: "audit/{{ inventory_hostname }}.jsonl.gz"
+  delegate_to: localhost
+
 - name: Query IMC Distinguished Name
   imc_query:
     hostname: "{{ inventory_hostname }}"
@@ -78,27 +221,45 @@ EXAMPLES = r'''
 
 RETURN = '''
 objects:
-    description: results JSON encodded
+    description: results JSON encodded, columns and rows with format columnar
     type: dict
+output_file:
+    description: file the objects were written to, with output_file
+    type: str
+counts:
+    description: number of objects written per class id or dn, with output_file
+    type: dict
+total:
+    description: number of objects written, with output_file
+    type: int
 '''
 
+import json
+import os
+from collections import OrderedDict
+
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.cisco_imc import ImcConnection
+from ansible.module_utils.cisco_imc_query import compile_filter, \
+    make_columnar, mo_to_dict, open_output, resolve_classes, resolve_dns, \
+    validate_filter
+
+
+def make_mo_dict(imc_mo, properties=None, hierarchical=False):
+    obj_dict = mo_to_dict(imc_mo, properties)
+    if hierarchical and imc_mo.child:
+        children = obj_dict['children'] = {}
+        for child in imc_mo.child:
+            class_id = child.get_class_id()
+            class_id = class_id[0].lower() + class_id[1:]
+            children.setdefault(class_id, []).append(
+                make_mo_dict(child, properties, hierarchical))
+    return obj_dict
 
 
-def retrieve_class_id(class_id, imc):
-    return imc.handle.query_classid(class_id)
-
-
-def retrieve_distinguished_name(distinguished_name, imc):
-    return imc.handle.query_dn(distinguished_name)
-
-
-def make_mo_dict(imc_mo):
-    obj_dict = {}
-    for mo_property in imc_mo.prop_map['classic'].values():
-        obj_dict[mo_property] = getattr(imc_mo, mo_property)
-    return obj_dict
+def write_object(out, query, obj_dict):
+    line = json.dumps(dict(query=query, object=obj_dict)) + '\n'
+    out.write(line.encode('utf-8'))
 
 
 def main():
@@ -111,6 +272,14 @@ def main():
         proxy=dict(type='str'),
         class_ids=dict(type='str'),
         distinguished_names=dict(type='str'),
+        filter=dict(type='dict'),
+        hierarchical=dict(type='bool', default=False),
+        properties=dict(type='list'),
+        format=dict(type='str', choices=['dict', 'columnar'], default='dict'),
+        output_file=dict(type='path'),
+        concurrency=dict(type='int', default=4),
+        cache=dict(type='str', choices=['bypass', 'prefer', 'only'], default='bypass'),
+        cache_ttl=dict(type='int', default=300),
     )
 
     module = AnsibleModule(
@@ -118,9 +287,19 @@ def main():
         supports_check_mode=True,
         mutually_exclusive=[
             ['class_ids', 'distinguished_names'],
+            ['filter', 'distinguished_names'],
         ],
     )
 
+    if module.params['filter'] is not None:
+        try:
+            validate_filter(module.params['filter'])
+            for class_id in (module.params['class_ids'] or '').split(','):
+                if class_id.strip():
+                    compile_filter(class_id.strip(), module.params['filter'])
+        except ValueError as e:
+            module.fail_json(msg="filter: %s" % str(e))
+
     # imcModule verifies imcmsdk is present and exits on failure.
     # Imports are below for imc object creation.
     imc = ImcConnection(module)
@@ -128,33 +307,83 @@ def main():
     imc.login()
 
     query_result = {}
+    hierarchical = module.params['hierarchical']
+    properties = module.params['properties']
+    if properties is not None:
+        properties = frozenset(properties)
+
+    output_file = module.params['output_file']
+    out = tmp_path = None
+    counts = OrderedDict()
 
     try:
+        if output_file:
+            out, tmp_path = open_output(output_file)
+
         if module.params['class_ids']:
             class_ids = [
                 x.strip() for x in module.params['class_ids'].split(',')
             ]
-            for class_id in class_ids:
-                query_result[class_id] = []
-                imc_mos = retrieve_class_id(class_id, imc)
-                if imc_mos:
+            resolved = resolve_classes(imc.handle, class_ids,
+                                       hierarchy=hierarchical,
+                                       concurrency=module.params['concurrency'],
+                                       class_filter=module.params['filter'],
+                                       stream=True)
+            for class_id, imc_mos in resolved:
+                counts[class_id] = len(imc_mos)
+                if out:
                     for imc_mo in imc_mos:
-                        query_result[class_id].append(make_mo_dict(imc_mo))
-
-            imc.result['objects'] = query_result
+                        write_object(out, class_id, make_mo_dict(
+                            imc_mo, properties, hierarchical))
+                    continue
+                query_result[class_id] = []
+                for imc_mo in imc_mos:
+                    query_result[class_id].append(
+                        make_mo_dict(imc_mo, properties, hierarchical))
 
         elif module.params['distinguished_names']:
             distinguished_names = [
                 x.strip()
                 for x in module.params['distinguished_names'].split(',')
             ]
-            for distinguished_name in distinguished_names:
+            resolved = resolve_dns(imc.handle, distinguished_names,
+                                   hierarchy=hierarchical,
+                                   concurrency=module.params['concurrency'],
+                                   stream=True)
+            for distinguished_name, imc_mo in resolved:
+                counts[distinguished_name] = 1 if imc_mo else 0
+                if out:
+                    if imc_mo:
+                        write_object(out, distinguished_name, make_mo_dict(
+                            imc_mo, properties, hierarchical))
+                    continue
                 query_result[distinguished_name] = {}
-                imc_mo = retrieve_distinguished_name(distinguished_name, imc)
 
                 if imc_mo:
-                    query_result[distinguished_name] = make_mo_dict(imc_mo)
-
+                    query_result[distinguished_name] = make_mo_dict(
+                        imc_mo, properties, hierarchical)
+
+        if module.params['format'] == 'columnar':
+            for query, objects in query_result.items():
+                if isinstance(objects, dict):
+                    # a dn query has one object or none
+                    query_result[query] = make_columnar(
+                        [objects] if objects else [], query='dn')
+                else:
+                    query_result[query] = make_columnar(objects)
+
+        if out:
+            out.close()
+            if module.check_mode:
+                os.remove(tmp_path)
+            else:
+                module.atomic_move(tmp_path, os.path.abspath(output_file))
+            tmp_path = None
+            imc.result['changed'] = not module.check_mode
+            imc.result['output_file'] = output_file
+            imc.result['counts'] = counts
+            imc.result['total'] = sum(counts.values())
+        else:
             imc.result['objects'] = query_result
 
     except Exception as e:
@@ -162,6 +391,9 @@ def main():
         module.fail_json(**imc.result)
 
     finally:
+        if tmp_path:
+            out.close()
+            os.remove(tmp_path)
         imc.logout()
 
     module.exit_json(**imc.result)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the tests import utils/ and the plugins straight from the checkout
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,65 @@
+import json
+
+from filter_plugins.cisco_imc import imc_objects
+from utils.cisco_imc_query import make_columnar
+
+DISKS = [
+    {"dn": "sys/rack-unit-1/board/storage-SAS-MRAID/pd-%d" % slot,
+     "id": str(slot), "pd_status": "Unconfigured Good" if slot > 2 else "Online",
+     "media_type": "HDD", "coerced_size": "1906394 MB",
+     "predictive_failure_count": None, "drive_serial_number": "S%04d" % slot}
+    for slot in range(1, 9)
+]
+
+CONTROLLER = {
+    "dn": "sys/rack-unit-1/board/storage-SAS-MRAID", "id": "MRAID",
+    "model": "Cisco 12G SAS Modular Raid Controller", "vendor": None,
+    "children": {
+        "storageLocalDisk": [dict(disk) for disk in DISKS[:2]],
+        "storageVirtualDrive": [{"dn": "sys/rack-unit-1/board/storage-SAS-MRAID/vd-0",
+                                 "id": "0", "raid_level": "RAID 1",
+                                 "vd_status": "Optimal"}],
+    },
+}
+
+
+def round_trip(result):
+    # the module result goes through JSON on its way to the filter
+    return imc_objects(json.loads(json.dumps(result)))
+
+
+def test_class_query_round_trip():
+    result = {"storageLocalDisk": make_columnar(DISKS)}
+    assert round_trip(result) == {"storageLocalDisk": DISKS}
+
+
+def test_columns_without_any_value_are_kept():
+    columnar = make_columnar(DISKS)
+    assert "predictive_failure_count" in columnar["columns"]
+    assert round_trip(columnar)[0]["predictive_failure_count"] is None
+
+
+def test_repeated_values_are_stored_once():
+    columnar = make_columnar(DISKS)
+    assert columnar["values"]["media_type"] == ["HDD"]
+    assert columnar["values"]["pd_status"] == ["Online", "Unconfigured Good"]
+    assert "drive_serial_number" not in columnar["values"]
+    assert len(json.dumps(columnar)) < len(json.dumps(DISKS))
+
+
+def test_dn_query_round_trip():
+    result = {CONTROLLER["dn"]: make_columnar([CONTROLLER], query="dn"),
+              "sys/rack-unit-1/board/storage-SAS-MEZZ": make_columnar([], query="dn")}
+    assert round_trip(result) == {CONTROLLER["dn"]: CONTROLLER,
+                                  "sys/rack-unit-1/board/storage-SAS-MEZZ": {}}
+
+
+def test_children_round_trip():
+    childless = dict((k, v) for k, v in CONTROLLER.items() if k != "children")
+    controllers = [CONTROLLER, childless]
+    result = {"storageController": make_columnar(controllers)}
+    assert round_trip(result) == {"storageController": controllers}
+
+
+def test_empty_class_query():
+    assert round_trip({"storageLocalDisk": make_columnar([])}) == {"storageLocalDisk": []}
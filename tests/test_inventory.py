@@ -0,0 +1,32 @@
+import sys
+
+import pytest
+
+imcsdk = pytest.importorskip("imcsdk")
+module_utils = pytest.importorskip("ansible.module_utils")
+
+from utils import cisco_imc_query  # noqa: E402
+from utils.cisco_imc_inventory import collect_section  # noqa: E402
+
+# the modules import the shared code as ansible.module_utils
+sys.modules.setdefault("ansible.module_utils.cisco_imc_query", cisco_imc_query)
+
+PSUS = '''
+<configResolveClass cookie="" response="yes" classId="equipmentPsu">
+<outConfigs>
+<equipmentPsu id="1" dn="sys/rack-unit-1/psu-1" presence="equipped" model="UCSC-PSU1-770W" vendor="Cisco Systems Inc" serial="LIT1" fwVersion="R0E"/>
+<equipmentPsu id="2" dn="sys/rack-unit-1/psu-2" presence="missing" model="" vendor="" serial="" fwVersion=""/>
+</outConfigs>
+</configResolveClass>
+'''
+
+
+def test_missing_psu_is_ignored():
+    from imcsdk import imcxmlcodec
+
+    response = imcxmlcodec.from_xml_str(PSUS)
+    section = collect_section(None, "psu",
+                              mos={"EquipmentPsu": response.out_configs.child})
+    assert section == [{"id": "1", "model": "UCSC-PSU1-770W",
+                        "vendor": "Cisco Systems Inc", "serial": "LIT1",
+                        "fw_version": "R0E"}]
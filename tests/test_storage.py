@@ -0,0 +1,166 @@
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+
+from utils.cisco_imc_storage import ControllerSnapshot, parse_size, \
+    span_layouts, vd_entry
+
+CONTROLLER_DN = "sys/rack-unit-1/board/storage-SAS-MRAID"
+
+# the task level values of cisco_imc_virtual_drive
+DEFAULTS = dict(raid_level=0, state="present", boot_drive=False,
+                access_policy="read-write", read_policy="no-read-ahead",
+                cache_policy="direct-io", disk_cache_policy="unchanged",
+                write_policy="Write Through", strip_size="64k")
+
+
+def disk(slot, size, media_type="HDD", pd_status="Unconfigured Good"):
+    return SimpleNamespace(id=str(slot), coerced_size=size,
+                           media_type=media_type, link_speed="12.0 Gb/s",
+                           pd_status=pd_status)
+
+
+@pytest.fixture
+def snapshot():
+    '''
+    Four unused 1 TB HDDs, two unused 2 TB SSDs and an HDD in the virtual
+    drive "old".
+    '''
+    snapshot = ControllerSnapshot.__new__(ControllerSnapshot)
+    snapshot.dn = CONTROLLER_DN
+    snapshot.disks = dict((slot, disk(slot, "1048576 MB")) for slot in range(1, 5))
+    snapshot.disks[5] = disk(5, "2097152 MB", media_type="SSD")
+    snapshot.disks[6] = disk(6, "2097152 MB", media_type="SSD")
+    snapshot.disks[7] = disk(7, "1048576 MB", pd_status="Online")
+    old = SimpleNamespace(dn=CONTROLLER_DN + "/vd-0", name="old", boot_drive="false")
+    snapshot.virtual_drives = OrderedDict([("old", old)])
+    snapshot.vd_disks = {old.dn: [7]}
+    return snapshot
+
+
+@pytest.mark.parametrize("raid_level, count, layouts", [
+    (0, 1, [(1, 1)]),
+    (1, 2, [(1, 2)]),
+    (1, 3, []),
+    (5, 2, []),
+    (6, 5, [(1, 5)]),
+    (10, 6, [(3, 2)]),
+    (10, 8, [(2, 4), (4, 2)]),
+    (50, 12, [(2, 6), (3, 4), (4, 3)]),
+    (60, 7, []),
+])
+def test_span_layouts(raid_level, count, layouts):
+    assert span_layouts(raid_level, count) == layouts
+
+
+@pytest.mark.parametrize("size, expected", [
+    ("2 TB", 2 << 40),
+    ("1.5 TB", 3 << 39),
+    ("1.5TB", 3 << 39),
+    ("512 gb", 512 << 30),
+    ("0.25 MB", 1 << 18),
+])
+def test_parse_size(size, expected):
+    assert parse_size(size) == expected
+
+
+@pytest.mark.parametrize("size", ["2 TiB", "TB", "1,5 TB", "-1 TB", ""])
+def test_parse_size_invalid(size):
+    with pytest.raises(ValueError):
+        parse_size(size)
+
+
+def plan(snapshot, *args, **kwargs):
+    pytest.importorskip("imcsdk")
+    from utils.cisco_imc_storage import plan_drive_group
+    return plan_drive_group(snapshot, *args, **kwargs)
+
+
+def test_plan_fewest_drives_holding_a_decimal_capacity(snapshot):
+    assert plan(snapshot, 5, capacity="1.5 TB") == [[1, 2, 3]]
+    assert plan(snapshot, 5, capacity="2.5 TB") == [[1, 2, 3, 4]]
+
+
+def test_plan_smaller_drives_first(snapshot):
+    assert plan(snapshot, 1, capacity="1 TB") == [[1, 2]]
+    assert plan(snapshot, 1, capacity="1.5 TB") == [[5, 6]]
+
+
+def test_plan_drive_count_and_media_type(snapshot):
+    assert plan(snapshot, 1, drive_count=2, media_type="SSD") == [[5, 6]]
+    assert plan(snapshot, 10, drive_count=4) == [[1, 2], [3, 4]]
+
+
+def test_plan_most_capacity_without_a_target(snapshot):
+    # what cisco_imc_drive_groups reports, cisco_imc_virtual_drive does not
+    # create such a drive
+    assert plan(snapshot, 0) == [[1, 2, 3, 4]]
+
+
+def test_plan_only_unused_or_given_slots(snapshot):
+    assert plan(snapshot, 0, slots=set([2, 4, 7])) == [[2, 4, 7]]
+
+
+@pytest.mark.parametrize("kwargs, message", [
+    (dict(raid_level=5, capacity="10 TB"), "no RAID 5 of 10 TB"),
+    (dict(raid_level=5, media_type="SSD"), "no RAID 5 on SSD"),
+    (dict(raid_level=5, capacity="lots"), "invalid capacity lots"),
+    (dict(raid_level=3), "unsupported RAID level 3"),
+])
+def test_plan_errors(snapshot, kwargs, message):
+    with pytest.raises(ValueError) as error:
+        plan(snapshot, **kwargs)
+    assert message in str(error.value)
+
+
+def plan_vds(snapshot, *entries):
+    pytest.importorskip("imcsdk")
+    from utils.cisco_imc_storage import plan_virtual_drives
+    return plan_virtual_drives(snapshot, [vd_entry(entry, DEFAULTS) for entry in entries])
+
+
+def test_plan_virtual_drives_given_groups_first(snapshot):
+    steps = plan_vds(snapshot,
+                     dict(virtual_drive_name="data", raid_level=1, drive_count=2,
+                          media_type="HDD"),
+                     dict(virtual_drive_name="boot", raid_level=1,
+                          drive_group=[[1, 2]], boot_drive=True))
+    assert [(step["action"], step["name"]) for step in steps] == [
+        ("create", "boot"), ("create", "data"), ("set-boot-drive", "boot")]
+    assert steps[1]["vd"]["drive_group"] == [[3, 4]]
+
+
+def test_plan_virtual_drives_uses_drives_of_deleted_ones(snapshot):
+    steps = plan_vds(snapshot,
+                     dict(virtual_drive_name="data", raid_level=5, drive_count=5,
+                          media_type="HDD"),
+                     dict(virtual_drive_name="old", state="absent"))
+    assert [(step["action"], step["name"]) for step in steps] == [
+        ("delete", "old"), ("create", "data")]
+    assert steps[1]["vd"]["drive_group"] == [[1, 2, 3, 4, 7]]
+    assert steps[1]["size"] == "%d MB" % (4 * 1048576)
+
+
+def test_plan_virtual_drives_reports_every_error(snapshot):
+    with pytest.raises(ValueError) as error:
+        plan_vds(snapshot,
+                 dict(virtual_drive_name="a", raid_level=1, drive_group=[[5, 6]]),
+                 dict(virtual_drive_name="b", raid_level=0, drive_group=[[6, 7, 8]]),
+                 dict(virtual_drive_name="c", raid_level=6, capacity="8 TB"))
+    message = str(error.value)
+    assert "b: drive 6 is already used by a" in message
+    assert "b: drive 7 is Online" in message
+    assert "b: no physical drive in slot 8" in message
+    assert "c: no RAID 6 of 8 TB" in message
+
+
+def test_plan_virtual_drives_needs_a_size_for_a_new_drive(snapshot):
+    with pytest.raises(ValueError) as error:
+        plan_vds(snapshot, dict(virtual_drive_name="dta"))
+    assert "dta: not found, a new virtual drive needs drive_group, capacity " \
+        "or drive_count" in str(error.value)
+
+
+def test_plan_virtual_drives_keeps_an_existing_drive_by_name(snapshot):
+    assert plan_vds(snapshot, dict(virtual_drive_name="old")) == []
@@ -19,5 +19,6 @@ imc_path = server_path + '/cisco'
 if os.path.isdir(server_path):
     shutil.rmtree(server_path)
 
-if os.path.isfile(module_utils + 'cisco_imc.py'):
-    os.remove(module_utils + 'cisco_imc.py')
+for file_name in os.listdir(os.getcwd() + '/utils'):
+    if os.path.isfile(module_utils + file_name):
+        os.remove(module_utils + file_name)
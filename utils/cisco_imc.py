@@ -1,4 +1,7 @@
 # This file needs to be copied to ansible module_utils
+import os
+import time
+
 try:
     import imcsdk
     HAS_IMCSDK = True
@@ -6,6 +9,206 @@ except:
     HAS_IMCSDK = False
 
 
+# Unix socket of a running cisco_imc_broker.py; when set, modules borrow the
+# broker's session instead of logging in and out themselves.
+BROKER_ENV = "CISCO_IMC_BROKER"
+
+# Directory of the session cache shared by cisco_imc_login and later tasks.
+SESSION_CACHE_ENV = "CISCO_IMC_SESSION_CACHE"
+SESSION_CACHE_DIR = "~/.ansible/cisco_imc/sessions"
+
+# Set to a true value to return request counters and latencies as
+# imc_metrics with every module result, see cisco_imc_metrics.
+METRICS_ENV = "CISCO_IMC_METRICS"
+
+# Directory of the controller side query cache, see cisco_imc_query.
+# Writes invalidate cached queries whenever the directory exists.
+QUERY_CACHE_ENV = "CISCO_IMC_QUERY_CACHE"
+QUERY_CACHE_DIR = "~/.ansible/cisco_imc/queries"
+QUERY_CACHE_SIZE = 1000
+
+# Directory of the per server inventory snapshots of cisco_imc_inventory.
+INVENTORY_CACHE_ENV = "CISCO_IMC_INVENTORY_CACHE"
+INVENTORY_CACHE_DIR = "~/.ansible/cisco_imc/inventory"
+
+# A resumed session is refreshed once less than this many seconds are left.
+SESSION_REFRESH_MARGIN = 120
+
+# Seconds aaaLogout may still take once the deadline of a server passed, so
+# a server that ran out of time does not keep its session.
+LOGOUT_TIMEOUT = 5
+
+# ImcSession keeps its state in name-mangled attributes with no setters.
+_SESSION_ATTRS = ["cookie", "session_id", "refresh_period", "priv",
+                  "domains", "channel", "evt_channel"]
+
+
+def session_info(handle):
+    '''
+    Returns the serializable state of a logged in ImcHandle.
+    '''
+    info = {}
+    for attr in _SESSION_ATTRS:
+        info[attr] = getattr(handle, attr)
+    info["name"] = handle.imc
+    info["version"] = str(handle.version) if handle.version else None
+    info["platform"] = getattr(handle, "platform", None)
+    info["model"] = handle.model
+    return info
+
+
+def restore_session(handle, info):
+    '''
+    Loads the state returned by session_info() into a fresh ImcHandle,
+    making it usable without another aaaLogin.
+    '''
+    from imcsdk.imccoreutils import add_handle_to_list
+
+    for attr in _SESSION_ATTRS:
+        if attr in info:
+            setattr(handle, "_ImcSession__" + attr, info[attr])
+    if info.get("name"):
+        handle._ImcSession__imc = info["name"]
+    if info.get("version"):
+        handle._set_version(info["version"])
+    if info.get("platform"):
+        handle._set_platform(platform=info["platform"])
+    if info.get("model"):
+        handle._set_model(info["model"], force=True)
+    add_handle_to_list(handle)
+    return handle
+
+
+def session_cache():
+    from ansible.module_utils.cisco_imc_cache import ImcFileCache
+
+    path = os.environ.get(SESSION_CACHE_ENV, SESSION_CACHE_DIR)
+    return ImcFileCache(os.path.expanduser(path))
+
+
+def query_cache_path():
+    path = os.environ.get(QUERY_CACHE_ENV, QUERY_CACHE_DIR)
+    return os.path.expanduser(path)
+
+
+def _query_cache_dir(handle):
+    import hashlib
+
+    name = hashlib.sha1(handle.uri.encode('utf-8')).hexdigest()
+    return os.path.join(query_cache_path(), name)
+
+
+def query_cache(handle):
+    '''
+    Returns the query cache of the server and user of handle. Every server
+    has its own directory so invalidation only scans that server's entries,
+    and every user one in it, as users with other privileges see other
+    results.
+    '''
+    import hashlib
+    from ansible.module_utils.cisco_imc_cache import ImcFileCache
+
+    name = hashlib.sha1(handle.username.encode('utf-8')).hexdigest()
+    return ImcFileCache(os.path.join(_query_cache_dir(handle), name),
+                        max_entries=QUERY_CACHE_SIZE)
+
+
+def server_query_caches(handle):
+    '''
+    Returns the query caches of every user of the server of handle, a write
+    makes the reads of all of them stale.
+    '''
+    from ansible.module_utils.cisco_imc_cache import ImcFileCache
+
+    path = _query_cache_dir(handle)
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return []
+    return [ImcFileCache(os.path.join(path, name))
+            for name in sorted(names)
+            if os.path.isdir(os.path.join(path, name))]
+
+
+def inventory_cache():
+    from ansible.module_utils.cisco_imc_cache import ImcFileCache
+
+    path = os.environ.get(INVENTORY_CACHE_ENV, INVENTORY_CACHE_DIR)
+    return ImcFileCache(os.path.expanduser(path))
+
+
+def session_descriptor(handle, port=None, secure=None, proxy=None):
+    '''
+    Returns the JSON serializable descriptor of a logged in ImcHandle, as
+    returned by cisco_imc_login and accepted by the server parameter.
+    '''
+    descriptor = session_info(handle)
+    descriptor.update(ip=handle.ip,
+                      username=handle.username,
+                      port=port,
+                      secure=secure,
+                      proxy=proxy,
+                      expires=time.time() + (handle.refresh_period or 600))
+    return descriptor
+
+
+def _session_cache_key(descriptor):
+    return "%s:%s:%s:%s" % (descriptor["ip"], descriptor.get("port"),
+                            descriptor.get("username"),
+                            descriptor.get("session_id"))
+
+
+def cache_session(descriptor, original=None):
+    # later tasks look the session up by the descriptor cisco_imc_login
+    # returned, so a replacement session is stored under the original key
+    session_cache().set(_session_cache_key(original or descriptor),
+                        descriptor, expires=descriptor["expires"])
+
+
+def forget_session(descriptor):
+    session_cache().delete(_session_cache_key(descriptor))
+
+
+class ImcDeadlineExceeded(Exception):
+    pass
+
+
+def limit_requests(handle, deadline):
+    '''
+    Wraps handle.post_xml so no request is sent after deadline and none
+    waits for its response past it, work that ran out of time ends with
+    its next request. aaaLogout still goes out, for LOGOUT_TIMEOUT seconds.
+    '''
+    post_xml = handle.post_xml
+
+    def limited_post_xml(xml_str, read=True, timeout=None):
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            method = xml_str if isinstance(xml_str, bytes) else \
+                xml_str.encode('utf-8')
+            if not method.lstrip().startswith(b'<aaaLogout'):
+                raise ImcDeadlineExceeded("%s: out of time, request not sent"
+                                          % handle.ip)
+            remaining = LOGOUT_TIMEOUT
+        if timeout is not None:
+            remaining = min(timeout, remaining)
+        return post_xml(xml_str, read=read, timeout=remaining)
+
+    handle.post_xml = limited_post_xml
+    return handle
+
+
+def secure_param(value):
+    '''
+    secure is a str option of most modules, imcsdk only uses plain http for
+    secure=False.
+    '''
+    if value is None or isinstance(value, bool):
+        return value
+    from ansible.module_utils.parsing.convert_bool import boolean
+    return boolean(value)
+
+
 class ImcConnection():
 
     @staticmethod
@@ -13,44 +216,170 @@ class ImcConnection():
         return param in ["ip", "username", "password",
                          "port", "secure", "proxy", "server"]
 
-    def __init__(self, module):
+    def __init__(self, module, params=None):
         if HAS_IMCSDK is False:
             results = {}
             results["msg"] = "imcsdk is not installed"
             module.fail_json(**results)
         self.module = module
+        # login parameters, modules driving several servers pass their own
+        self.params = params if params is not None else module.params
         self.handle = None
+        self.descriptor = None
+        self.metrics = None
+        if os.environ.get(METRICS_ENV, "").lower() in ("1", "true", "yes"):
+            from ansible.module_utils.cisco_imc_metrics import module_metrics
+            self.metrics = module_metrics(module)
+        # modules reading through the query cache have a cache parameter
+        self.cache_mode = module.params.get("cache") or "bypass"
+        self.query_cache = None
 
-    def login(self):
-        ansible = self.module.params
-        server = ansible.get('server')
+    def _instrument(self, handle):
+        if self.metrics is not None:
+            self.metrics.instrument(handle)
+        if self.cache_mode != "bypass" or os.path.isdir(query_cache_path()):
+            # installed after the metrics so cache hits are not counted
+            from ansible.module_utils.cisco_imc_query import QueryCache
+            self.query_cache = QueryCache(
+                query_cache(handle), mode=self.cache_mode,
+                ttl=self.module.params.get("cache_ttl"),
+                server_caches=server_query_caches(handle))
+            self.query_cache.install(handle)
+        if self.params.get("deadline"):
+            # servers run by cisco_imc_hosts.run_host
+            limit_requests(handle, self.params["deadline"])
+        return handle
+
+    def _create_handle(self, broker=None):
+        ansible = self.params
+        kwargs = dict(ip=ansible["ip"],
+                      username=ansible["username"],
+                      password=ansible["password"],
+                      port=ansible["port"],
+                      secure=secure_param(ansible["secure"]),
+                      proxy=ansible["proxy"])
+        if broker:
+            from ansible.module_utils.cisco_imc_broker import \
+                BrokeredImcHandle
+            return self._instrument(BrokeredImcHandle(broker, **kwargs))
+
+        from imcsdk.imchandle import ImcHandle
+        return self._instrument(ImcHandle(**kwargs))
+
+    def _broker_login(self, broker):
+        from ansible.module_utils.cisco_imc_broker import BrokerUnavailable
+
+        server = self._create_handle(broker)
+        try:
+            server.login()
+        except BrokerUnavailable as e:
+            # a missing broker must never break a play, log in directly
+            self.module.warn("cisco_imc broker unavailable, logging in "
+                             "directly: %s" % str(e))
+            return None
+        return server
+
+    def _refresh_session(self, handle, descriptor, original):
+        from imcsdk.imcmethodfactory import aaa_keep_alive
+
+        # aaaKeepAlive keeps the cookie, so other forks holding the same
+        # descriptor are not invalidated the way aaaRefresh would
+        response = handle.post_elem(aaa_keep_alive(handle.cookie))
+        if response.error_code != 0:
+            if not handle._ImcSession__password:
+                raise ValueError("session for %s could not be refreshed: %s"
+                                 % (descriptor["ip"], response.error_descr))
+            handle._ImcSession__cookie = None
+            handle.login()
+        refreshed = session_descriptor(handle,
+                                       port=descriptor.get("port"),
+                                       secure=descriptor.get("secure"),
+                                       proxy=descriptor.get("proxy"))
+        cache_session(refreshed, original)
+        return refreshed
+
+    def resume(self, descriptor):
+        '''
+        Rehydrates an ImcHandle from a cisco_imc_login session descriptor
+        without logging in again. The cached copy of the session wins over
+        the one passed in since an earlier task may have refreshed it.
+        '''
+        from imcsdk.imchandle import ImcHandle
+
+        original = descriptor
+        cached = session_cache().get(_session_cache_key(descriptor))
+        if cached is not None:
+            descriptor = cached
+        elif descriptor.get("expires", 0) <= time.time():
+            raise ValueError("session for %s has expired, "
+                             "run cisco_imc_login again" % descriptor["ip"])
+
+        handle = ImcHandle(ip=descriptor["ip"],
+                           username=descriptor.get("username"),
+                           password=self.params.get("password"),
+                           port=descriptor.get("port"),
+                           secure=secure_param(descriptor.get("secure")),
+                           proxy=descriptor.get("proxy"))
+        self._instrument(handle)
+        restore_session(handle, descriptor)
+
+        remaining = descriptor.get("expires", 0) - time.time()
+        margin = max(SESSION_REFRESH_MARGIN,
+                     (descriptor.get("refresh_period") or 0) / 4)
+        if remaining < margin:
+            descriptor = self._refresh_session(handle, descriptor, original)
+
+        self.descriptor = descriptor
+        return handle
+
+    def connect(self):
+        '''
+        Same as login() but raises on errors instead of failing the module.
+        '''
+        if self.cache_mode == "only":
+            # everything is served from the query cache, no session needed
+            self.handle = self._create_handle()
+            self.query_cache.restore_server(self.handle)
+            return self.handle
+
+        server = self.params.get('server')
+        if isinstance(server, dict) and server.get('cookie'):
+            self.handle = self.resume(server)
+            return self.handle
         if server:
             return server
 
-        from imcsdk.imchandle import ImcHandle
+        server = None
+        broker = os.environ.get(BROKER_ENV)
+        if broker:
+            server = self._broker_login(broker)
+        if server is None:
+            server = self._create_handle()
+            server.login()
+        if self.cache_mode == "prefer":
+            self.query_cache.remember_server(server)
+        self.handle = server
+        return server
+
+    def login(self):
         results = {}
         try:
-            server = ImcHandle(ip=ansible["ip"],
-                               username=ansible["username"],
-                               password=ansible["password"],
-                               port=ansible["port"],
-                               secure=ansible["secure"],
-                               proxy=ansible["proxy"])
-            server.login()
+            return self.connect()
         except Exception as e:
             results["msg"] = str(e)
             self.module.fail_json(**results)
-        self.handle = server
-        return server
 
     def logout(self):
-        server = self.module.params.get('server')
+        if self.cache_mode == "only":
+            return False
+        server = self.params.get('server')
         if server:
-            # we used a pre-existing handle from a task.
-            # do not logout
+            # we used a pre-existing handle or session from a task.
+            # do not logout, cisco_imc_logout ends the session
             return False
 
         if self.handle:
+            # a brokered handle leaves the session with the broker
             self.handle.logout()
             return True
         return False
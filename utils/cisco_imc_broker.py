@@ -0,0 +1,408 @@
+#!/usr/bin/env python
+# This file needs to be copied to ansible module_utils
+'''
+Controller side session broker for Cisco IMC servers.
+
+The broker keeps one logged in ImcHandle per server and forwards the XML
+requests of every module over a Unix socket, so a play logs in once per
+server instead of once per task.
+
+    python module_utils/cisco_imc_broker.py --socket /tmp/cisco_imc.sock &
+    export CISCO_IMC_BROKER=/tmp/cisco_imc.sock
+    ansible-playbook -i inventory site.yml
+'''
+
+import argparse
+import hashlib
+import json
+import os
+import signal
+import socket
+import struct
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+try:
+    from imcsdk.imchandle import ImcHandle
+    HAS_IMCSDK = True
+except ImportError:
+    ImcHandle = object
+    HAS_IMCSDK = False
+
+try:
+    from ansible.module_utils.cisco_imc import session_info, restore_session
+except ImportError:
+    # started as a script from the module_utils directory
+    from cisco_imc import session_info, restore_session
+
+
+_HEADER = struct.Struct("!I")
+
+# errorCodes the CIMC returns for an expired or unknown cookie
+_STALE_COOKIE_CODES = ("552", "555")
+
+# the broker owns the session lifecycle, clients may not send these
+_SESSION_METHODS = ("aaaLogin", "aaaLogout", "aaaRefresh")
+
+
+class BrokerError(Exception):
+    pass
+
+
+class BrokerUnavailable(BrokerError):
+    pass
+
+
+def _send(sock, obj):
+    data = json.dumps(obj).encode('utf-8')
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def _recv(sock):
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    data = _recv_exact(sock, _HEADER.unpack(header)[0])
+    if data is None:
+        return None
+    return json.loads(data.decode('utf-8'))
+
+
+def _digest(password):
+    return hashlib.sha256((password or '').encode('utf-8')).hexdigest()
+
+
+def _session_key(key):
+    return (key["ip"], key.get("username"), str(key.get("port")),
+            str(key.get("secure")), key.get("proxy"))
+
+
+class BrokerClient(object):
+    '''
+    Connection from a module process to the broker.
+    '''
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.sock = None
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+        except socket.error as e:
+            sock.close()
+            raise BrokerUnavailable("%s: %s" % (self.socket_path, str(e)))
+        self.sock = sock
+
+    def call(self, op, **kwargs):
+        kwargs["op"] = op
+        with self.lock:
+            if self.sock is None:
+                self._connect()
+            try:
+                _send(self.sock, kwargs)
+                reply = _recv(self.sock)
+            except socket.error as e:
+                self.close()
+                raise BrokerError("broker connection lost: %s" % str(e))
+        if reply is None:
+            self.close()
+            raise BrokerError("broker closed the connection")
+        if not reply.get("ok"):
+            raise BrokerError(reply.get("error"))
+        return reply.get("result")
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+class BrokeredImcHandle(ImcHandle):
+    '''
+    ImcHandle that sends every request through the broker's session.
+
+    login() attaches to (or creates) the brokered session and logout()
+    leaves it open, everything else behaves like a regular ImcHandle.
+    '''
+
+    def __init__(self, socket_path, ip, username, password, port=None,
+                 secure=None, proxy=None):
+        ImcHandle.__init__(self, ip=ip, username=username,
+                           password=password, port=port, secure=secure,
+                           proxy=proxy)
+        self.__client = BrokerClient(socket_path)
+        self.__key = dict(ip=ip, username=username, port=port,
+                          secure=secure, proxy=proxy)
+        self.__password = password
+
+    def login(self, auto_refresh=None, force=None, timeout=None):
+        info = self.__client.call("login", key=self.__key,
+                                  password=self.__password,
+                                  force=bool(force))
+        restore_session(self, info)
+        return True
+
+    def logout(self, timeout=None):
+        self.__client.close()
+        return True
+
+    def post_xml(self, xml_str, read=True, timeout=None):
+        if not read:
+            # the event channel is a long lived stream, it cannot be relayed
+            raise BrokerError("streaming requests are not supported "
+                              "through the broker")
+        if isinstance(xml_str, bytes):
+            xml_str = xml_str.decode('utf-8')
+        return self.__client.call("post", key=self.__key,
+                                  password=self.__password,
+                                  xml=xml_str, timeout=timeout)
+
+
+class _BrokerSession(object):
+
+    def __init__(self, params, password):
+        self.params = params
+        self.password = password
+        self.digest = _digest(password)
+        self.lock = threading.Lock()
+        self.handle = None
+        self.last_used = time.time()
+        self.last_refresh = time.time()
+        self.logins = 0
+        self.requests = 0
+
+    def connect(self):
+        handle = ImcHandle(password=self.password, **self.params)
+        handle.login()
+        self.logout()
+        self.handle = handle
+        self.logins += 1
+        self.last_refresh = time.time()
+
+    def logout(self):
+        if self.handle is None:
+            return
+        try:
+            self.handle.logout()
+        except Exception:
+            pass
+        self.handle = None
+
+    def keepalive(self):
+        if self.handle is None or not self.handle.refresh_period:
+            return
+        if time.time() - self.last_refresh < self.handle.refresh_period / 2:
+            return
+        try:
+            self.handle._refresh(auto_relogin=True)
+            # _refresh arms imcsdk's own refresh timer, the broker
+            # schedules refreshes itself under the session lock
+            self.handle._stop_refresh_timer()
+        except Exception:
+            self.connect()
+        self.last_refresh = time.time()
+
+    def post(self, xml_str, timeout=None):
+        root = ET.fromstring(xml_str)
+        if root.tag in _SESSION_METHODS:
+            raise BrokerError("%s is handled by the broker" % root.tag)
+
+        self.last_used = time.time()
+        self.requests += 1
+        for attempt in range(2):
+            if self.handle is None:
+                self.connect()
+            if 'cookie' in root.attrib:
+                root.set('cookie', self.handle.cookie)
+            response = self.handle.post_xml(ET.tostring(root),
+                                            timeout=timeout)
+            if attempt == 0 and _is_stale_cookie(response):
+                # the CIMC dropped the session (reboot, timeout), relogin
+                self.logout()
+                continue
+            return response
+        return response
+
+
+def _is_stale_cookie(response):
+    try:
+        root = ET.fromstring(response)
+    except ET.ParseError:
+        return False
+    return root.attrib.get('errorCode') in _STALE_COOKIE_CODES
+
+
+class ImcBroker(object):
+
+    def __init__(self, idle_timeout=900, keepalive_interval=30):
+        self.idle_timeout = idle_timeout
+        self.keepalive_interval = keepalive_interval
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def _session(self, key, password, force=False):
+        params = dict((k, key.get(k)) for k in
+                      ("ip", "username", "port", "secure", "proxy"))
+        key = _session_key(params)
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None:
+                session = _BrokerSession(params, password)
+                self.sessions[key] = session
+
+        with session.lock:
+            if session.digest != _digest(password):
+                # never lend a session to different credentials; a changed
+                # password replaces the session once it logs in
+                candidate = _BrokerSession(params, password)
+                candidate.connect()
+                session.logout()
+                session.password = password
+                session.digest = candidate.digest
+                session.handle = candidate.handle
+                session.logins += 1
+            elif session.handle is None or force:
+                session.connect()
+        return session
+
+    def login(self, key, password, force=False, **kwargs):
+        session = self._session(key, password, force)
+        session.last_used = time.time()
+        return session_info(session.handle)
+
+    def post(self, key, password, xml, timeout=None, **kwargs):
+        session = self._session(key, password)
+        with session.lock:
+            return session.post(xml, timeout=timeout)
+
+    def stats(self, **kwargs):
+        with self.lock:
+            sessions = list(self.sessions.values())
+        return [{"ip": s.params["ip"], "username": s.params["username"],
+                 "logins": s.logins, "requests": s.requests,
+                 "connected": s.handle is not None} for s in sessions]
+
+    def dispatch(self, request):
+        op = request.pop("op", None)
+        if op not in ("login", "post", "stats"):
+            raise BrokerError("unknown operation: %s" % op)
+        return getattr(self, op)(**request)
+
+    def maintain(self):
+        while not self.stopped.wait(self.keepalive_interval):
+            with self.lock:
+                sessions = list(self.sessions.items())
+            now = time.time()
+            for key, session in sessions:
+                with session.lock:
+                    if now - session.last_used > self.idle_timeout:
+                        session.logout()
+                        with self.lock:
+                            self.sessions.pop(key, None)
+                        continue
+                    try:
+                        session.keepalive()
+                    except Exception:
+                        session.logout()
+
+    def shutdown(self):
+        self.stopped.set()
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions = {}
+        for session in sessions:
+            with session.lock:
+                session.logout()
+
+
+class _BrokerRequestHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        while True:
+            try:
+                request = _recv(self.request)
+            except (socket.error, ValueError):
+                return
+            if request is None:
+                return
+            try:
+                reply = {"ok": True,
+                         "result": self.server.broker.dispatch(request)}
+            except Exception as e:
+                reply = {"ok": False, "error": str(e)}
+            _send(self.request, reply)
+
+
+class _BrokerServer(socketserver.ThreadingMixIn,
+                    socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(socket_path, idle_timeout=900, keepalive_interval=30):
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    broker = ImcBroker(idle_timeout=idle_timeout,
+                       keepalive_interval=keepalive_interval)
+    old_umask = os.umask(0o077)
+    try:
+        server = _BrokerServer(socket_path, _BrokerRequestHandler)
+    finally:
+        os.umask(old_umask)
+    server.broker = broker
+
+    maintainer = threading.Thread(target=broker.maintain)
+    maintainer.daemon = True
+    maintainer.start()
+
+    def _stop(signum, frame):
+        threading.Thread(target=server.shutdown).start()
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    try:
+        server.serve_forever()
+    finally:
+        broker.shutdown()
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cisco IMC session broker")
+    parser.add_argument("--socket", required=True,
+                        help="path of the Unix socket to listen on")
+    parser.add_argument("--idle-timeout", type=int, default=900,
+                        help="seconds before an unused session is logged out")
+    parser.add_argument("--keepalive-interval", type=int, default=30,
+                        help="seconds between session refresh checks")
+    args = parser.parse_args()
+
+    if not HAS_IMCSDK:
+        parser.error("imcsdk is not installed")
+    serve(args.socket, args.idle_timeout, args.keepalive_interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+# This file needs to be copied to ansible module_utils
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+
+class ImcFileCache(object):
+    '''
+    Small JSON file cache shared by all forks on the controller.
+
+    Every entry is a file written atomically, a lock file serializes
+    concurrent readers and writers and expired entries are evicted when
+    they are read or when purge() runs. With max_entries the least recently
+    used entries are evicted once the cache grows past it.
+
+    A count file keeps the number of entries, raised by every set() adding
+    one, so only the set() taking it past max_entries lists the directory,
+    evicts a tenth more than needed and writes down the number left.
+    Removals do not lower it, the count only gets recounted sooner.
+    '''
+
+    def __init__(self, path, max_entries=None):
+        self.path = path
+        self.max_entries = max_entries
+        try:
+            os.makedirs(path, 0o700)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        self.lock_path = os.path.join(path, '.lock')
+        self.count_path = os.path.join(path, '.count')
+
+    @contextmanager
+    def lock(self):
+        with open(self.lock_path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _file(self, key):
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, name + '.json')
+
+    def _read(self, file_name):
+        try:
+            with open(file_name) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _write(self, file_name, entry):
+        fd, tmp_name = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        os.rename(tmp_name, file_name)
+
+    def _remove(self, file_name):
+        try:
+            os.remove(file_name)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _expired(entry, now):
+        return entry.get('expires') is not None and entry['expires'] <= now
+
+    def get(self, key):
+        file_name = self._file(key)
+        with self.lock():
+            entry = self._read(file_name)
+            if entry is None:
+                return None
+            if self._expired(entry, time.time()):
+                self._remove(file_name)
+                return None
+            if self.max_entries:
+                # the mtime orders entries by last use
+                os.utime(file_name, None)
+        return entry['value']
+
+    def set(self, key, value, ttl=None, expires=None):
+        if expires is None and ttl is not None:
+            expires = time.time() + ttl
+        entry = {'key': key, 'expires': expires, 'value': value}
+        file_name = self._file(key)
+        with self.lock():
+            added = not os.path.exists(file_name)
+            self._write(file_name, entry)
+            if self.max_entries and added:
+                self._count_added()
+
+    def _entries(self):
+        for name in os.listdir(self.path):
+            if name.endswith('.json'):
+                yield os.path.join(self.path, name)
+
+    def _count_added(self):
+        count = self._read(self.count_path)
+        if count is None:
+            count = len(list(self._entries()))
+        else:
+            count += 1
+        if count > self.max_entries:
+            count = self._evict()
+        self._write(self.count_path, count)
+
+    def _evict(self):
+        '''
+        Evicts the least recently used entries past max_entries and a tenth
+        more, so the next max_entries // 10 new entries do not list the
+        directory again. Returns the number of entries left.
+        '''
+        file_names = list(self._entries())
+        excess = len(file_names) - self.max_entries
+        if excess <= 0:
+            return len(file_names)
+        excess += self.max_entries // 10
+
+        def last_use(file_name):
+            try:
+                return os.path.getmtime(file_name)
+            except OSError:
+                return 0
+        evicted = sorted(file_names, key=last_use)[:excess]
+        for file_name in evicted:
+            self._remove(file_name)
+        return len(file_names) - len(evicted)
+
+    def delete_matching(self, predicate):
+        '''
+        Deletes every entry for which predicate(key, value) is true, reading
+        every entry of the cache.
+        '''
+        with self.lock():
+            for file_name in self._entries():
+                entry = self._read(file_name)
+                if entry is not None and predicate(entry['key'],
+                                                   entry['value']):
+                    self._remove(file_name)
+
+    def delete(self, key):
+        with self.lock():
+            self._remove(self._file(key))
+
+    def purge(self):
+        now = time.time()
+        with self.lock():
+            for file_name in self._entries():
+                entry = self._read(file_name)
+                if entry is None or self._expired(entry, now):
+                    self._remove(file_name)
@@ -0,0 +1,136 @@
+# This file needs to be copied to ansible module_utils
+import threading
+import time
+
+# login parameters a hosts entry may override
+LOGIN_PARAMS = ['username', 'password', 'port', 'secure', 'proxy']
+
+
+def host_params(module, host):
+    '''
+    Returns the login parameters of one entry of hosts, an IP address or a
+    dict with ip, optionally a name, and any of LOGIN_PARAMS but password,
+    the rest from the module. The password of a server is the one of its
+    name or ip in host_passwords, the password of the module otherwise.
+    '''
+    if not isinstance(host, dict):
+        host = dict(ip=host)
+    if 'password' in host:
+        # hosts is not no_log, the password would show in the module_args
+        raise ValueError("hosts entry %s has a password, per server "
+                         "passwords go into host_passwords" % host.get('ip'))
+    params = dict(ip=host['ip'], name=host.get('name') or host['ip'],
+                  server=None)
+    for param in LOGIN_PARAMS:
+        params[param] = host.get(param, module.params.get(param))
+    passwords = module.params.get('host_passwords') or {}
+    for key in (params['name'], params['ip']):
+        if key in passwords:
+            params['password'] = passwords[key]
+            break
+    return params
+
+
+def run_host(params, work, timeout):
+    '''
+    Runs work(params) for one server and returns the dict work returned
+    with the ip and elapsed seconds. params get a deadline timeout seconds
+    from now, ImcConnection sends no request after it and none waits past
+    it, so work that takes too long ends with its next request and the
+    caller's slot is only free once the server stopped sending requests.
+    '''
+    start = time.time()
+    params = dict(params, deadline=start + timeout)
+    try:
+        outcome = dict(work(params))
+    except Exception as e:
+        outcome = dict(failed=True, msg=str(e))
+    if outcome.get('failed') and time.time() > params['deadline']:
+        outcome['msg'] = "timed out after %d seconds: %s" % (
+            timeout, outcome.get('msg', ''))
+    result = dict(ip=params['ip'], name=params.get('name', params['ip']),
+                  elapsed=round(time.time() - start, 3))
+    result.update(outcome)
+    return result
+
+
+def run_hosts(hosts, work, max_workers=10, timeout=300, on_result=None):
+    '''
+    Runs work(params) for the login parameters of every server in hosts,
+    max_workers servers at a time, each with its own timeout, and returns
+    the results of run_host in the order of hosts. on_result(result) is
+    called with every result as soon as the server is done and may strip
+    what should not be kept until all of them are.
+    '''
+    from concurrent.futures import ThreadPoolExecutor
+
+    def run(params):
+        result = run_host(params, work, timeout)
+        if on_result is not None:
+            on_result(result)
+        return result
+
+    max_workers = max(1, min(max_workers, len(hosts) or 1))
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(run, hosts))
+
+
+def run_rolling(hosts, work, max_in_flight=10, max_per_group=0, stagger=0,
+                timeout=300, on_result=None):
+    '''
+    Same as run_hosts, except that at most max_per_group servers of the
+    same group, the group of their login parameters, run at a time, and a
+    server starts stagger seconds after the one before it at the earliest.
+    Servers start in the order of hosts, but one waiting for its group does
+    not hold back the servers of the other groups. A server out of time
+    keeps its place until its work ended, see run_host.
+    '''
+    max_in_flight = max(1, max_in_flight)
+    max_per_group = max(0, max_per_group)
+    results = [None] * len(hosts)
+    pending = list(range(len(hosts)))
+    running = {}
+    state = dict(in_flight=0, next_start=0)
+    condition = threading.Condition()
+
+    def startable():
+        for index in pending:
+            group = hosts[index].get('group')
+            if not max_per_group or group is None or \
+                    running.get(group, 0) < max_per_group:
+                return index
+        return None
+
+    def run(index):
+        group = hosts[index].get('group')
+        try:
+            results[index] = run_host(hosts[index], work, timeout)
+            if on_result is not None:
+                on_result(results[index])
+        finally:
+            with condition:
+                running[group] -= 1
+                state['in_flight'] -= 1
+                condition.notify_all()
+
+    with condition:
+        while pending:
+            index = startable() if state['in_flight'] < max_in_flight else None
+            if index is None:
+                condition.wait()
+                continue
+            delay = state['next_start'] - time.time()
+            if delay > 0:
+                condition.wait(delay)
+                continue
+            pending.remove(index)
+            group = hosts[index].get('group')
+            running[group] = running.get(group, 0) + 1
+            state['in_flight'] += 1
+            state['next_start'] = time.time() + stagger
+            worker = threading.Thread(target=run, args=(index,))
+            worker.daemon = True
+            worker.start()
+        while state['in_flight']:
+            condition.wait()
+    return results
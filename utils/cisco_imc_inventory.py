@@ -0,0 +1,215 @@
+# This file needs to be copied to ansible module_utils
+import hashlib
+import json
+import time
+
+# computeRackUnit properties that change with the hardware of a section
+SECTION_INDICATORS = {
+    "cpu": ("num_of_cpus", "num_of_cores", "num_of_cores_enabled",
+            "num_of_threads"),
+    "memory": ("total_memory", "available_memory", "memory_speed"),
+    "vic": ("num_of_adaptors",),
+    "vNICs": ("num_of_eth_host_ifs",),
+    "vHBAs": ("num_of_fc_host_ifs",),
+}
+
+# a different board or server behind the address invalidates every section
+SERVER_INDICATORS = ("serial", "uuid", "model")
+
+# sections without an indicator are fetched again after this many seconds
+INVENTORY_MAX_AGE = 7 * 24 * 3600
+
+
+def inventory_spec():
+    from imcsdk.apis.server.inventory import inventory_spec as spec
+    return spec
+
+
+def fingerprint(data):
+    dump = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(dump.encode("utf-8")).hexdigest()
+
+
+def _should_ignore(component, mo):
+    # the ignored properties need not be among the section's props
+    for ignore in component.get("ignore", []):
+        if getattr(mo, ignore["prop"], None) == ignore["value"]:
+            return True
+    return False
+
+
+def _clean(value):
+    return value.strip() if value else value
+
+
+def section_classes(sections, spec=None):
+    '''
+    Returns the class ids the sections are read from, the section's own and
+    the ones of properties taken from a child object.
+    '''
+    spec = spec or inventory_spec()
+    class_ids = []
+    for name in sections:
+        component = spec[name]
+        for class_id in [component["class_id"]] + \
+                [each["class"] for each in component["props"]
+                 if "class" in each]:
+            if class_id not in class_ids:
+                class_ids.append(class_id)
+    return class_ids
+
+
+def fetch_classes(handle, class_ids, concurrency=1):
+    '''
+    Returns {class_id: [mo, ...]}, the classes resolved in parallel over the
+    session, the XML API has no request resolving several classes.
+    '''
+    from ansible.module_utils.cisco_imc_query import resolve_classes
+    return resolve_classes(handle, class_ids, concurrency=concurrency)
+
+
+def _parent_dn(dn):
+    return dn.rsplit("/", 1)[0]
+
+
+def collect_section(handle, name, spec=None, mos=None):
+    '''
+    Returns the list of dicts of one inventory_spec section, the same as
+    imcsdk's inventory_get builds, with the values read through the
+    cached accessors of cisco_imc_query. mos are the objects of
+    section_classes, fetched by fetch_classes unless given.
+    '''
+    from ansible.module_utils.cisco_imc_query import mo_accessor
+
+    spec = spec or inventory_spec()
+    component = spec[name]
+    if mos is None:
+        mos = fetch_classes(handle, section_classes([name], spec))
+    props = [each["prop"] for each in component["props"]
+             if "class" not in each]
+    sub_props = [each for each in component["props"] if "class" in each]
+
+    # inventory_get reads these with a query_children per object, the
+    # children of every object come from one class query instead
+    children = {}
+    for each in sub_props:
+        for child in mos.get(each["class"], []):
+            children.setdefault((each["class"], _parent_dn(child.dn)),
+                                child)
+
+    section = []
+    for mo in mos.get(component["class_id"], []):
+        if _should_ignore(component, mo):
+            continue
+        names, getter = mo_accessor(mo.__class__, props)
+        values = dict(zip(names, getter(mo)))
+        mo_dict = dict((prop, _clean(values.get(prop))) for prop in props)
+        for each in sub_props:
+            child = children.get((each["class"], mo.dn))
+            mo_dict[each["prop"]] = \
+                _clean(getattr(child, each["prop"], None)) if child else None
+        if mo_dict:
+            section.append(mo_dict)
+    return section
+
+
+def server_indicators(handle):
+    '''
+    Returns the change indicators of every rack unit, from one class
+    query, or None when the server has no computeRackUnit.
+    '''
+    from ansible.module_utils.cisco_imc_query import mo_accessor
+
+    properties = set(SERVER_INDICATORS)
+    for names in SECTION_INDICATORS.values():
+        properties.update(names)
+    units = handle.query_classid("computeRackUnit") or []
+    if not units:
+        return None
+    indicators = {}
+    for unit in units:
+        names, getter = mo_accessor(unit.__class__, properties)
+        indicators[unit.dn] = dict(zip(names, getter(unit)))
+    return indicators
+
+
+def section_indicators(indicators, name):
+    '''
+    Returns the indicator values a section of the snapshot is checked
+    against, the server's and the section's own of every rack unit.
+    '''
+    if indicators is None:
+        return None
+    names = SERVER_INDICATORS + SECTION_INDICATORS.get(name, ())
+    return sorted([dn, [unit.get(prop) for prop in names]]
+                  for dn, unit in indicators.items())
+
+
+def stale_sections(snapshot, indicators, sections, max_age, now):
+    '''
+    Returns the sections that have to be fetched again: the ones not in
+    snapshot, those whose indicators changed since they were collected and
+    those without an indicator of their own collected more than max_age
+    seconds ago.
+    '''
+    if indicators is None:
+        return list(sections)
+
+    stale = []
+    for name in sections:
+        saved = snapshot.get(name)
+        if saved is None or \
+                saved["indicators"] != section_indicators(indicators, name):
+            stale.append(name)
+        elif name not in SECTION_INDICATORS and \
+                now - saved["collected"] >= max_age:
+            stale.append(name)
+    return stale
+
+
+def collect_inventory(handle, snapshot=None, sections=None,
+                      max_age=INVENTORY_MAX_AGE, now=None, concurrency=1):
+    '''
+    Collects the inventory of sections (all of inventory_spec by default),
+    fetching only the ones stale_sections finds in snapshot, the previous
+    return value ({} on the first run, None to collect everything without
+    querying the indicators), and returns:
+
+        inventory        {section: [dicts]}, fetched or from the snapshot
+        snapshot         to pass to the next run, with the sections that
+                         were not asked for carried over
+        changed_sections sections whose fingerprint differs from snapshot
+        fetched_sections sections queried from the server
+
+    The classes of all fetched sections are resolved together, see
+    fetch_classes.
+    '''
+    spec = inventory_spec()
+    sections = list(sections or sorted(spec))
+    now = time.time() if now is None else now
+
+    if snapshot is None:
+        indicators = None
+        snapshot = {}
+    else:
+        indicators = server_indicators(handle)
+    fetched = stale_sections(snapshot, indicators, sections, max_age, now)
+    mos = fetch_classes(handle, section_classes(fetched, spec), concurrency)
+
+    new_snapshot = dict(snapshot)
+    inventory = {}
+    changed = []
+    for name in sections:
+        if name in fetched:
+            data = collect_section(handle, name, spec, mos)
+            entry = dict(fingerprint=fingerprint(data), collected=now,
+                         indicators=section_indicators(indicators, name),
+                         data=data)
+            saved = snapshot.get(name)
+            if saved is None or saved["fingerprint"] != entry["fingerprint"]:
+                changed.append(name)
+            new_snapshot[name] = entry
+        inventory[name] = new_snapshot[name]["data"]
+
+    return dict(inventory=inventory, snapshot=new_snapshot,
+                changed_sections=changed, fetched_sections=fetched)
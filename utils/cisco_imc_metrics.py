@@ -0,0 +1,123 @@
+# This file needs to be copied to ansible module_utils
+import re
+import threading
+import time
+
+# only the slowest calls are returned one by one, the rest is in the totals
+MAX_CALLS = 50
+
+_METHOD_RE = re.compile(br'<\s*([A-Za-z]+)')
+
+
+def _size(data):
+    if data is None:
+        return 0
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    return len(data)
+
+
+def _method(xml_str):
+    if not isinstance(xml_str, bytes):
+        xml_str = xml_str.encode('utf-8')
+    match = _METHOD_RE.search(xml_str)
+    return match.group(1).decode('utf-8') if match else 'unknown'
+
+
+class ImcMetrics(object):
+    '''
+    Request counters of every ImcHandle instrumented by one module run.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.methods = {}
+        self.hosts = {}
+        self.calls = []
+
+    def record(self, ip, method, sent, received, latency, error=None):
+        with self.lock:
+            for totals in (self.methods.setdefault(method, {}),
+                           self.hosts.setdefault(ip, {})):
+                totals['requests'] = totals.get('requests', 0) + 1
+                totals['bytes_sent'] = totals.get('bytes_sent', 0) + sent
+                totals['bytes_received'] = \
+                    totals.get('bytes_received', 0) + received
+                totals['time'] = totals.get('time', 0.0) + latency
+                totals['max_time'] = max(totals.get('max_time', 0.0), latency)
+                if error:
+                    totals['errors'] = totals.get('errors', 0) + 1
+            call = dict(ip=ip, method=method, bytes_sent=sent,
+                        bytes_received=received, time=round(latency, 4))
+            if error:
+                call['error'] = error
+            self.calls.append(call)
+            if len(self.calls) > 2 * MAX_CALLS:
+                self.calls.sort(key=lambda call: -call['time'])
+                del self.calls[MAX_CALLS:]
+
+    def instrument(self, handle):
+        '''
+        Wraps handle.post_xml, every XML API request of the handle, login
+        included, goes through it.
+        '''
+        post_xml = handle.post_xml
+        ip = handle.ip
+
+        def instrumented_post_xml(xml_str, read=True, timeout=None):
+            start = time.time()
+            try:
+                response = post_xml(xml_str, read=read, timeout=timeout)
+            except Exception as e:
+                self.record(ip, _method(xml_str), _size(xml_str), 0,
+                            time.time() - start, error=str(e))
+                raise
+            self.record(ip, _method(xml_str), _size(xml_str),
+                        _size(response) if read else 0, time.time() - start)
+            return response
+
+        handle.post_xml = instrumented_post_xml
+        return handle
+
+    def report(self):
+        with self.lock:
+            methods = dict((k, dict(v)) for k, v in self.methods.items())
+            hosts = dict((k, dict(v)) for k, v in self.hosts.items())
+            calls = sorted(self.calls, key=lambda call: -call['time'])
+        for totals in list(methods.values()) + list(hosts.values()):
+            totals['time'] = round(totals['time'], 4)
+            totals['max_time'] = round(totals['max_time'], 4)
+        return dict(requests=sum(m['requests'] for m in methods.values()),
+                    bytes_sent=sum(m['bytes_sent'] for m in methods.values()),
+                    bytes_received=sum(m['bytes_received']
+                                       for m in methods.values()),
+                    request_time=round(sum(m['time']
+                                           for m in methods.values()), 4),
+                    run_time=round(time.time() - self.start, 4),
+                    methods=methods,
+                    hosts=hosts,
+                    slowest_calls=calls[:MAX_CALLS])
+
+
+def module_metrics(module):
+    '''
+    Returns the ImcMetrics of module, creating it on first use and making
+    exit_json and fail_json return its report as imc_metrics.
+    '''
+    metrics = getattr(module, '_imc_metrics', None)
+    if metrics is not None:
+        return metrics
+
+    metrics = ImcMetrics()
+    module._imc_metrics = metrics
+
+    def with_metrics(original):
+        def wrapper(*args, **kwargs):
+            kwargs.setdefault('imc_metrics', metrics.report())
+            return original(*args, **kwargs)
+        return wrapper
+
+    module.exit_json = with_metrics(module.exit_json)
+    module.fail_json = with_metrics(module.fail_json)
+    return metrics
@@ -0,0 +1,224 @@
+# This file needs to be copied to ansible module_utils
+from importlib import import_module
+from copy import deepcopy
+import json
+
+from ansible.module_utils.cisco_imc_query import resolve_many
+
+
+class MoIndex(object):
+    '''
+    Existing objects below a set of prefetched subtrees, keyed by dn.
+    '''
+
+    def __init__(self, roots, mos):
+        self.roots = roots
+        self.mos = dict((mo.dn, mo) for mo in mos)
+
+    def covers(self, dn):
+        for root in self.roots:
+            if dn == root or dn.startswith(root + '/'):
+                return True
+        return False
+
+    def lookup(self, handle, dn):
+        if self.covers(dn):
+            # anything below a prefetched root that was not returned does not exist
+            return self.mos.get(dn)
+        return handle.query_dn(dn)
+
+
+def parent_dns(objects):
+    '''
+    Returns the explicit parent_mo_or_dn of every object in the tree, without
+    the ones that are already below another parent in the list.
+    '''
+    dns = set()
+    for managed_object in objects:
+        parent = managed_object['properties'].get('parent_mo_or_dn')
+        if parent:
+            dns.add(str(parent))
+        dns.update(parent_dns(managed_object.get('children') or []))
+
+    roots = []
+    for dn in sorted(dns):
+        if not any(dn == root or dn.startswith(root + '/') for root in roots):
+            roots.append(dn)
+    return roots
+
+
+def prefetch_objects(imc, objects):
+    roots = parent_dns(objects)
+
+    def resolver(dn):
+        return imc.handle.query_dn(dn, hierarchy=True) or []
+
+    mos = []
+    for subtree in resolve_many(resolver, roots).values():
+        mos.extend(subtree)
+    return MoIndex(roots, mos)
+
+
+def diff_properties(existing_mo, properties):
+    '''
+    Returns {prop: {'before': live value, 'after': desired value}} for every
+    desired property that differs from existing_mo, or from nothing when
+    the object does not exist yet.
+    '''
+    from imcsdk.imccoreutils import prop_exists
+
+    diff = {}
+    for name, value in properties.items():
+        if name == 'parent_mo_or_dn' or value is None:
+            continue
+        before = None
+        if existing_mo:
+            if not prop_exists(existing_mo, name):
+                raise ValueError("Invalid Property Name Exception - "
+                                 "Class [%s]: Prop <%s> "
+                                 % (existing_mo.__class__.__name__, name))
+            before = getattr(existing_mo, name)
+        if str(value) != before:
+            diff[name] = {'before': before, 'after': str(value)}
+    return diff
+
+
+def traverse_objects(module, imc, managed_object, mo='', staged=None):
+    '''
+    Configures managed_object and its children.  When a staged list is
+    passed the changes are appended to it instead of being committed.
+    '''
+    mo_module = import_module(managed_object['module'])
+    mo_class = getattr(mo_module, managed_object['class'])
+
+    properties = managed_object['properties']
+    if not properties.get('parent_mo_or_dn'):
+        properties['parent_mo_or_dn'] = mo
+
+    mo = mo_class(**properties)
+
+    if imc.mo_index is not None:
+        existing_mo = imc.mo_index.lookup(imc.handle, mo.dn)
+    else:
+        existing_mo = imc.handle.query_dn(mo.dn)
+
+    change = None
+    if module.params['state'] == 'absent':
+        # mo must exist, but all properties do not have to match
+        if existing_mo:
+            change = {'action': 'deleted', 'properties': {}}
+            if staged is not None:
+                existing_mo.status = 'deleted'
+                staged.append(existing_mo)
+            elif not module.check_mode:
+                imc.handle.remove_mo(existing_mo)
+    else:
+        diff = diff_properties(existing_mo, properties)
+        if not existing_mo:
+            change = {'action': 'created', 'properties': diff}
+            if staged is not None:
+                mo.status = 'created'
+                staged.append(mo)
+            elif not module.check_mode:
+                # existence is already known, skip add_mo's own query_dn
+                imc.handle.add_mo(mo, modify_present=False)
+        elif diff:
+            change = {'action': 'modified', 'properties': diff}
+            # only send the naming and changed properties, rewriting
+            # unchanged ones can have side effects (e.g. pending BIOS tokens)
+            kwargs = dict((name, properties[name]) for name in diff)
+            for name in mo_class.naming_props:
+                kwargs[name] = getattr(mo, name)
+            minimal_mo = mo_class(parent_mo_or_dn=properties['parent_mo_or_dn'], **kwargs)
+            if staged is not None:
+                minimal_mo.status = 'modified'
+                staged.append(minimal_mo)
+            elif not module.check_mode:
+                imc.handle.set_mo(minimal_mo)
+
+    if change:
+        change['dn'] = mo.dn
+        change['class'] = managed_object['class']
+        imc.result['changes'].append(change)
+        imc.result['changed'] = True
+
+    if managed_object.get('children'):
+        for child in managed_object['children']:
+            # explicit deep copy of child object since traverse_objects may modify parent mo information
+            copy_of_child = deepcopy(child)
+            # parent by dn, a parent mo object would carry its staged children in its own xml
+            traverse_objects(module, imc, copy_of_child, mo.dn, staged)
+
+
+def commit_objects(module, imc, staged):
+    '''
+    Commits the staged objects in transactions of at most transaction_size
+    objects and records the outcome of every object.
+    '''
+    from imcsdk.imccoreutils import ConfigConfMosConstants as Const
+
+    object_results = []
+    for mo in staged:
+        object_results.append({'dn': mo.dn,
+                               'class': mo.__class__.__name__,
+                               'action': mo.status})
+    imc.result['object_results'] = object_results
+    if module.check_mode:
+        return []
+
+    failed = []
+    size = max(1, module.params['transaction_size'])
+    for start in range(0, len(staged), size):
+        chunk = staged[start:start + size]
+        response = imc.handle.set_mos(chunk)
+        response_mos = response[Const.RESPONSE_MOS]
+        passed = response_mos.get(Const.RESPONSE_PASSED_MOS, {})
+        errors = response_mos.get(Const.RESPONSE_FAILED_MOS, {})
+        for result in object_results[start:start + size]:
+            if result['dn'] in errors:
+                result['status'] = 'failed'
+                result['error'] = errors[result['dn']]
+                failed.append(result)
+            elif result['dn'] in passed:
+                result['status'] = 'committed'
+            else:
+                result['status'] = response[Const.RESPONSE_STATUS]
+        if failed:
+            # later transactions are not attempted once one has failed
+            for result in object_results[start + size:]:
+                result['status'] = 'not committed'
+            break
+    return failed
+
+
+def load_objects(params):
+    '''
+    Returns the objects tree from the objects or json_config_file parameter.
+    '''
+    if params.get('objects'):
+        return params['objects']
+    # either objects or json_config_file will be specified, so if there is no objects option use a config file
+    with open(params['json_config_file']) as f:
+        return json.load(f)['objects']
+
+
+def apply_objects(module, imc, objects):
+    '''
+    Configures the objects tree on a logged in ImcConnection, filling in
+    imc.result.  Returns the objects that failed to commit.
+    '''
+    # note that all objects specified in the object list report a single result (including a single changed).
+    imc.result['changed'] = False
+    imc.result['changes'] = []
+    imc.mo_index = None
+
+    if module.params['prefetch']:
+        imc.mo_index = prefetch_objects(imc, objects)
+
+    staged = [] if module.params['transaction'] else None
+    for managed_object in objects:
+        traverse_objects(module, imc, managed_object, staged=staged)
+
+    if staged:
+        return commit_objects(module, imc, staged)
+    return []
@@ -0,0 +1,234 @@
+# This file needs to be copied to ansible module_utils
+import random
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+# adminPower of computeRackUnit and computeServerNode per power action
+POWER_ACTIONS = {"up": "up", "down": "down",
+                 "graceful-down": "soft-shut-down",
+                 "cycle": "cycle-immediate"}
+
+# (action, operPower it ends in) steps taking a server from its operPower
+# to a state of cisco_imc_server, nothing to do for missing ones. reset and
+# boot power the server down and up again instead of cycle-immediate, whose
+# off phase polls may never see.
+POWER_STEPS = {
+    "on": {"off": [("up", "on")]},
+    "boot": {"off": [("up", "on")],
+             "on": [("down", "off"), ("up", "on")]},
+    "reset": {"on": [("down", "off"), ("up", "on")]},
+    "shutdown": {"on": [("graceful-down", "off")]},
+    "off": {"on": [("down", "off")]},
+}
+
+# first poll interval of the wait, doubled up to the max_interval given
+POLL_MIN_INTERVAL = 0.5
+
+
+def poll_intervals(min_interval, max_interval, rng=random):
+    '''
+    Yields the seconds to wait between polls, doubling from min_interval up
+    to max_interval, each one taken at random from its upper half so the
+    polls of servers powered at the same time spread out.
+    '''
+    interval = min(min_interval, max_interval)
+    while True:
+        yield rng.uniform(interval / 2.0, interval)
+        interval = min(interval * 2, max_interval)
+
+
+class EventChannel(object):
+    '''
+    The event channel of a logged in handle. The response to eventSubscribe
+    stays open and the IMC writes every MO change to it, a line with the
+    length followed by the XML document, which a reader thread matches
+    against the watched dn and attribute values.
+    '''
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.stream = None
+        self.error = None
+        self.watches = []
+        self.lock = threading.Lock()
+
+    def open(self):
+        '''
+        Subscribes to the events, returns False when the handle cannot
+        stream them, e.g. a brokered one.
+        '''
+        from imcsdk import imcxmlcodec as xc
+        from imcsdk.imcmethodfactory import event_subscribe
+
+        try:
+            self.stream = self.handle.post_xml(
+                xc.to_xml_str(event_subscribe(self.handle.cookie)),
+                read=False)
+        except Exception as e:
+            self.error = str(e)
+            return False
+        reader = threading.Thread(target=self._read)
+        reader.daemon = True
+        reader.start()
+        return True
+
+    def _read(self):
+        try:
+            while True:
+                line = self.stream.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                # firmware without events answers with an error document
+                # instead of a length
+                self._dispatch(ET.fromstring(
+                    self.stream.read(int(line.strip()))))
+        except Exception as e:
+            self.error = str(e)
+        self.error = self.error or "event channel closed"
+
+    def _dispatch(self, document):
+        with self.lock:
+            watches = list(self.watches)
+        for elem in document.iter():
+            dn = elem.attrib.get("dn")
+            for watch in watches:
+                value = elem.attrib.get(watch["attribute"])
+                if dn == watch["dn"] and value in watch["values"]:
+                    watch["value"] = value
+                    watch["event"].set()
+
+    def watch(self, dn, attribute, values):
+        '''
+        Returns a watch whose event is set once attribute (the XML name) of
+        dn changes to one of values.
+        '''
+        watch = dict(dn=dn, attribute=attribute, values=values, value=None,
+                     event=threading.Event(), channel=self)
+        with self.lock:
+            self.watches.append(watch)
+        return watch
+
+    def unwatch(self, watch):
+        with self.lock:
+            if watch in self.watches:
+                self.watches.remove(watch)
+
+    def close(self):
+        # closing the stream would wait for the reader blocked on it, the
+        # IMC ends the stream and with it the reader when the session ends
+        with self.lock:
+            self.watches = []
+
+
+def event_channel(handle):
+    '''
+    Returns the opened EventChannel of handle, None without one.
+    '''
+    if not getattr(handle, "evt_channel", None):
+        return None
+    channel = EventChannel(handle)
+    return channel if channel.open() else None
+
+
+def wait_for_power_state(handle, server_dn, state, timeout, started=None,
+                         watch=None, max_interval=5):
+    '''
+    Waits until the operPower of server_dn is state or timeout seconds
+    after started passed. Returns as soon as the watch of the event channel
+    reports it and polls every max_interval meanwhile in case the event is
+    lost. Without a watch, or once the channel broke, polls start after
+    POLL_MIN_INTERVAL and grow up to max_interval. Returns (state seen last,
+    seconds since started, number of polls, whether the event ended the
+    wait).
+    '''
+    started = started or time.time()
+    deadline = started + timeout
+    intervals = poll_intervals(POLL_MIN_INTERVAL, max_interval)
+    seen = None
+    polls = 0
+    while True:
+        interval = next(intervals)
+        live = watch is not None and watch["channel"].error is None
+        if live:
+            interval = max_interval
+        poll_at = min(time.time() + interval, deadline)
+        if not live:
+            time.sleep(max(0, poll_at - time.time()))
+        # a channel breaking meanwhile ends the pause early
+        while live:
+            if watch["event"].wait(max(0, min(POLL_MIN_INTERVAL,
+                                              poll_at - time.time()))):
+                return watch["value"], time.time() - started, polls, True
+            if time.time() >= poll_at or watch["channel"].error is not None:
+                break
+        mo = handle.query_dn(server_dn)
+        polls += 1
+        if mo is None:
+            raise ValueError("server %s not found" % server_dn)
+        seen = mo.oper_power
+        if seen == state or time.time() >= deadline:
+            return seen, time.time() - started, polls, False
+
+
+def server_mo(handle, server_id=1):
+    from imcsdk.imccoreutils import get_server_dn
+
+    server_dn = get_server_dn(handle, server_id)
+    mo = handle.query_dn(server_dn)
+    if mo is None:
+        raise ValueError("server %s not found" % server_dn)
+    return mo
+
+
+def power_steps(oper_power, state):
+    return POWER_STEPS.get(state, {}).get(oper_power, [])
+
+
+def set_power_state(handle, state, server_id=1, timeout=60, max_interval=5,
+                    events=True, check_mode=False, mo=None):
+    '''
+    Takes the server to state, one of POWER_STEPS, and waits for every
+    step to end. mo is the server MO when already read. Returns a dict with
+    changed, previous_state, power_state, finished, transition_time (the
+    seconds from the first action until the server was seen in state),
+    transitions (action, state, seconds, polls and event of every step)
+    and events (whether the event channel was used).
+    '''
+    mo = mo or server_mo(handle, server_id)
+    steps = power_steps(mo.oper_power, state)
+    result = dict(changed=bool(steps), previous_state=mo.oper_power,
+                  power_state=mo.oper_power, finished=True,
+                  transition_time=0.0, transitions=[], events=False)
+    if not steps or check_mode:
+        return result
+
+    channel = event_channel(handle) if events else None
+    try:
+        for action, expected in steps:
+            watch = channel.watch(mo.dn, "operPower", [expected]) \
+                if channel else None
+            started = time.time()
+            mo.admin_power = POWER_ACTIONS[action]
+            handle.set_mo(mo)
+            seen, seconds, polls, by_event = wait_for_power_state(
+                handle, mo.dn, expected, timeout, started=started,
+                watch=watch, max_interval=max_interval)
+            if watch is not None:
+                channel.unwatch(watch)
+            result["power_state"] = seen
+            result["transitions"].append(dict(
+                action=action, state=seen, seconds=round(seconds, 3),
+                polls=polls, event=by_event))
+            if seen != expected:
+                result["finished"] = False
+                break
+    finally:
+        if channel is not None:
+            channel.close()
+    result["events"] = channel is not None and channel.error is None
+    result["transition_time"] = round(
+        sum(step["seconds"] for step in result["transitions"]), 3)
+    return result
@@ -0,0 +1,568 @@
+# This file needs to be copied to ansible module_utils
+import operator
+import os
+import re
+from collections import OrderedDict
+
+
+# (mo class, properties) -> (property names, attrgetter of their values)
+_ACCESSORS = {}
+
+
+def mo_accessor(mo_class, properties=None):
+    '''
+    Returns the python property names of mo_class, all of them or the ones
+    in properties (python or XML API names), and a function returning their
+    values of an mo as a tuple. Built once per class and properties.
+    '''
+    if properties is not None:
+        properties = frozenset(properties)
+    key = (mo_class, properties)
+    accessor = _ACCESSORS.get(key)
+    if accessor is not None:
+        return accessor
+
+    names = tuple(mo_property for xml_property, mo_property
+                  in mo_class.prop_map['classic'].items()
+                  if properties is None or mo_property in properties or
+                  xml_property in properties)
+    if len(names) > 1:
+        getter = operator.attrgetter(*names)
+    elif names:
+        single = operator.attrgetter(names[0])
+
+        def getter(mo):
+            return (single(mo),)
+    else:
+        def getter(mo):
+            return ()
+    accessor = _ACCESSORS[key] = (names, getter)
+    return accessor
+
+
+def mo_to_dict(mo, properties=None):
+    '''
+    Returns {property: value} of mo, all properties or the ones in
+    properties. A projection goes through the cached accessor of
+    mo_accessor, the full conversion walks prop_map, which is faster when
+    nothing is left out.
+    '''
+    if properties is None:
+        obj_dict = {}
+        for mo_property in mo.prop_map['classic'].values():
+            obj_dict[mo_property] = getattr(mo, mo_property)
+        return obj_dict
+    names, getter = mo_accessor(mo.__class__, properties)
+    return dict(zip(names, getter(mo)))
+
+
+def make_columnar(obj_dicts, query='class'):
+    '''
+    Returns the dicts of a class query, with their children from a
+    hierarchical one, as {query, columns, rows, values}, every property
+    name once instead of once per object. Properties whose string values
+    repeat keep each of them once in values[name], their rows the index,
+    so the result is smaller both as JSON and in memory. query is 'class',
+    or 'dn' for the one object, or none, of a dn query.
+    '''
+    columns = []
+    seen = set()
+    for obj_dict in obj_dicts:
+        for name in obj_dict:
+            if name not in seen:
+                seen.add(name)
+                columns.append(name)
+
+    values = {}
+    for name in columns:
+        if name == 'children':
+            continue
+        column = [obj_dict.get(name) for obj_dict in obj_dicts]
+        present = [value for value in column if value is not None]
+        if present and all(isinstance(value, str) for value in present) \
+                and len(set(present)) < len(present):
+            values[name] = list(OrderedDict.fromkeys(present))
+
+    indexes = dict((name, dict((value, index)
+                               for index, value in enumerate(distinct)))
+                   for name, distinct in values.items())
+    rows = []
+    for obj_dict in obj_dicts:
+        row = []
+        for name in columns:
+            value = obj_dict.get(name)
+            if name == 'children' and value is not None:
+                value = dict((class_id, make_columnar(children))
+                             for class_id, children in value.items())
+            elif name in indexes and value is not None:
+                value = indexes[name][value]
+            row.append(value)
+        rows.append(row)
+    return dict(query=query, columns=columns, rows=rows, values=values)
+
+
+def iter_resolved(resolver, keys, concurrency=1):
+    '''
+    Yields (key, resolver(key)) for every distinct key, in input order, as
+    the results come in, so a caller that does not keep them holds only
+    the ones still being resolved.
+    '''
+    keys = list(OrderedDict.fromkeys(keys))
+    if concurrency <= 1 or len(keys) <= 1:
+        for key in keys:
+            yield key, resolver(key)
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(keys))) as pool:
+        for key, result in zip(keys, pool.map(resolver, keys)):
+            yield key, result
+
+
+def resolve_many(resolver, keys, concurrency=1):
+    '''
+    Runs resolver(key) for every distinct key and returns the results in an
+    OrderedDict keyed like the input.
+
+    The IMC XML API has no multi class or multi dn resolve method, every
+    class or dn costs one configResolveClass/configResolveDn request. With
+    concurrency > 1 those requests go out in parallel over the same session
+    instead of one after the other.
+    '''
+    return OrderedDict(iter_resolved(resolver, keys, concurrency))
+
+
+# filter operators, compared with one property or combining filters
+FILTER_COMPARISONS = {"eq": "EqFilter", "ne": "NeFilter", "gt": "GtFilter",
+                      "wcard": "WcardFilter"}
+FILTER_COMBINATIONS = {"and": "AndFilter", "or": "OrFilter"}
+
+
+def validate_filter(expression):
+    '''
+    Raises ValueError when expression is not a filter. A filter is a dict of
+    operators, eq/ne/gt/wcard take {property: value, ...} and and/or a list
+    of filters, several keys of one dict are and-ed:
+
+        {"or": [{"eq": {"pdStatus": "Unconfigured Good"}},
+                {"wcard": {"model": "^ST"}}]}
+    '''
+    if not isinstance(expression, dict) or not expression:
+        raise ValueError("filter must be a non empty dict, got %r"
+                         % (expression,))
+    for operator, operand in expression.items():
+        if operator in FILTER_COMPARISONS:
+            if not isinstance(operand, dict) or not operand:
+                raise ValueError("%s takes a dict of property: value"
+                                 % operator)
+            if operator == "wcard":
+                for pattern in operand.values():
+                    try:
+                        re.compile(str(pattern))
+                    except re.error as e:
+                        raise ValueError("wcard %r: %s" % (pattern, e))
+        elif operator in FILTER_COMBINATIONS:
+            if not isinstance(operand, list) or not operand:
+                raise ValueError("%s takes a list of filters" % operator)
+            for sub_expression in operand:
+                validate_filter(sub_expression)
+        else:
+            raise ValueError("unknown filter operator %s, expected one of %s"
+                             % (operator, ", ".join(
+                                 sorted(FILTER_COMPARISONS) +
+                                 sorted(FILTER_COMBINATIONS))))
+
+
+def _xml_property(mo_class, prop):
+    prop_map = mo_class.prop_map["classic"]
+    if prop in prop_map:
+        return prop
+    for xml_prop, mo_prop in prop_map.items():
+        if mo_prop == prop:
+            return xml_prop
+    raise ValueError("%s has no property %s" % (mo_class.__name__, prop))
+
+
+def _combine(filter_name, filters):
+    from imcsdk.imcfilter import create_basic_filter
+
+    if len(filters) == 1:
+        return filters[0]
+    combined = create_basic_filter(filter_name)
+    for sub_filter in filters:
+        combined.child_add(sub_filter)
+    return combined
+
+
+def compile_filter(class_id, expression):
+    '''
+    Returns the imcsdk filter object of expression for class_id, property
+    names may be python (pd_status) or XML API (pdStatus) names. Raises
+    ValueError for an unknown class or property.
+    '''
+    from imcsdk.imccoreutils import find_class_id_in_mo_meta_ignore_case, \
+        load_class
+    from imcsdk.imcfilter import create_basic_filter
+    from imcsdk.imcgenutils import word_l
+
+    meta_class_id = find_class_id_in_mo_meta_ignore_case(class_id)
+    if meta_class_id is None:
+        raise ValueError("unknown class %s" % class_id)
+    mo_class = load_class(meta_class_id)
+
+    def build(expression):
+        filters = []
+        for operator, operand in expression.items():
+            if operator in FILTER_COMBINATIONS:
+                filters.append(_combine(FILTER_COMBINATIONS[operator],
+                                        [build(e) for e in operand]))
+                continue
+            for prop, value in operand.items():
+                filters.append(create_basic_filter(
+                    FILTER_COMPARISONS[operator],
+                    class_=word_l(meta_class_id),
+                    property=_xml_property(mo_class, prop),
+                    value=str(value)))
+        return _combine("AndFilter", filters)
+    return build(expression)
+
+
+def _mo_value(mo, prop):
+    value = getattr(mo, prop, None)
+    if value is None:
+        value = getattr(mo, mo.prop_map["classic"].get(prop, prop), None)
+    return value
+
+
+def _greater(value, other):
+    try:
+        return float(value) > float(other)
+    except ValueError:
+        return value > other
+
+
+def match_filter(mo, expression):
+    '''
+    Evaluates expression against mo locally, the same way the IMC applies
+    an inFilter. A property mo does not have only matches ne.
+    '''
+    for operator, operand in expression.items():
+        if operator == "and":
+            matched = all(match_filter(mo, e) for e in operand)
+        elif operator == "or":
+            matched = any(match_filter(mo, e) for e in operand)
+        else:
+            matched = True
+            for prop, expected in operand.items():
+                value = _mo_value(mo, prop)
+                expected = str(expected)
+                if operator == "ne":
+                    matched = value is None or str(value) != expected
+                elif value is None:
+                    matched = False
+                elif operator == "eq":
+                    matched = str(value) == expected
+                elif operator == "gt":
+                    matched = _greater(str(value), expected)
+                else:
+                    matched = re.search(expected, str(value)) is not None
+                if not matched:
+                    break
+        if not matched:
+            return False
+    return True
+
+
+def query_class_filtered(handle, class_id, expression, hierarchy=False):
+    '''
+    Returns the mos of class_id matching expression, asking the IMC to
+    filter them with an inFilter. Firmware without inFilter support
+    answers with an error or ignores it, either way the mos are evaluated
+    locally again, after a plain class query in the first case. Raises
+    ValueError for a class or property imcsdk does not know, see
+    compile_filter.
+    '''
+    from imcsdk.imcbasetype import FilterFilter
+    from imcsdk.imcexception import ImcException
+    from imcsdk.imcmethodfactory import config_resolve_class
+
+    in_filter = compile_filter(class_id, expression)
+
+    mos = None
+    elem = config_resolve_class(cookie=handle.cookie, class_id=class_id,
+                                in_hierarchical=hierarchy)
+    filter_filter = FilterFilter()
+    filter_filter.child_add(in_filter)
+    filter_filter.to_xml(xml_doc=elem, elem_name="inFilter")
+    try:
+        response = handle.post_elem(elem)
+        if response.error_code == 0:
+            mos = list(response.out_configs.child)
+    except ImcException:
+        pass
+
+    if mos is None:
+        response = handle.query_classid(class_id, hierarchy=hierarchy,
+                                        need_response=True)
+        mos = list(response.out_configs.child)
+    return [mo for mo in mos if match_filter(mo, expression)]
+
+
+def resolve_classes(handle, class_ids, hierarchy=False, concurrency=1,
+                    class_filter=None, stream=False):
+    '''
+    Returns {class_id: [mo, ...]} for every class in class_ids. With
+    hierarchy every mo comes with its subtree in mo.child, from the same
+    request. With class_filter only the mos matching it are returned, see
+    validate_filter. stream returns an iterator of (class_id, [mo, ...])
+    instead, see iter_resolved.
+    '''
+    def resolver(class_id):
+        if class_filter:
+            return query_class_filtered(handle, class_id, class_filter,
+                                        hierarchy)
+        if hierarchy:
+            # query_classid would flatten the subtrees into one list
+            response = handle.query_classid(class_id, hierarchy=True,
+                                            need_response=True)
+            return list(response.out_configs.child)
+        return handle.query_classid(class_id) or []
+    if stream:
+        return iter_resolved(resolver, class_ids, concurrency)
+    return resolve_many(resolver, class_ids, concurrency)
+
+
+def resolve_dns(handle, dns, hierarchy=False, concurrency=1, stream=False):
+    '''
+    Returns {dn: mo or None} for every dn in dns, with the subtree in
+    mo.child when hierarchy is set, or an iterator of (dn, mo or None) with
+    stream.
+    '''
+    def resolver(dn):
+        if hierarchy:
+            response = handle.query_dn(dn, hierarchy=True, need_response=True)
+            children = response.out_config.child
+            return children[0] if children else None
+        return handle.query_dn(dn)
+    if stream:
+        return iter_resolved(resolver, dns, concurrency)
+    return resolve_many(resolver, dns, concurrency)
+
+
+def open_output(output_file):
+    '''
+    Returns a temporary file next to output_file, gzip compressed for a .gz
+    name, and its path, for the caller to move into place once complete.
+    '''
+    import gzip
+    import os
+    import tempfile
+
+    directory = os.path.dirname(os.path.abspath(output_file))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.cisco_imc-')
+    os.close(fd)
+    if output_file.endswith('.gz'):
+        return gzip.open(tmp_path, 'wb'), tmp_path
+    return open(tmp_path, 'wb'), tmp_path
+
+
+# XML API methods whose responses are cached, and the ones that invalidate
+QUERY_METHODS = ("configResolveDn", "configResolveClass",
+                 "configResolveChildren")
+WRITE_METHODS = ("configConfMo", "configConfMos")
+
+QUERY_CACHE_TTL = 300
+
+# classes whose state changes on its own are only cached briefly, 0 is never
+QUERY_CACHE_CLASS_TTLS = {
+    "computerackunit": 30,
+    "computeservernode": 30,
+    "faultinst": 30,
+    "storageoperation": 0,
+    "storagevirtualdrive": 60,
+    "storagelocaldisk": 60,
+    "equipmentpsu": 60,
+    "processorenvstats": 0,
+    "computerackunitmbtempstats": 0,
+    "equipmentpsustats": 0,
+}
+
+
+class QueryCacheMiss(Exception):
+    pass
+
+
+def _related(dn, other):
+    return dn == other or dn.startswith(other + "/") or \
+        other.startswith(dn + "/")
+
+
+def _response_mos(root):
+    mos = []
+    for out in root:
+        if out.tag in ("outConfig", "outConfigs"):
+            mos.extend(out)
+    return mos
+
+
+class QueryCache(object):
+    '''
+    Caches the configResolve* responses of one server in an ImcFileCache
+    and drops the affected ones whenever a configConfMo(s) goes out.
+
+    mode is bypass (only invalidate), prefer (serve and store) or only
+    (serve, never send a query to the server). server_caches are the caches
+    of the other users of the server, a write drops their affected
+    responses as well.
+    '''
+
+    def __init__(self, cache, mode="bypass", ttl=None, class_ttls=None,
+                 server_caches=None):
+        self.cache = cache
+        self.server_caches = [cache] + [
+            other for other in server_caches or []
+            if os.path.realpath(other.path) != os.path.realpath(cache.path)]
+        self.mode = mode
+        self.ttl = QUERY_CACHE_TTL if ttl is None else ttl
+        self.class_ttls = dict(QUERY_CACHE_CLASS_TTLS)
+        self.class_ttls.update((k.lower(), v)
+                               for k, v in (class_ttls or {}).items())
+
+    def _ttl(self, classes):
+        return min([self.ttl] + [self.class_ttls.get(c.lower(), self.ttl)
+                                 for c in classes])
+
+    @staticmethod
+    def _query(root):
+        import xml.etree.ElementTree as ET
+
+        hierarchical = root.attrib.get("inHierarchical", "false").lower() \
+            in ("true", "yes")
+        target = root.attrib.get("dn") or root.attrib.get("inDn") or ""
+        class_id = root.attrib.get("classId") or ""
+        key = "%s|%s|%s|%s" % (root.tag, target, class_id, hierarchical)
+        for in_filter in root.findall("inFilter"):
+            key += "|" + ET.tostring(in_filter).decode("utf-8")
+        return key, target, class_id, hierarchical
+
+    def lookup(self, root):
+        key = self._query(root)[0]
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        return entry["response"]
+
+    def store(self, root, response):
+        import xml.etree.ElementTree as ET
+
+        key, target, class_id, hierarchical = self._query(root)
+        try:
+            response_root = ET.fromstring(response)
+        except ET.ParseError:
+            return
+        if response_root.tag == "error" or \
+                response_root.attrib.get("errorCode"):
+            return
+        mos = _response_mos(response_root)
+        classes = [mo.tag for mo in mos] + ([class_id] if class_id else [])
+        ttl = self._ttl(classes)
+        if ttl <= 0:
+            return
+        if isinstance(response, bytes):
+            response = response.decode("utf-8")
+        self.cache.set(key, dict(response=response,
+                                 target=target,
+                                 class_id=class_id.lower(),
+                                 hierarchical=hierarchical,
+                                 dns=[mo.attrib.get("dn") for mo in mos
+                                      if mo.attrib.get("dn")]),
+                       ttl=ttl)
+
+    def invalidate(self, root):
+        written = []
+        for config in root:
+            if config.tag == "inConfig":
+                written.extend(config)
+            elif config.tag == "inConfigs":
+                for pair in config:
+                    written.extend(pair)
+        written = [(mo.tag.lower(), mo.attrib.get("dn") or
+                    root.attrib.get("dn") or "") for mo in written]
+
+        def stale(key, entry):
+            if key == "server":
+                # the session kept by remember_server
+                return False
+            for class_id, dn in written:
+                if entry["class_id"] == class_id:
+                    return True
+                if entry["target"] and _related(dn, entry["target"]):
+                    return True
+                for cached_dn in entry["dns"]:
+                    if _related(dn, cached_dn) if entry["hierarchical"] \
+                            else dn == cached_dn:
+                        return True
+            return False
+        for cache in self.server_caches:
+            cache.delete_matching(stale)
+
+    def remember_server(self, handle):
+        '''
+        Keeps what cache only mode needs to build a handle without login.
+        '''
+        from ansible.module_utils.cisco_imc import session_info
+
+        info = session_info(handle)
+        info["cookie"] = None
+        self.cache.set("server", info)
+
+    def restore_server(self, handle):
+        from ansible.module_utils.cisco_imc import restore_session
+
+        info = self.cache.get("server")
+        if info is None:
+            raise QueryCacheMiss("nothing cached for %s, run with cache: "
+                                 "prefer first" % handle.ip)
+        return restore_session(handle, info)
+
+    def install(self, handle):
+        '''
+        Wraps handle.post_xml with the cache.
+        '''
+        import xml.etree.ElementTree as ET
+
+        post_xml = handle.post_xml
+        cache = self
+
+        def cached_post_xml(xml_str, read=True, timeout=None):
+            try:
+                root = ET.fromstring(xml_str)
+            except ET.ParseError:
+                root = None
+            if root is None or not read:
+                return post_xml(xml_str, read=read, timeout=timeout)
+
+            if root.tag in QUERY_METHODS and cache.mode != "bypass":
+                response = cache.lookup(root)
+                if response is not None:
+                    return response
+                if cache.mode == "only":
+                    raise QueryCacheMiss("%s of %s is not cached" % (
+                        root.tag, root.attrib.get("dn") or
+                        root.attrib.get("inDn") or
+                        root.attrib.get("classId")))
+                response = post_xml(xml_str, read=read, timeout=timeout)
+                cache.store(root, response)
+                return response
+
+            if cache.mode == "only":
+                raise QueryCacheMiss("%s is not sent in cache only mode"
+                                     % root.tag)
+            try:
+                return post_xml(xml_str, read=read, timeout=timeout)
+            finally:
+                if root.tag in WRITE_METHODS:
+                    cache.invalidate(root)
+
+        handle.post_xml = cached_post_xml
+        return handle
@@ -0,0 +1,550 @@
+# This file needs to be copied to ansible module_utils
+import re
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+# disks a physical drive has to be in to be part of a new virtual drive
+UNUSED_DRIVE_STATE = "Unconfigured Good"
+
+# smallest number of disks per span of every RAID level
+RAID_SPAN_DRIVES = {0: 1, 1: 2, 5: 3, 6: 3, 10: 2, 50: 3, 60: 3}
+
+# RAID levels spanning several drive groups, the others take exactly one
+SPANNED_RAID_LEVELS = (10, 50, 60)
+MAX_SPANS = 8
+
+# lropInProgress of a storageOperation still running
+OPERATION_RUNNING = ("true", "yes")
+
+# options of a virtual drive, the task level value is the default of every
+# entry of virtual_drives
+VD_OPTIONS = ["drive_group", "raid_level", "virtual_drive_name", "state",
+              "boot_drive", "size", "access_policy", "read_policy",
+              "cache_policy", "disk_cache_policy", "write_policy",
+              "strip_size", "admin_action", "capacity", "drive_count",
+              "media_type"]
+
+# options of plan_drive_group, a virtual drive without drive_group is
+# planned from them
+PLANNER_OPTIONS = ["raid_level", "capacity", "drive_count", "media_type"]
+
+# powers of 1024 of the size units, the ones imcsdk takes
+SIZE_UNITS = {"KB": 1, "MB": 2, "GB": 3, "TB": 4, "PB": 5, "EB": 6,
+              "ZB": 7, "YB": 8}
+SIZE_PATTERN = re.compile(r"^\s*(\d+(?:\.\d*)?|\.\d+)\s*([a-z]b)\s*$", re.I)
+
+
+class ControllerSnapshot(object):
+    '''
+    The physical and virtual drives of one storage controller, read with a
+    single hierarchical query, everything the plan is validated against.
+    '''
+
+    def __init__(self, handle, controller_type, controller_slot, server_id=1):
+        from imcsdk.apis.server.storage import _get_controller_dn
+
+        self.dn = _get_controller_dn(handle, controller_type,
+                                     controller_slot, server_id)
+        # slot: storageLocalDisk
+        self.disks = {}
+        # name: storageVirtualDrive
+        self.virtual_drives = OrderedDict()
+        # virtual drive dn: [slot, ...]
+        self.vd_disks = {}
+
+        mos = handle.query_dn(self.dn, hierarchy=True) or []
+        if not mos:
+            raise ValueError("storage controller %s not found" % self.dn)
+        for mo in mos:
+            class_id = mo.get_class_id()
+            if class_id == "StorageLocalDisk":
+                self.disks[int(mo.id)] = mo
+            elif class_id == "StorageVirtualDrive":
+                self.virtual_drives[mo.name] = mo
+            elif class_id == "StorageLocalDiskUsage":
+                vd_dn = mo.dn.rsplit("/", 1)[0]
+                self.vd_disks.setdefault(vd_dn, []).append(
+                    int(mo.physical_drive))
+
+    def unused(self, slot):
+        disk = self.disks.get(slot)
+        return disk is not None and disk.pd_status == UNUSED_DRIVE_STATE
+
+    def unused_slots(self):
+        return set(slot for slot in self.disks if self.unused(slot))
+
+
+def vd_entry(entry, defaults):
+    '''
+    Returns one entry of virtual_drives with the task level values filled
+    in and drive_group and raid_level normalized.
+    '''
+    unknown = set(entry) - set(VD_OPTIONS)
+    if unknown:
+        raise ValueError("unknown virtual drive options: %s"
+                         % ", ".join(sorted(unknown)))
+    vd = dict((option, entry.get(option, defaults.get(option)))
+              for option in VD_OPTIONS)
+    vd["raid_level"] = int(vd["raid_level"] or 0)
+    if vd["drive_count"] is not None:
+        vd["drive_count"] = int(vd["drive_count"])
+    if vd["drive_group"] is not None:
+        try:
+            vd["drive_group"] = [[int(slot) for slot in span]
+                                 for span in vd["drive_group"]]
+        except (TypeError, ValueError):
+            raise ValueError("drive_group needs a list of lists of slots, "
+                             "i.e. [[1,2],[3,4]], not %s" % vd["drive_group"])
+    if vd["virtual_drive_name"] is None and vd["drive_group"]:
+        from imcsdk.apis.server.storage import vd_name_derive
+        vd["virtual_drive_name"] = vd_name_derive(vd["raid_level"],
+                                                  vd["drive_group"])
+    return vd
+
+
+def _layout_errors(vd):
+    raid_level = vd["raid_level"]
+    drive_group = vd["drive_group"]
+    if raid_level not in RAID_SPAN_DRIVES:
+        return ["unsupported RAID level %s" % raid_level]
+    if not drive_group or not all(drive_group):
+        return ["drive_group needs a list of lists of slots, i.e. [[1,2]]"]
+
+    errors = []
+    spans = len(drive_group)
+    if raid_level in SPANNED_RAID_LEVELS:
+        if not 2 <= spans <= MAX_SPANS:
+            errors.append("RAID %d needs 2 to %d drive groups, not %d"
+                          % (raid_level, MAX_SPANS, spans))
+        if len(set(len(span) for span in drive_group)) > 1:
+            errors.append("RAID %d needs the same number of drives in "
+                          "every drive group" % raid_level)
+    elif spans != 1:
+        errors.append("RAID %d takes a single drive group, not %d"
+                      % (raid_level, spans))
+    for span in drive_group:
+        if len(span) < RAID_SPAN_DRIVES[raid_level]:
+            errors.append("RAID %d needs at least %d drives per drive group"
+                          % (raid_level, RAID_SPAN_DRIVES[raid_level]))
+            break
+        if raid_level in (1, 10) and len(span) % 2:
+            errors.append("RAID %d needs an even number of drives per drive "
+                          "group" % raid_level)
+            break
+    return errors
+
+
+def max_vd_size(snapshot, drive_group, raid_level):
+    '''
+    Returns the largest size of a virtual drive in MB, the one imcsdk's
+    virtual_drive_create computes with a query per drive, from the
+    coerced sizes of the snapshot.
+    '''
+    from imcsdk.apis.server.storage import _human_to_bytes, _raid_max_size_get
+
+    sizes = [_human_to_bytes(snapshot.disks[slot].coerced_size)
+             for span in drive_group for slot in span]
+    return _raid_max_size_get(raid_level, sum(sizes), min(sizes),
+                              len(drive_group)) >> 20
+
+
+def drive_pools(snapshot, slots, media_type=None):
+    '''
+    Returns {(size in bytes, link speed, media type): [slot, ...]} of the
+    drives in slots, the drives of one pool make a virtual drive without
+    wasted space or a slow member.
+    '''
+    from imcsdk.apis.server.storage import _human_to_bytes
+
+    pools = {}
+    for slot in sorted(slots):
+        disk = snapshot.disks[slot]
+        if media_type and (disk.media_type or "").upper() != media_type.upper():
+            continue
+        key = (_human_to_bytes(disk.coerced_size), disk.link_speed,
+               disk.media_type)
+        pools.setdefault(key, []).append(slot)
+    return pools
+
+
+def parse_size(size):
+    '''
+    Returns the bytes of a size like "2 TB", with the units of imcsdk's
+    _human_to_bytes but also a decimal number, "1.5 TB", and with or
+    without the space. Raises ValueError for anything else.
+    '''
+    match = SIZE_PATTERN.match(str(size))
+    if match is None or match.group(2).upper() not in SIZE_UNITS:
+        raise ValueError("invalid size %s, expected i.e. '1.5 TB'" % size)
+    number, unit = match.groups()
+    return int(Decimal(number) * (1 << 10 * SIZE_UNITS[unit.upper()]))
+
+
+def span_layouts(raid_level, count):
+    '''
+    Returns the (spans, drives per span) count drives can be laid out as for
+    raid_level, fewest spans, the most capacity, first.
+    '''
+    if raid_level in SPANNED_RAID_LEVELS:
+        layouts = [(spans, count // spans)
+                   for spans in range(2, MAX_SPANS + 1) if count % spans == 0]
+    else:
+        layouts = [(1, count)]
+    return [(spans, drives) for spans, drives in layouts
+            if drives >= RAID_SPAN_DRIVES.get(raid_level, 1) and
+            not (raid_level in (1, 10) and drives % 2)]
+
+
+def _describe_pools(pools):
+    if not pools:
+        return "none"
+    return ", ".join("%d x %d MB %s %s" % (len(slots), size >> 20, media, speed)
+                     for (size, speed, media), slots in sorted(pools.items()))
+
+
+def plan_drive_group(snapshot, raid_level, capacity=None, drive_count=None,
+                     media_type=None, slots=None):
+    '''
+    Returns the drive_group of a raid_level virtual drive made of one pool
+    of drive_pools out of slots, the unused drives of snapshot by default:
+    drive_count drives, or the fewest holding capacity (i.e. "1.5 TB"), the
+    smaller drives first so the larger ones are left, or without either
+    every drive of the pool giving the most capacity. The lowest slots of
+    the pool are taken. Raises ValueError when no pool fits.
+    '''
+    from imcsdk.apis.server.storage import _raid_max_size_get
+
+    if raid_level not in RAID_SPAN_DRIVES:
+        raise ValueError("unsupported RAID level %s" % raid_level)
+    target = capacity
+    if capacity is not None:
+        try:
+            capacity = parse_size(capacity)
+        except ValueError:
+            raise ValueError("invalid capacity %s, expected i.e. '1.5 TB'"
+                             % capacity)
+    slots = snapshot.unused_slots() if slots is None else slots
+    pools = drive_pools(snapshot, slots, media_type)
+
+    candidates = []
+    for (size, speed, media), pool in pools.items():
+        counts = [drive_count] if drive_count else \
+            range(len(pool), 0, -1) if capacity is None else \
+            range(1, len(pool) + 1)
+        for count in counts:
+            if count > len(pool):
+                continue
+            layouts = span_layouts(raid_level, count)
+            if not layouts:
+                continue
+            spans, drives = layouts[0]
+            usable = _raid_max_size_get(raid_level, size * count, size, spans)
+            if capacity is not None and usable < capacity:
+                continue
+            candidates.append((count, size, usable, pool, spans, drives))
+            # the fewest drives, or the most without a target, of this pool
+            break
+    if not candidates:
+        raise ValueError("no %sRAID %d%s%s out of the unused drives: %s" % (
+            "%d drive " % drive_count if drive_count else "", raid_level,
+            " of %s" % target if capacity else "",
+            " on %s" % media_type if media_type else "",
+            _describe_pools(drive_pools(snapshot, slots))))
+
+    if capacity is None and not drive_count:
+        count, size, usable, pool, spans, drives = max(
+            candidates, key=lambda each: (each[2], -each[1]))
+    else:
+        count, size, usable, pool, spans, drives = min(
+            candidates, key=lambda each: (each[0], each[1], each[3][0]))
+    chosen = pool[:count]
+    return [chosen[span * drives:(span + 1) * drives] for span in range(spans)]
+
+
+def plan_drive_groups(snapshot, requests):
+    '''
+    Returns a drive_group for every request, a dict of PLANNER_OPTIONS, each
+    out of the unused drives the ones before it left. ValueError lists the
+    requests that do not fit.
+    '''
+    available = snapshot.unused_slots()
+    drive_groups = []
+    errors = []
+    for index, request in enumerate(requests):
+        unknown = set(request) - set(PLANNER_OPTIONS)
+        if unknown:
+            errors.append("drive group %d: unknown options %s"
+                          % (index + 1, ", ".join(sorted(unknown))))
+            continue
+        try:
+            drive_group = plan_drive_group(
+                snapshot, int(request.get("raid_level") or 0),
+                capacity=request.get("capacity"),
+                drive_count=request.get("drive_count"),
+                media_type=request.get("media_type"), slots=available)
+        except ValueError as e:
+            errors.append("drive group %d: %s" % (index + 1, str(e)))
+            continue
+        available -= set(slot for span in drive_group for slot in span)
+        drive_groups.append(drive_group)
+    if errors:
+        raise ValueError("; ".join(errors))
+    return drive_groups
+
+
+def plan_virtual_drives(snapshot, vds):
+    '''
+    Returns the steps bringing the controller of snapshot to the entries of
+    vds, see vd_entry: deletes first, so their drives can be used by the
+    creates that follow, then the creates, then the boot drive. Every
+    entry is validated against the snapshot and the steps before it, and
+    ValueError lists everything that does not fit before anything is
+    written.
+    '''
+    errors = []
+    steps = []
+    freed = set()
+    claimed = {}
+    names = set()
+
+    # the drives of deleted virtual drives are free whatever the order, and
+    # the drive groups given are taken before any is planned
+    absent = [vd for vd in vds if vd["state"] == "absent"]
+    given = [vd for vd in vds if vd["state"] != "absent" and vd["drive_group"]]
+    planned = [vd for vd in vds
+               if vd["state"] != "absent" and not vd["drive_group"]]
+    for vd in absent + given + planned:
+        name = vd["virtual_drive_name"]
+        if name is None:
+            errors.append("virtual_drive_name or drive_group is required")
+            continue
+        if name in names:
+            errors.append("%s: listed more than once" % name)
+            continue
+        names.add(name)
+        existing = snapshot.virtual_drives.get(name)
+        if vd["state"] == "absent":
+            if existing is not None:
+                steps.append(dict(action="delete", name=name, vd=vd))
+                freed.update(snapshot.vd_disks.get(existing.dn, []))
+            continue
+        if existing is not None:
+            continue
+
+        if not vd["drive_group"]:
+            if vd["capacity"] is None and not vd["drive_count"]:
+                # a mistyped name would take every free drive otherwise
+                errors.append("%s: not found, a new virtual drive needs "
+                              "drive_group, capacity or drive_count" % name)
+                continue
+            available = (snapshot.unused_slots() | freed) - set(claimed)
+            try:
+                vd["drive_group"] = plan_drive_group(
+                    snapshot, vd["raid_level"], capacity=vd["capacity"],
+                    drive_count=vd["drive_count"],
+                    media_type=vd["media_type"], slots=available)
+            except ValueError as e:
+                errors.append("%s: %s" % (name, str(e)))
+                continue
+        vd_errors = _layout_errors(vd)
+        for slot in [slot for span in vd["drive_group"] or [] for slot in span]:
+            if slot not in snapshot.disks:
+                vd_errors.append("no physical drive in slot %d" % slot)
+            elif slot in claimed:
+                vd_errors.append("drive %d is already used by %s"
+                                 % (slot, claimed[slot]))
+            elif not (snapshot.unused(slot) or slot in freed):
+                vd_errors.append("drive %d is %s" % (
+                    slot, snapshot.disks[slot].pd_status))
+            else:
+                claimed[slot] = name
+        if not vd_errors:
+            from imcsdk.apis.server.storage import _human_to_bytes
+
+            max_size = max_vd_size(snapshot, vd["drive_group"],
+                                   vd["raid_level"])
+            size = vd["size"] or "%d MB" % max_size
+            try:
+                if _human_to_bytes(size) >> 20 > max_size:
+                    vd_errors.append("size %s is larger than the %d MB the "
+                                     "drives hold" % (size, max_size))
+            except (IndexError, ValueError):
+                vd_errors.append("invalid size %s, expected i.e. '100 GB'"
+                                 % size)
+            try:
+                # imcsdk validates the name and the policies as it builds it
+                creator = _vd_creator(snapshot, vd, size)
+            except Exception as e:
+                vd_errors.append(str(e).strip())
+            else:
+                steps.append(dict(action="create", name=name, vd=vd,
+                                  size=size, mo=creator))
+        errors.extend("%s: %s" % (name, error) for error in vd_errors)
+
+    boot_drives = [vd["virtual_drive_name"] for vd in vds
+                   if vd["boot_drive"] and vd["state"] == "present"]
+    if len(boot_drives) > 1:
+        errors.append("only one boot drive, not %s" % ", ".join(boot_drives))
+    elif boot_drives:
+        existing = snapshot.virtual_drives.get(boot_drives[0])
+        if existing is None or existing.boot_drive != "true":
+            steps.append(dict(action="set-boot-drive", name=boot_drives[0]))
+
+    if errors:
+        raise ValueError("; ".join(errors))
+    return steps
+
+
+def _vd_creator(snapshot, vd, size):
+    from imcsdk.apis.server.storage import _list_to_string
+    from imcsdk.mometa.storage.StorageVirtualDriveCreatorUsingUnusedPhysicalDrive \
+        import StorageVirtualDriveCreatorUsingUnusedPhysicalDrive
+
+    params = dict(parent_mo_or_dn=snapshot.dn,
+                  drive_group=_list_to_string(vd["drive_group"]),
+                  raid_level=str(vd["raid_level"]),
+                  virtual_drive_name=vd["virtual_drive_name"],
+                  access_policy=vd["access_policy"],
+                  read_policy=vd["read_policy"],
+                  cache_policy=vd["cache_policy"],
+                  disk_cache_policy=vd["disk_cache_policy"],
+                  write_policy=vd["write_policy"],
+                  strip_size=vd["strip_size"],
+                  size=size)
+    if vd["admin_action"]:
+        params["admin_action"] = vd["admin_action"]
+    mo = StorageVirtualDriveCreatorUsingUnusedPhysicalDrive(**params)
+    mo.admin_state = "trigger"
+    return mo
+
+
+def _vd_mo(snapshot, vd):
+    # a bare copy, the one of the hierarchical query would send its
+    # children along
+    from imcsdk.mometa.storage.StorageVirtualDrive import StorageVirtualDrive
+    return StorageVirtualDrive(parent_mo_or_dn=snapshot.dn, id=vd.id)
+
+
+def apply_plan(handle, snapshot, steps):
+    '''
+    Runs the steps of plan_virtual_drives over handle, one request each,
+    plus one to look up the virtual drives created when one of them becomes
+    the boot drive.
+    '''
+    created = False
+    for step in steps:
+        if step["action"] == "delete":
+            handle.remove_mo(_vd_mo(snapshot,
+                                    snapshot.virtual_drives[step["name"]]))
+        elif step["action"] == "create":
+            # the creator always exists, add_mo would look it up first to
+            # end up modifying it all the same
+            handle.set_mo(step["mo"])
+            created = True
+        else:
+            vd = snapshot.virtual_drives.get(step["name"])
+            if vd is None or created:
+                vds = handle.query_children(in_dn=snapshot.dn,
+                                            class_id="storageVirtualDrive")
+                vd = dict((mo.name, mo) for mo in vds).get(step["name"])
+                if vd is None:
+                    raise ValueError("virtual drive %s not found after "
+                                     "creating it" % step["name"])
+            vd = _vd_mo(snapshot, vd)
+            vd.admin_action = "set-boot-drive"
+            handle.set_mo(vd)
+
+
+def storage_job(handle, snapshot, steps):
+    '''
+    Returns the job handle cisco_imc_storage_job polls, the dn the IMC gave
+    every virtual drive created by steps, looked up with one query.
+    '''
+    names = set(step["name"] for step in steps if step["action"] == "create")
+    vds = handle.query_children(in_dn=snapshot.dn,
+                                class_id="storageVirtualDrive") if names else []
+    return dict(ip=handle.ip, controller=snapshot.dn, started=time.time(),
+                virtual_drives=dict((mo.name, mo.dn) for mo in vds
+                                    if mo.name in names))
+
+
+def _int(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def job_operations(handle, job):
+    '''
+    Returns the state of the long running operation of every virtual drive
+    of job, read with a single storageOperation class query whatever the
+    number of drives. A drive without a running operation is done.
+    '''
+    operations = dict((mo.dn.rsplit("/", 1)[0], mo)
+                      for mo in handle.query_classid("storageOperation") or [])
+    states = []
+    for name, dn in sorted(job["virtual_drives"].items()):
+        mo = operations.get(dn)
+        running = mo is not None and \
+            (mo.lrop_in_progress or "").lower() in OPERATION_RUNNING
+        state = dict(name=name, dn=dn, in_progress=running, operation=None,
+                     progress=100, elapsed=None, remaining=0)
+        if running:
+            progress = _int(mo.progress_percent) or 0
+            elapsed = _int(mo.elapsed_seconds)
+            remaining = _int(getattr(mo, "estimated_seconds_remaining", None))
+            if not remaining and elapsed and progress:
+                # firmware before 4.0 has no estimate, extrapolate
+                remaining = elapsed * (100 - progress) // progress
+            state.update(operation=mo.current_lrop, progress=progress,
+                         elapsed=elapsed, remaining=remaining)
+        states.append(state)
+    return states
+
+
+def job_progress(states):
+    '''
+    Returns the progress in percent of the whole job, the mean of its
+    virtual drives.
+    '''
+    if not states:
+        return 100
+    return sum(state["progress"] for state in states) // len(states)
+
+
+def next_poll_interval(interval, states, min_interval, max_interval):
+    '''
+    Returns the seconds to wait before the next poll: half the longest
+    remaining time the IMC estimates, the job is done when that operation
+    is, so polls get closer as the end nears, or without an estimate the
+    last interval grown by half, between min_interval and max_interval.
+    '''
+    remaining = [state["remaining"] for state in states
+                 if state["in_progress"] and state["remaining"]]
+    if remaining:
+        interval = max(remaining) / 2.0
+    else:
+        interval = interval * 1.5
+    return max(min_interval, min(max_interval, interval))
+
+
+def poll_storage_job(handle, job, timeout, min_interval=5, max_interval=60):
+    '''
+    Polls the operations of job until none is in progress or timeout
+    seconds passed and returns (finished, states, polls).
+    '''
+    deadline = time.time() + timeout
+    interval = min_interval
+    polls = 0
+    while True:
+        states = job_operations(handle, job)
+        polls += 1
+        finished = not any(state["in_progress"] for state in states)
+        now = time.time()
+        if finished or now >= deadline:
+            return finished, states, polls
+        interval = next_poll_interval(interval, states, min_interval,
+                                      max_interval)
+        time.sleep(min(interval, deadline - now))